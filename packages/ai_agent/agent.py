@@ -59,12 +59,49 @@ def transform_strategy_for_backend(strategy: dict, token_address: str) -> dict:
     }
 
 
+def apply_uncertainty_policy(strategy: dict, last_allocations: dict, max_allocation_std: float):
+    """
+    根据 MC dropout 给出的配比标准差决定本轮怎么调仓:
+        - 策略没有 uncertainty 信息: 按模型配比全额调仓
+        - 标准差超过 max_allocation_std: 模型对本次预测没有把握, 返回 None 表示跳过本轮
+        - 否则按 (1 - std / max_allocation_std) 的比例从上一次的配比向新配比移动, 越不确定移动越少
+    """
+    target = strategy['allocations']
+    uncertainty = strategy.get('uncertainty')
+    if not uncertainty:
+        return target
+
+    allocation_std = uncertainty['allocation_std']
+    if allocation_std > max_allocation_std:
+        return None
+    if not last_allocations:
+        return target
+
+    step = 1.0 - allocation_std / max_allocation_std
+    return {key: last_allocations.get(key, value) + step * (value - last_allocations.get(key, value))
+            for key, value in target.items()}
+
+
+def _wait_for_next_cycle():
+    sleep_duration_seconds = 60  # 休眠60秒，即1分钟
+    logging.info(f"Cycle finished. Sleeping for {sleep_duration_seconds} seconds...")
+    logging.info("="*50 + "\n")
+    time.sleep(sleep_duration_seconds)
+    # sleep_duration_hours = 1
+    # logging.info(f"Cycle finished. Sleeping for {sleep_duration_hours} hour(s)...")
+    # logging.info("="*50 + "\n")
+    # time.sleep(sleep_duration_hours * 3600)
+
+
 def main_loop():
     """Agent的主循环"""
     load_dotenv()
     BACKEND_URL = os.getenv("BACKEND_API_URL")
     TOKEN_ADDRESS = os.getenv("TOKEN_ADDRESS")
     THE_GRAPH_API_KEY = os.getenv("THE_GRAPH_API_KEY")
+    # 预测配比的 MC dropout 标准差超过该值时跳过本轮调仓 (需要设置 STRATEGY_MC_SAMPLES 才会有不确定性信息)
+    MAX_ALLOCATION_STD = float(os.getenv("AGENT_MAX_ALLOCATION_STD", 0.1))
+    last_allocations = None
 
     db = DatabaseManager()
     logger.info("✅ Database manager initialized")
@@ -88,6 +125,17 @@ def main_loop():
             ai_strategy = get_latest_strategy(POOL_SYMBOL, POOL_CONFIG, api_key=THE_GRAPH_API_KEY)
             logging.info(f"AI Recommended Allocations: Aave WBTC={ai_strategy['allocations']['aave_wbtc_pool']:.2%}, UniV3 LP={ai_strategy['allocations']['uniswap_v3_lp']:.2%}")
 
+            allocations = apply_uncertainty_policy(ai_strategy, last_allocations, MAX_ALLOCATION_STD)
+            if allocations is None:
+                logging.warning(f"Prediction too uncertain (allocation std {ai_strategy['uncertainty']['allocation_std']:.3f} "
+                                f"> {MAX_ALLOCATION_STD}). Skipping this rebalance.")
+                _wait_for_next_cycle()
+                continue
+            if allocations is not ai_strategy['allocations']:
+                logging.info(f"Uncertainty-sized allocations: Aave WBTC={allocations['aave_wbtc_pool']:.2%}, "
+                             f"UniV3 LP={allocations['uniswap_v3_lp']:.2%}")
+                ai_strategy['allocations'] = allocations
+
             # 2. 将策略转换为后端需要的格式
             logging.info("Step 2: Transforming strategy for backend API...")
             backend_payload = transform_strategy_for_backend(ai_strategy, TOKEN_ADDRESS)
@@ -103,6 +151,7 @@ def main_loop():
             response_data = response.json()
             tx_hash = response_data.get("result", {}).get("tx_hash")
             logging.info(f"✅ Strategy update successfully sent! Transaction Hash: {tx_hash}")
+            last_allocations = ai_strategy['allocations']
 
             if tx_hash:
                 try:
@@ -116,7 +165,8 @@ def main_loop():
                         'safety_bounds': ai_strategy.get('safety_bounds'),
                         'additional_info': {
                             'backend_response': response_data,
-                            'prediction_generated_at': ai_strategy.get('prediction_generated_at')
+                            'prediction_generated_at': ai_strategy.get('prediction_generated_at'),
+                            'uncertainty': ai_strategy.get('uncertainty')
                         }
                     }
                     
@@ -132,14 +182,7 @@ def main_loop():
             logging.error(f"🚨 An unexpected error occurred in the agent loop: {e}", exc_info=True)
 
         # 等待下一个周期
-        sleep_duration_seconds = 60  # 休眠60秒，即1分钟
-        logging.info(f"Cycle finished. Sleeping for {sleep_duration_seconds} seconds...")
-        logging.info("="*50 + "\n")
-        time.sleep(sleep_duration_seconds)
-        # sleep_duration_hours = 1
-        # logging.info(f"Cycle finished. Sleeping for {sleep_duration_hours} hour(s)...")
-        # logging.info("="*50 + "\n")
-        # time.sleep(sleep_duration_hours * 3600)
+        _wait_for_next_cycle()
 
 
 if __name__ == "__main__":
@@ -1,75 +1,42 @@
 # 使用LSTM+attention训练,采用滑动窗口构建训练样本,输入为72小时的特征向量序列(28维)
 
 import numpy as np
-import pandas as pd
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
-from sklearn.preprocessing import StandardScaler
+from torch.utils.data import Dataset
+import copy
 import json
 import os
-from typing import Dict, List, Tuple
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 import logging
 from datetime import datetime
 
+# 特征工程已移至 features.py (推理端不必导入训练代码), 这里保留导出以兼容旧的导入方式
+from features import FEATURE_NAMES, create_feature_sequences_from_snapshots
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_feature_sequences_from_snapshots(snapshots: List[Dict], aave_reserves: List[Dict], gas_data: Dict) -> List[Dict]:
-    if not snapshots: return []
-        
-    df = pd.DataFrame(snapshots)
-    numeric_cols = ['token0Price', 'volumeUSD', 'liquidity', 'tvlUSD']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    df['timestamp'] = pd.to_datetime(df['periodStartUnix'], unit='s')
-    df = df.sort_values('timestamp').ffill().fillna(0)
-
-    df['price_ma_24'] = df['token0Price'].rolling(24, min_periods=1).mean()
-    df['price_return_1h'] = df['token0Price'].pct_change(1).fillna(0)
-    df['price_volatility_24h'] = df['price_return_1h'].rolling(24, min_periods=1).std().fillna(0)
-    df['volume_ma_24'] = df['volumeUSD'].rolling(24, min_periods=1).mean()
-    df['tvl_change_24h'] = df['tvlUSD'].pct_change(24).fillna(0)
-
-    # usdc_apy = 3.5
-    wbtc_apy = 0.1 
-    for reserve in aave_reserves:
-        # if reserve['symbol'] == 'USDC':
-        if reserve['symbol'] == 'WBTC':
-            usdc_apy = (float(reserve.get('liquidityRate', 0)) / 1e27) * 100
-            logger.info(f"USDC APY from AAVE: {usdc_apy:.2f}%")
-            break
-
-    feature_sequences = []
-    for _, row in df.iterrows():
-        feature_vector = [
-            row['token0Price'], row['price_ma_24'], row['price_return_1h'], row['price_volatility_24h'],
-            row['volumeUSD'], row['volume_ma_24'],
-            row['liquidity'], row['tvlUSD'], row['tvl_change_24h'],
-            wbtc_apy, 
-            gas_data.get('base_fee_gwei', 0.001),
-            np.sin(2 * np.pi * row['timestamp'].hour / 24)
-        ]
-        padding = [0] * (28 - len(feature_vector))
-        feature_vector.extend(padding)
-
-        feature_sequences.append({
-            'timestamp': row['timestamp'].isoformat(),
-            'price_current': row['token0Price'],
-            'feature_vector': feature_vector
-        })
-    return feature_sequences
 
 # 使用滑动窗口,从连续的时间序列数据中创建离散的训练数据
 class WeeklyStrategyDataset(Dataset):
-    def __init__(self, feature_sequences: List[Dict], lookback_hours: int, prediction_hours: int, stride: int):
-        self.features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
+    def __init__(self, feature_sequences, lookback_hours: int, prediction_hours: int, stride: int):
+        # 既接受 create_feature_sequences_from_snapshots 的输出, 也接受已经构建好的 (T, D) 特征矩阵
+        if isinstance(feature_sequences, np.ndarray):
+            self.features = feature_sequences.astype(np.float32, copy=False)
+        else:
+            self.features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
         self.lookback_hours = lookback_hours
         self.prediction_hours = prediction_hours
         self.stride = stride
         max_start_index = len(self.features) - lookback_hours - prediction_hours
         self.num_samples = max(0, (max_start_index // stride) + 1)
+        self.labels = None
         logger.info(f"  Dataset created with {self.num_samples} samples (from {len(self.features)} data points).")
         logger.info(f"  Configuration: lookback={lookback_hours}h, prediction={prediction_hours}h, stride={stride}h")
 
@@ -79,10 +46,24 @@ class WeeklyStrategyDataset(Dataset):
     def __getitem__(self, idx):
         start_idx = idx * self.stride
         X = self.features[start_idx : start_idx + self.lookback_hours]
+        if self.labels is not None:
+            return torch.FloatTensor(X), torch.from_numpy(self.labels[idx])
         future_window = self.features[start_idx + self.lookback_hours : start_idx + self.lookback_hours + self.prediction_hours]
         y = self._calculate_optimal_allocation_from_future(X, future_window)
         return torch.FloatTensor(X), torch.FloatTensor(y)
 
+    def precompute_labels(self) -> np.ndarray:
+        """一次性计算所有样本的标签 (num_samples, 4) 并缓存, 之后 __getitem__ 直接查表"""
+        if self.labels is None:
+            labels = np.empty((self.num_samples, 4), dtype=np.float32)
+            for idx in range(self.num_samples):
+                start_idx = idx * self.stride
+                end_idx = start_idx + self.lookback_hours
+                labels[idx] = self._calculate_optimal_allocation_from_future(
+                    self.features[start_idx:end_idx], self.features[end_idx:end_idx + self.prediction_hours])
+            self.labels = labels
+        return self.labels
+
     # 这个函数是学习的关键
     def _calculate_optimal_allocation_from_future(self, historical: np.ndarray, future: np.ndarray) -> List[float]:
         # 安全检查
@@ -176,12 +157,28 @@ class WeeklyStrategyDataset(Dataset):
         
         return [float(aave_allocation), float(lp_allocation), float(price_bound), float(vol_thresh)]
 
+def time_ordered_split(num_samples: int, stride: int, lookback_hours: int, prediction_hours: int,
+                       val_fraction: float = 0.2, embargo_hours: int = 24) -> Tuple[List[int], List[int]]:
+    """
+    按时间顺序划分 WeeklyStrategyDataset 的样本: 最后 val_fraction 的样本作为验证集,
+    训练集只保留输入和标签窗口都在第一个验证样本开始之前 embargo_hours 小时结束的样本。
+    滑动窗口互相重叠, 随机划分会让验证集"看到"训练集的未来数据, 这里用禁运间隔彻底隔开。
+    """
+    if num_samples < 2:
+        return list(range(num_samples)), []
+    num_val = min(num_samples - 1, max(1, int(round(num_samples * val_fraction))))
+    first_val = num_samples - num_val
+    val_start_row = first_val * stride
+    window = lookback_hours + prediction_hours
+    train_indices = [i for i in range(first_val) if i * stride + window + embargo_hours <= val_start_row]
+    return train_indices, list(range(first_val, num_samples))
+
 # 使用双向LSTM、Attention机制和全连接网络
 class WeeklyStrategyLSTM(nn.Module):
-    def __init__(self, input_dim: int = 28, hidden_dim: int = 128, num_layers: int = 2):
+    def __init__(self, input_dim: int = 28, hidden_dim: int = 128, num_layers: int = 2, num_heads: int = 8):
         super(WeeklyStrategyLSTM, self).__init__()
         self.lstm = nn.LSTM(input_dim, hidden_dim, num_layers, batch_first=True, bidirectional=True, dropout=0.2 if num_layers > 1 else 0)
-        self.attention = nn.MultiheadAttention(embed_dim=hidden_dim * 2, num_heads=8, dropout=0.1, batch_first=True)
+        self.attention = nn.MultiheadAttention(embed_dim=hidden_dim * 2, num_heads=num_heads, dropout=0.1, batch_first=True)
         self.feature_extractor = nn.Sequential(nn.Linear(hidden_dim * 2, 128), nn.ReLU(), nn.LayerNorm(128), nn.Dropout(0.3), nn.Linear(128, 64), nn.ReLU())
         self.allocation_head = nn.Sequential(nn.Linear(64, 32), nn.ReLU(), nn.Linear(32, 2))
         self.boundary_head = nn.Sequential(nn.Linear(64, 16), nn.ReLU(), nn.Linear(16, 2))
@@ -189,35 +186,203 @@ class WeeklyStrategyLSTM(nn.Module):
         self.sigmoid = nn.Sigmoid()
     
     def forward(self, x):
+        return self.decode(self.encode(x))
+
+    def encode(self, x):
+        """LSTM + attention, 返回最后一个时间步的 attention 输出 (batch, hidden_dim * 2)"""
         lstm_out, _ = self.lstm(x)
         attn_out, _ = self.attention(lstm_out, lstm_out, lstm_out)
-        final_features = attn_out[:, -1, :]
+        return attn_out[:, -1, :]
+
+    def decode(self, final_features):
+        """全连接部分: 由 encode 的输出得到 [aave 配比, LP 配比, 价格边界, 波动率阈值]"""
         extracted = self.feature_extractor(final_features)
         allocations = self.softmax(self.allocation_head(extracted))
         boundaries = self.sigmoid(self.boundary_head(extracted)) * 0.03
         return torch.cat([allocations, boundaries], dim=1)
 
+    def forward_last_query(self, x):
+        """
+        推理专用: 输出只取 attention 最后一个位置, 因此只用最后一个时间步做 query,
+        省去其余 lookback-1 个 query 的注意力计算。数学上与 forward 相同, 但矩阵形状不同导致
+        BLAS 的累加顺序不同, 结果只保证在 1e-7 量级内一致, 不保证逐位相同。
+        双向 LSTM 的状态依赖窗口起点和终点, 窗口滑动后每个位置都会变化, 没有可以精确复用的部分。
+        """
+        lstm_out, _ = self.lstm(x)
+        attn_out, _ = self.attention(lstm_out[:, -1:, :], lstm_out, lstm_out, need_weights=False)
+        return self.decode(attn_out[:, -1, :])
+
+def atomic_torch_save(obj, path: str):
+    """先写临时文件再 os.replace, 并行训练或中途被杀时不会留下写了一半的模型文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_json_dump(obj, path: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(obj, f, indent=2)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _capture_rng_state() -> Dict:
+    """记录所有会影响训练结果的随机数状态 (shuffle、dropout、标签调试采样)"""
+    np_state = np.random.get_state()
+    return {
+        'python': random.getstate(),
+        # numpy 状态转成纯 Python 类型, 保证 torch.load(weights_only=True) 也能读取
+        'numpy': (np_state[0], np_state[1].tolist(), int(np_state[2]), int(np_state[3]), float(np_state[4])),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def _restore_rng_state(state: Dict):
+    random.setstate(state['python'])
+    name, keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class AsyncCheckpointWriter:
+    """
+    在后台线程中写检查点。调用方先在训练线程里把状态拷贝到 CPU,
+    之后训练可以继续进行, 序列化和落盘不再阻塞 epoch。
+    同一时间最多只有一个待写的检查点, 避免拷贝堆积占用内存。
+    """
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            state, path = item
+            try:
+                atomic_torch_save(state, path)
+            except Exception as e:
+                logger.error(f"  Failed to write checkpoint {path}: {e}", exc_info=True)
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def submit(self, state: Dict, path: str):
+        if self._error is not None:
+            raise RuntimeError("Checkpoint writer failed earlier") from self._error
+        self._queue.put((state, path))
+
+    def close(self):
+        """等待所有检查点写完再返回"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Checkpoint writer failed") from self._error
+
+
+def _cpu_copy(obj):
+    """深拷贝 state_dict 并把其中的张量移到 CPU, 供后台线程安全地序列化"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: _cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
 class WeeklyStrategyTrainer:
-    def __init__(self, model: nn.Module, device: str, model_save_path: str):
+    def __init__(self, model: nn.Module, device: str, model_save_path: str,
+                 checkpoint_path: str = None, checkpoint_every: int = 1, lr: float = 0.0001,
+                 profile_steps: int = 0, profile_trace_path: str = None):
         self.model = model.to(device)
         self.device = device
         self.model_save_path = model_save_path
-        self.optimizer = optim.AdamW(self.model.parameters(), lr=0.0001, weight_decay=0.01)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.optimizer = optim.AdamW(self.model.parameters(), lr=lr, weight_decay=0.01)
         self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(self.optimizer, 'min', factor=0.5, patience=5)
         self.allocation_loss_fn = nn.MSELoss()
         self.boundary_loss_fn = nn.MSELoss()
+        self.diverged = False
+        self.epoch_timings: List[Dict] = []
+        # profile_steps > 0 时用 torch.profiler 记录训练开始后的若干个 step
+        self.profile_steps = profile_steps
+        self.profile_trace_path = profile_trace_path
+        self.profiler = None
+        self.profile_summary: Optional[str] = None
+
+    @staticmethod
+    def load_checkpoint(checkpoint_path: str) -> Optional[Dict]:
+        """读取检查点文件, 不存在时返回 None"""
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return None
+        return torch.load(checkpoint_path, map_location='cpu')
+
+    def _sync(self):
+        # CUDA 是异步执行的, 分阶段计时前需要等待 GPU 完成
+        if self.device.startswith('cuda'):
+            torch.cuda.synchronize()
 
     def train_epoch(self, loader):
+        from torch.profiler import record_function
+        from training_profiler import peak_rss_mb
+
         self.model.train(); total_loss = 0
+        timing = dict.fromkeys(('data_wait_seconds', 'forward_seconds', 'backward_seconds', 'optimizer_seconds'), 0.0)
+        samples = batches = 0
+        epoch_start = wait_start = time.perf_counter()
         for x, y in loader:
-            x, y = x.to(self.device), y.to(self.device)
-            p = self.model(x)
-            loss = 0.7 * self.allocation_loss_fn(p[:,:2], y[:,:2]) + 0.3 * self.boundary_loss_fn(p[:,2:], y[:,2:])
-            if torch.isnan(loss): continue
-            self.optimizer.zero_grad(); loss.backward()
-            torch.nn.utils.clip_grad_norm_(self.model.parameters(), 0.5)
-            self.optimizer.step()
-            total_loss += loss.item()
+            batch_start = time.perf_counter()
+            timing['data_wait_seconds'] += batch_start - wait_start
+            with record_function('forward'):
+                x, y = x.to(self.device, non_blocking=True), y.to(self.device, non_blocking=True)
+                p = self.model(x)
+                loss = 0.7 * self.allocation_loss_fn(p[:,:2], y[:,:2]) + 0.3 * self.boundary_loss_fn(p[:,2:], y[:,2:])
+                self._sync()
+            forward_end = time.perf_counter()
+            timing['forward_seconds'] += forward_end - batch_start
+            if torch.isnan(loss):
+                wait_start = time.perf_counter(); continue
+            with record_function('backward'):
+                self.optimizer.zero_grad(); loss.backward()
+                self._sync()
+            backward_end = time.perf_counter()
+            timing['backward_seconds'] += backward_end - forward_end
+            with record_function('optimizer'):
+                torch.nn.utils.clip_grad_norm_(self.model.parameters(), 0.5)
+                self.optimizer.step()
+                total_loss += loss.item()
+            timing['optimizer_seconds'] += time.perf_counter() - backward_end
+            samples += len(x); batches += 1
+            if self.profiler is not None:
+                self.profiler.step()
+            wait_start = time.perf_counter()
+        # 记录本 epoch 各阶段耗时和吞吐量, 用来判断瓶颈在数据加载还是计算
+        epoch_seconds = time.perf_counter() - epoch_start
+        timing.update({
+            'samples': samples,
+            'batches': batches,
+            'epoch_seconds': epoch_seconds,
+            'compute_seconds': epoch_seconds - timing['data_wait_seconds'],
+            'samples_per_second': samples / epoch_seconds if epoch_seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        })
+        self.epoch_timings.append(timing)
         return total_loss / len(loader) if len(loader) > 0 else float('inf')
 
     def validate(self, loader):
@@ -230,33 +395,315 @@ class WeeklyStrategyTrainer:
                 if torch.isnan(p).any(): return float('inf'), {}
                 loss = 0.7 * self.allocation_loss_fn(p[:,:2], y[:,:2]) + 0.3 * self.boundary_loss_fn(p[:,2:], y[:,2:])
                 total_loss += loss.item()
-                preds.append(p.cpu().numpy()); labels.append(y.cpu().numpy())
+                # y 可能指向 WindowBatchLoader 复用的缓冲区, 必须拷贝后再保留
+                preds.append(p.cpu().numpy()); labels.append(y.cpu().numpy().copy())
         if not preds: return float('inf'), {}
         avg_loss = total_loss / len(loader)
         p, l = np.vstack(preds), np.vstack(labels)
         metrics = {'mae': np.mean(np.abs(p - l))}
         return avg_loss, metrics
 
-    def train(self, train_loader, val_loader, epochs=100, patience=15):
-        best_loss = float('inf'); counter = 0
-        for epoch in range(epochs):
-            train_loss = self.train_epoch(train_loader)
-            val_loss, _ = self.validate(val_loader)
-            self.scheduler.step(val_loss)
-            if np.isnan(val_loss) or np.isnan(train_loss):
-                logger.error("Loss became NaN. Stopping training."); break
-            if val_loss < best_loss:
-                best_loss = val_loss; counter = 0
-                torch.save(self.model.state_dict(), self.model_save_path)
-            else:
-                counter += 1
-            if (epoch+1)%10==0: logger.info(f"  Epoch {epoch+1}/{epochs}, Train Loss: {train_loss:.6f}, Val Loss: {val_loss:.6f}")
-            if counter >= patience: logger.info(f"  Early stopping at epoch {epoch+1}."); break
-        if os.path.exists(self.model_save_path): self.model.load_state_dict(torch.load(self.model_save_path))
+    def _checkpoint_state(self, epoch: int, best_loss: float, counter: int, best_state, extra_state: Dict) -> Dict:
+        return _cpu_copy({
+            'epoch': epoch,
+            'best_loss': best_loss,
+            'counter': counter,
+            'diverged': self.diverged,
+            'model_state_dict': self.model.state_dict(),
+            'best_model_state_dict': best_state,
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict(),
+            'rng_state': _capture_rng_state(),
+            'extra_state': extra_state or {},
+        })
+
+    def train(self, train_loader, val_loader, epochs=100, patience=15, resume=True, extra_state: Dict = None):
+        """
+        训练模型。设置了 checkpoint_path 时每 checkpoint_every 个 epoch 异步保存一次完整检查点
+        (模型、优化器、学习率调度器、早停计数、随机数状态以及 extra_state 中的数据集划分),
+        resume=True 且检查点存在时从中断处继续, 结果与不中断的训练一致。
+        """
+        best_loss = float('inf'); counter = 0; start_epoch = 0
+        best_state = None
+        self.diverged = False
+
+        checkpoint = self.load_checkpoint(self.checkpoint_path) if resume else None
+        if checkpoint is not None:
+            self.model.load_state_dict(checkpoint['model_state_dict'])
+            self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+            self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+            best_loss, counter = checkpoint['best_loss'], checkpoint['counter']
+            best_state = checkpoint['best_model_state_dict']
+            self.diverged = checkpoint['diverged']
+            start_epoch = checkpoint['epoch'] + 1
+            _restore_rng_state(checkpoint['rng_state'])
+            if best_state is not None:
+                atomic_torch_save(best_state, self.model_save_path)
+            logger.info(f"  Resumed from checkpoint {self.checkpoint_path} at epoch {start_epoch} (best val loss {best_loss:.6f})")
+            if self.diverged or counter >= patience:
+                start_epoch = epochs
+
+        writer = AsyncCheckpointWriter() if self.checkpoint_path else None
+        if self.profile_steps and start_epoch < epochs:
+            from training_profiler import StepProfiler
+            self.profiler = StepProfiler(self.profile_steps, self.profile_trace_path,
+                                         use_cuda=self.device.startswith('cuda'))
+        try:
+            for epoch in range(start_epoch, epochs):
+                train_loss = self.train_epoch(train_loader)
+                validate_start = time.perf_counter()
+                val_loss, _ = self.validate(val_loader)
+                timing = self.epoch_timings[-1]
+                timing.update({'epoch': epoch + 1, 'train_loss': float(train_loss), 'val_loss': float(val_loss),
+                               'validate_seconds': time.perf_counter() - validate_start})
+                self.scheduler.step(val_loss)
+                if np.isnan(val_loss) or np.isnan(train_loss):
+                    logger.error("Loss became NaN. Stopping training."); self.diverged = True; break
+                if val_loss < best_loss:
+                    best_loss = val_loss; counter = 0
+                    best_state = _cpu_copy(self.model.state_dict())
+                    atomic_torch_save(best_state, self.model_save_path)
+                else:
+                    counter += 1
+                logger.debug(f"  Epoch {epoch+1}: data wait {timing['data_wait_seconds']:.3f}s, "
+                             f"forward {timing['forward_seconds']:.3f}s, backward {timing['backward_seconds']:.3f}s, "
+                             f"optimizer {timing['optimizer_seconds']:.3f}s, {timing['samples_per_second']:.1f} samples/s")
+                if (epoch+1)%10==0: logger.info(f"  Epoch {epoch+1}/{epochs}, Train Loss: {train_loss:.6f}, Val Loss: {val_loss:.6f}, "
+                                                f"Data Wait: {timing['data_wait_seconds']:.2f}s / Compute: {timing['compute_seconds']:.2f}s, "
+                                                f"{timing['samples_per_second']:.0f} samples/s")
+                stop = counter >= patience
+                if writer and ((epoch + 1) % self.checkpoint_every == 0 or stop or epoch + 1 == epochs):
+                    writer.submit(self._checkpoint_state(epoch, best_loss, counter, best_state, extra_state), self.checkpoint_path)
+                if stop: logger.info(f"  Early stopping at epoch {epoch+1}."); break
+        finally:
+            if writer:
+                writer.close()
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.profile_summary = self.profiler.summary
+                self.profiler = None
+
+        if self.epoch_timings:
+            data_wait = sum(t['data_wait_seconds'] for t in self.epoch_timings)
+            compute = sum(t['compute_seconds'] for t in self.epoch_timings)
+            logger.info(f"  Training loop time: data wait {data_wait:.2f}s, compute {compute:.2f}s "
+                        f"({data_wait / max(data_wait + compute, 1e-9):.1%} waiting on data)")
+
+        if best_state is not None:
+            self.model.load_state_dict(best_state)
+        elif os.path.exists(self.model_save_path):
+            self.model.load_state_dict(torch.load(self.model_save_path, map_location=self.device))
         return best_loss
 
 
+def train_pool(pool_symbol: str, pool_data: Dict, device: str = None,
+               resume: bool = True, checkpoint_every: int = 1,
+               loader_workers: int = 0, prefetch_batches: int = 2, profile_steps: int = 0) -> Dict:
+    """
+    单个池子的完整训练流水线: 特征 -> 标准化 -> 数据集 -> 训练 -> 策略输出 -> 模型包。
+    返回该池子的训练结果; 数据不足时 status 为 'skipped', 训练发散 (没有任何有效的验证损失) 时抛出 FloatingPointError。
+
+    训练过程中定期写检查点到 models/checkpoints/, resume=True 时从上次中断处继续;
+    训练成功完成后删除检查点。
+
+    loader_workers / prefetch_batches 传给 WindowBatchLoader: 准备 batch 的工作进程数和预取深度。
+    每个 epoch 的耗时、吞吐量和峰值内存写入 models/training_profile_<pool>.json/.csv;
+    profile_steps > 0 时另外用 torch.profiler 记录前 profile_steps 个 step (trace 写入 models/training_trace_<pool>.json)。
+    """
+    from sklearn.preprocessing import StandardScaler
+    from feature_scaler import ArrayScaler
+    from model_package import save_model_package
+    from batch_loader import WindowBatchLoader
+    from training_profiler import write_timing_report
+
+    start_time = datetime.now()
+    result = {'pool_symbol': pool_symbol, 'status': 'skipped'}
+
+    print("\n" + "="*70)
+    logger.info(f"[POOL] Starting training pipeline for: {pool_symbol}")
+    print("="*70)
+
+    logger.info(f"  [A] Generating feature sequences...")
+    feature_sequences = create_feature_sequences_from_snapshots(
+        pool_data['snapshots'], 
+        pool_data['aave_current_reserves'],
+        pool_data['gas_current']
+    )
+    if len(feature_sequences) < 168:
+        logger.warning(f"  Skipping {pool_symbol}: not enough data points ({len(feature_sequences)}). Need at least 168.")
+        result['reason'] = f"not enough data points ({len(feature_sequences)})"
+        return result
+
+    logger.info(f"  [B] Scaling features...")
+    features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+    for i, seq in enumerate(feature_sequences):
+        seq['feature_vector'] = features_scaled[i]
+
+    logger.info(f"  [C] Creating dataset with multi-factor labeling strategy...")
+    dataset = WeeklyStrategyDataset(
+        feature_sequences, lookback_hours=72, prediction_hours=24, stride=12
+    )
+    if len(dataset) < 10:
+        logger.warning(f"  Skipping {pool_symbol}: not enough training samples generated ({len(dataset)}). Need at least 10.")
+        result['reason'] = f"not enough training samples ({len(dataset)})"
+        return result
+    
+    sanitized_symbol = pool_symbol.replace('/','-')
+    checkpoint_path = os.path.join('models', 'checkpoints', f'{sanitized_symbol}.ckpt')
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    checkpoint = WeeklyStrategyTrainer.load_checkpoint(checkpoint_path) if resume else None
+    split = checkpoint['extra_state'].get('split') if checkpoint else None
+    if split and split['num_samples'] != len(dataset):
+        logger.warning(f"  Checkpoint for {pool_symbol} was made on a different dataset "
+                       f"({split['num_samples']} vs {len(dataset)} samples). Starting from scratch.")
+        split, resume = None, False
+
+    if not split:
+        train_indices, val_indices = time_ordered_split(len(dataset), stride=12, lookback_hours=72, prediction_hours=24,
+                                                        val_fraction=0.2, embargo_hours=24)
+        split = {'num_samples': len(dataset), 'train_indices': train_indices, 'val_indices': val_indices}
+    if not split['train_indices'] or not split['val_indices']:
+        logger.warning(f"  Skipping {pool_symbol}: not enough history for an embargoed time-ordered split "
+                       f"({len(split['train_indices'])} train / {len(split['val_indices'])} val samples).")
+        result['reason'] = 'not enough history for a time-ordered split'
+        return result
+    logger.info(f"  Time-ordered split: {len(split['train_indices'])} train / {len(split['val_indices'])} val samples (24h embargo)")
+
+    logger.info(f"  [D] Initializing and training model...")
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    logger.info(f"  Using device: {device}")
+    loader_options = {'batch_size': 32, 'num_workers': loader_workers, 'prefetch_batches': prefetch_batches,
+                      'pin_memory': device.startswith('cuda')}
+    train_loader = WindowBatchLoader(dataset, split['train_indices'], shuffle=True, **loader_options)
+    val_loader = WindowBatchLoader(dataset, split['val_indices'], shuffle=False, **loader_options)
+    model = WeeklyStrategyLSTM(input_dim=28).to(device)
+    model_save_path = f'models/best_model_{pool_symbol.replace("/", "-")}.pth'
+    trainer = WeeklyStrategyTrainer(model, device, model_save_path,
+                                    checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+                                    profile_steps=profile_steps,
+                                    profile_trace_path=f'models/training_trace_{sanitized_symbol}.json')
+    try:
+        best_loss = trainer.train(train_loader, val_loader, epochs=100, patience=15,
+                                  resume=resume, extra_state={'split': split})
+        if not np.isfinite(best_loss):
+            raise FloatingPointError(f"Training for {pool_symbol} produced no finite validation loss.")
+        _, val_metrics = trainer.validate(val_loader)
+    finally:
+        train_loader.close(); val_loader.close()
+        # 在 finally 中写报告: 出错不能掩盖训练本身的异常
+        try:
+            write_timing_report(trainer.epoch_timings,
+                                f'models/training_profile_{sanitized_symbol}.json',
+                                f'models/training_profile_{sanitized_symbol}.csv', {
+                                    'pool_symbol': pool_symbol,
+                                    'generated_at': datetime.now().isoformat(),
+                                    'device': device,
+                                    'torch_threads': torch.get_num_threads(),
+                                    'batch_size': loader_options['batch_size'],
+                                    'loader_workers': loader_workers,
+                                    'train_samples': len(split['train_indices']),
+                                    'profiled_steps': profile_steps,
+                                    'profiler_summary': trainer.profile_summary,
+                                })
+        except Exception as e:
+            logger.warning(f"  Could not write training profile for {pool_symbol}: {e}", exc_info=True)
+
+    logger.info(f"  [E] Generating and saving strategy...")
+    model.eval()
+    with torch.no_grad():
+        recent_features_scaled = np.array([f['feature_vector'] for f in feature_sequences[-72:]], dtype=np.float32)
+        input_tensor = torch.FloatTensor(recent_features_scaled).unsqueeze(0).to(device)
+        pred = model(input_tensor).cpu().numpy()[0]
+
+        last_seq = feature_sequences[-1]
+        current_price = last_seq['price_current']
+        
+        # 分析最近数据的市场状况
+        recent_data = np.array([f['feature_vector'] for f in feature_sequences[-168:]])  # 最近7天
+        recent_volatility = np.std(recent_data[:, 3])
+        recent_volume_trend = (np.mean(recent_data[-24:, 4]) / (np.mean(recent_data[:24, 4]) + 1e-8)) - 1
+        recent_price_trend = (recent_data[-1, 0] - recent_data[0, 0]) / (recent_data[0, 0] + 1e-8)
+        
+        logger.info(f"  [Market Analysis] Recent 7-day statistics:")
+        logger.info(f"    - Price Volatility: {recent_volatility:.6f}")
+        logger.info(f"    - Volume Trend: {recent_volume_trend:+.2%}")
+        logger.info(f"    - Price Trend: {recent_price_trend:+.2%}")
+        logger.info(f"    - Current Price: ${current_price:.2f}")
+        
+        strategy = {
+            "pool_symbol": pool_symbol,
+            "generated_at": datetime.now().isoformat(),
+            "allocations": {
+                "aave_wbtc_pool": float(pred[0]), 
+                "uniswap_lp": float(pred[1])
+            },
+            "safety_bounds": {
+                "price_lower": float(current_price * (1-pred[2])), 
+                "price_upper": float(current_price * (1+pred[2])), 
+                "vol_threshold": float(pred[3])
+            },
+            "model_confidence": max(0.5, 1.0 - best_loss * 10) if best_loss != float('inf') else 0.5,
+            "strategy_type": "multi_factor_continuous",
+            "market_conditions": {
+                "recent_volatility": float(recent_volatility),
+                "recent_volume_trend": float(recent_volume_trend),
+                "recent_price_trend": float(recent_price_trend)
+            }
+        }
+        
+        output_path = f'models/strategy_output_{sanitized_symbol}.json'
+        atomic_json_dump(strategy, output_path)
+        logger.info(f"  Strategy saved to {output_path}")
+        logger.info(f"  -> AAVE: {pred[0]:.2%}, LP: {pred[1]:.2%}, Price Bound: ±{pred[2]:.2%}, Vol Threshold: {pred[3]:.4f}")
+        logger.info(f"  -> Model Confidence: {strategy['model_confidence']:.2%}, Best Val Loss: {best_loss:.6f}")
+
+        package_path = f'models/model_package_{sanitized_symbol}.pth'
+        atomic_torch_save({
+            'model_state_dict': model.state_dict(),
+            'scaler': scaler
+        }, package_path)
+        logger.info(f"  Model package saved to {package_path}")
+
+        save_model_package(f'models/model_package_{sanitized_symbol}.pkg', model,
+                           ArrayScaler.from_sklearn(scaler),
+                           {'lookback_hours': 72, 'prediction_hours': 24, 'stride': 12})
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    result.update({
+        'status': 'ok',
+        'best_val_loss': float(best_loss),
+        'val_mae': float(val_metrics.get('mae', float('nan'))),
+        'diverged': trainer.diverged,
+        'model_confidence': float(strategy['model_confidence']),
+        'num_samples': len(dataset),
+        'package_path': package_path,
+        'duration_seconds': (datetime.now() - start_time).total_seconds(),
+    })
+    return result
+
+
 def main():
+    import argparse
+    from training_orchestrator import train_pools
+
+    parser = argparse.ArgumentParser(description='DeFi 多池子策略模型训练')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('TRAINING_WORKERS', 0)) or None,
+                        help='并行训练的进程数 (默认: min(池子数, CPU 核数))')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='每个训练进程的 torch 线程数 (默认: CPU 核数 / 进程数)')
+    parser.add_argument('--no-resume', action='store_true', help='忽略已有检查点, 从头开始训练')
+    parser.add_argument('--checkpoint-every', type=int, default=1, help='每隔多少个 epoch 保存一次检查点')
+    parser.add_argument('--loader-workers', type=int, default=int(os.getenv('LOADER_WORKERS', 0)),
+                        help='每个池子准备 batch 的工作进程数 (默认 0: 在训练进程中同步准备)')
+    parser.add_argument('--prefetch-batches', type=int, default=2, help='数据加载的预取深度 (batch 数)')
+    parser.add_argument('--profile-steps', type=int, default=0,
+                        help='用 torch.profiler 记录每个池子最开始的若干个训练 step (默认 0: 不记录)')
+    args = parser.parse_args()
+
     print("\n" + "="*70)
     print("      DeFi Multi-Pool AI Strategy Training System (Optimized)")
     print("="*70)
@@ -275,106 +722,17 @@ def main():
             
         os.makedirs('models', exist_ok=True)
 
-        for pool_symbol, pool_data in pools_data.items():
-            print("\n" + "="*70)
-            logger.info(f"[POOL] Starting training pipeline for: {pool_symbol}")
-            print("="*70)
-
-            logger.info(f"  [A] Generating feature sequences...")
-            feature_sequences = create_feature_sequences_from_snapshots(
-                pool_data['snapshots'], 
-                pool_data['aave_current_reserves'],
-                pool_data['gas_current']
-            )
-            if len(feature_sequences) < 168:
-                logger.warning(f"  Skipping {pool_symbol}: not enough data points ({len(feature_sequences)}). Need at least 168.")
-                continue
-
-            logger.info(f"  [B] Scaling features...")
-            features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
-            scaler = StandardScaler()
-            features_scaled = scaler.fit_transform(features)
-            for i, seq in enumerate(feature_sequences):
-                seq['feature_vector'] = features_scaled[i]
-
-            logger.info(f"  [C] Creating dataset with multi-factor labeling strategy...")
-            dataset = WeeklyStrategyDataset(
-                feature_sequences, lookback_hours=72, prediction_hours=24, stride=12
-            )
-            if len(dataset) < 10:
-                logger.warning(f"  Skipping {pool_symbol}: not enough training samples generated ({len(dataset)}). Need at least 10.")
-                continue
-            
-            train_size = int(len(dataset) * 0.8)
-            val_size = len(dataset) - train_size
-            train_dataset, val_dataset = torch.utils.data.random_split(dataset, [train_size, val_size])
-            train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-            val_loader = DataLoader(val_dataset, batch_size=32, shuffle=False)
-
-            logger.info(f"  [D] Initializing and training model...")
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            logger.info(f"  Using device: {device}")
-            model = WeeklyStrategyLSTM(input_dim=28).to(device)
-            model_save_path = f'models/best_model_{pool_symbol.replace("/", "-")}.pth'
-            trainer = WeeklyStrategyTrainer(model, device, model_save_path)
-            best_loss = trainer.train(train_loader, val_loader, epochs=100, patience=15)
-
-            logger.info(f"  [E] Generating and saving strategy...")
-            model.eval()
-            with torch.no_grad():
-                recent_features_scaled = np.array([f['feature_vector'] for f in feature_sequences[-72:]], dtype=np.float32)
-                input_tensor = torch.FloatTensor(recent_features_scaled).unsqueeze(0).to(device)
-                pred = model(input_tensor).cpu().numpy()[0]
-
-                last_seq = feature_sequences[-1]
-                current_price = last_seq['price_current']
-                
-                # 分析最近数据的市场状况
-                recent_data = np.array([f['feature_vector'] for f in feature_sequences[-168:]])  # 最近7天
-                recent_volatility = np.std(recent_data[:, 3])
-                recent_volume_trend = (np.mean(recent_data[-24:, 4]) / (np.mean(recent_data[:24, 4]) + 1e-8)) - 1
-                recent_price_trend = (recent_data[-1, 0] - recent_data[0, 0]) / (recent_data[0, 0] + 1e-8)
-                
-                logger.info(f"  [Market Analysis] Recent 7-day statistics:")
-                logger.info(f"    - Price Volatility: {recent_volatility:.6f}")
-                logger.info(f"    - Volume Trend: {recent_volume_trend:+.2%}")
-                logger.info(f"    - Price Trend: {recent_price_trend:+.2%}")
-                logger.info(f"    - Current Price: ${current_price:.2f}")
-                
-                strategy = {
-                    "pool_symbol": pool_symbol,
-                    "generated_at": datetime.now().isoformat(),
-                    "allocations": {
-                        "aave_wbtc_pool": float(pred[0]), 
-                        "uniswap_lp": float(pred[1])
-                    },
-                    "safety_bounds": {
-                        "price_lower": current_price * (1-pred[2]), 
-                        "price_upper": current_price * (1+pred[2]), 
-                        "vol_threshold": float(pred[3])
-                    },
-                    "model_confidence": max(0.5, 1.0 - best_loss * 10) if best_loss != float('inf') else 0.5,
-                    "strategy_type": "multi_factor_continuous",
-                    "market_conditions": {
-                        "recent_volatility": float(recent_volatility),
-                        "recent_volume_trend": float(recent_volume_trend),
-                        "recent_price_trend": float(recent_price_trend)
-                    }
-                }
-                
-                sanitized_symbol = pool_symbol.replace('/','-')
-                output_path = f'models/strategy_output_{sanitized_symbol}.json'
-                with open(output_path, 'w') as f:
-                    json.dump(strategy, f, indent=2)
-                logger.info(f"  Strategy saved to {output_path}")
-                logger.info(f"  -> AAVE: {pred[0]:.2%}, LP: {pred[1]:.2%}, Price Bound: ±{pred[2]:.2%}, Vol Threshold: {pred[3]:.4f}")
-                logger.info(f"  -> Model Confidence: {strategy['model_confidence']:.2%}, Best Val Loss: {best_loss:.6f}")
-
-                torch.save({
-                    'model_state_dict': model.state_dict(),
-                    'scaler': scaler
-                }, f'models/model_package_{sanitized_symbol}.pth')
-                logger.info(f"  Model package saved to models/model_package_{sanitized_symbol}.pth")
+        results = train_pools(pools_data, max_workers=args.workers, threads_per_worker=args.threads_per_worker,
+                              resume=not args.no_resume, checkpoint_every=args.checkpoint_every,
+                              loader_workers=args.loader_workers, prefetch_batches=args.prefetch_batches,
+                              profile_steps=args.profile_steps)
+        atomic_json_dump({'generated_at': datetime.now().isoformat(), 'pools': results},
+                         os.path.join('models', 'training_summary.json'))
+
+        print("\n" + "="*70)
+        for r in results:
+            detail = f"val_loss={r['best_val_loss']:.6f}" if r['status'] == 'ok' else r.get('reason') or r.get('error')
+            logger.info(f"  [{r['status'].upper()}] {r['pool_symbol']}: {detail}")
 
     except Exception as e:
         logger.error(f"An error occurred in the main pipeline: {e}", exc_info=True)
@@ -384,4 +742,4 @@ def main():
         print("="*70 + "\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
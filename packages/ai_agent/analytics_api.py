@@ -1,13 +1,16 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import partial
 import os
 from dotenv import load_dotenv
 import sys
 import os
-from database import DatabaseManager
-from analytics_engine import StrategyAnalytics
+from database import DatabaseManager, SNAPSHOT_BUCKETS
+from analytics_engine import StrategyAnalytics, snapshot_count, snapshot_row
+from data_cache import TTLCache
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -30,59 +33,111 @@ CORS(app)
 db = DatabaseManager()
 analytics = StrategyAnalytics(initial_capital=100000.0)
 
-_cache = {
-    'last_fetch': None,
-    'data': {}
-}
-
-
-def get_pool_data(pool_symbol='wBTC-USDC', hours=720, force_refresh=False):
+# get_pool_data 的结果缓存: 键为 (pool_symbol, hours, bucket), 每个条目单独计算有效期, 超出内存预算时按 LRU 淘汰
+POOL_DATA_CACHE_TTL_SECONDS = float(os.getenv("POOL_DATA_CACHE_TTL_SECONDS", 300))
+POOL_DATA_CACHE_MAX_BYTES = int(os.getenv("POOL_DATA_CACHE_MAX_MB", 64)) * 1024 * 1024
+# 过期后仍可直接返回旧数据 (同时后台刷新) 的时长, 设为 0 则过期后同步重新读取
+POOL_DATA_CACHE_STALE_SECONDS = float(os.getenv("POOL_DATA_CACHE_STALE_SECONDS", 300))
+_cache = TTLCache(max_bytes=POOL_DATA_CACHE_MAX_BYTES, ttl_seconds=POOL_DATA_CACHE_TTL_SECONDS,
+                  stale_seconds=POOL_DATA_CACHE_STALE_SECONDS)
+
+# 长窗口默认在数据库端降采样: 超过 30 天用 4 小时桶, 超过 90 天用 1 天桶
+BUCKET_THRESHOLDS_HOURS = [(2160, '1d'), (720, '4h')]
+# 市场数据 (当前价格、24 小时涨跌) 始终基于最新的原始小时快照
+MARKET_SNAPSHOT_HOURS = 25
+# get_pool_data 中各项数据并发读取, 所有读取合计的超时 (秒)
+POOL_DATA_TIMEOUT_SECONDS = float(os.getenv("POOL_DATA_TIMEOUT_SECONDS", 15))
+_fetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("POOL_DATA_WORKERS", 8)),
+                                     thread_name_prefix="pool-data")
+
+
+def fetch_concurrently(loads, timeout=POOL_DATA_TIMEOUT_SECONDS):
+    """
+    并发执行 {名称: 无参函数} 中的各项读取 (每项各占用一个连接池中的连接), 返回 {名称: 结果}。
+    总耗时约等于最慢的一项; 超过 timeout 秒仍有未完成的读取时抛 TimeoutError, 已在执行的查询在后台结束后丢弃结果。
     """
-    获取池子数据（带5分钟缓存）
+    futures = {name: _fetch_executor.submit(load) for name, load in loads.items()}
+    _, pending = wait(futures.values(), timeout=timeout)
+    if pending:
+        for future in pending:
+            future.cancel()
+        slow = [name for name, future in futures.items() if future in pending]
+        raise TimeoutError(f"Database reads timed out after {timeout}s: {', '.join(slow)}")
+    return {name: future.result() for name, future in futures.items()}
+
+
+def resolve_bucket(hours, requested=None):
+    """请求指定的时间桶 (1h/4h/1d/1w); 未指定时按窗口长度自动选择"""
+    if requested:
+        if requested not in SNAPSHOT_BUCKETS:
+            raise ValueError(f"Invalid bucket. Must be one of: {', '.join(SNAPSHOT_BUCKETS)}")
+        return requested
+    for threshold, bucket in BUCKET_THRESHOLDS_HOURS:
+        if hours > threshold:
+            return bucket
+    return '1h'
+
+
+def get_pool_data(pool_symbol='wBTC-USDC', hours=720, force_refresh=False, bucket='1h'):
+    """
+    获取池子数据（带缓存, 每个 (池子, 窗口, 时间桶) 单独计算有效期）
+    
+    缓存过期后的一段时间内先返回旧数据并在后台刷新; 缓存中没有时, 同一个键的并发请求只读取一次数据库,
+    其余请求等待这次读取的结果 (见 TTLCache.get_or_compute)。
+    返回的数据包含按策略配置计算好的净值曲线 (net_value_curve), 同一份数据只计算一次。
     
     Args:
         pool_symbol: 池子符号
         hours: 获取最近N小时数据
         force_refresh: 强制刷新缓存
+        bucket: 时间桶, 1h 为原始小时快照, 4h/1d/1w 从数据库端的汇总读取
     """
-    global _cache
-    
-    cache_key = f"{pool_symbol}_{hours}"
-    
-    # 检查缓存（5分钟有效期）
-    if not force_refresh and _cache.get('last_fetch'):
-        age = (datetime.now() - _cache['last_fetch']).total_seconds()
-        if age < 300 and cache_key in _cache.get('data', {}):
-            logger.info(f"✅ Using cache (age: {age:.0f}s)")
-            return _cache['data'][cache_key]
-    
-    # 从数据库获取
-    logger.info(f"📊 Fetching from database: {pool_symbol}, {hours}h")
+    return _cache.get_or_compute(
+        (pool_symbol, hours, bucket),
+        partial(_load_pool_data, pool_symbol, hours, bucket),
+        force=force_refresh
+    )
+
+
+def _load_pool_data(pool_symbol, hours, bucket):
+    """从数据库读取池子数据并计算净值曲线"""
+    logger.info(f"📊 Fetching from database: {pool_symbol}, {hours}h, bucket {bucket}")
     
-    historical_data = db.get_pool_snapshots(pool_symbol, hours)
-    strategy_allocations = db.get_strategy_executions(pool_symbol, hours)
+    # 快照以列式 numpy 数组读取, 直接交给分析引擎计算; 快照与策略记录并发读取
+    loads = {'strategy_allocations': partial(db.get_strategy_executions, pool_symbol, hours)}
+    if bucket == '1h':
+        loads['historical_data'] = partial(db.get_pool_snapshots_columnar, pool_symbol, hours)
+    else:
+        loads['historical_data'] = partial(db.get_pool_snapshots_bucketed, pool_symbol, hours, bucket)
+        loads['market_data'] = partial(db.get_pool_snapshots_columnar, pool_symbol, hours,
+                                       limit=MARKET_SNAPSHOT_HOURS, latest=True)
+    fetched = fetch_concurrently(loads)
+    historical_data = fetched['historical_data']
+    strategy_allocations = fetched['strategy_allocations']
+    if 'market_data' in fetched:
+        market_data = fetched['market_data']
+    else:
+        market_data = {c: v[-MARKET_SNAPSHOT_HOURS:] for c, v in historical_data.items()}
     
     # 如果没有策略数据，使用默认50-50配置
-    if not strategy_allocations and historical_data:
+    if not strategy_allocations and snapshot_count(historical_data):
         logger.warning("⚠️  No strategy data found, using 50-50 default")
         strategy_allocations = [{
-            'timestamp': historical_data[0]['timestamp'],
+            'timestamp': int(historical_data['timestamp'][0]),
             'aave_wbtc_pool': 0.5,
             'uniswap_v3_lp': 0.5
         }]
     
     result = {
         'historical_data': historical_data,
-        'strategy_allocations': strategy_allocations
+        'market_data': market_data,
+        'strategy_allocations': strategy_allocations,
+        'bucket': bucket,
+        'net_value_curve': analytics.calculate_net_value_curve(historical_data, strategy_allocations)
+        if snapshot_count(historical_data) else None
     }
     
-    # 更新缓存
-    if _cache.get('data') is None:
-        _cache['data'] = {}
-    _cache['data'][cache_key] = result
-    _cache['last_fetch'] = datetime.now()
-    
-    logger.info(f"✅ Data loaded: {len(historical_data)} snapshots, {len(strategy_allocations)} strategies")
+    logger.info(f"✅ Data loaded: {snapshot_count(historical_data)} snapshots, {len(strategy_allocations)} strategies")
     return result
 
 
@@ -93,9 +148,18 @@ def health_check():
     """
     健康检查
     GET /api/v1/analytics/health
+    
+    统计数据来自数据库目录估算值并短暂缓存 (见 DatabaseManager.get_database_stats), 探针频繁调用也不会扫描数据表
     """
     try:
         stats = db.get_database_stats()
+        if stats.get('status') != 'ok':
+            return jsonify({
+                'success': False,
+                'status': 'unhealthy',
+                'database': 'unavailable',
+                'error': stats.get('error')
+            }), 503
         
         return jsonify({
             'success': True,
@@ -118,7 +182,9 @@ def health_check():
 def get_summary():
     """
     获取综合概览（Dashboard 主要数据）
-    GET /api/v1/analytics/summary?pool=wBTC-USDC&refresh=false
+    GET /api/v1/analytics/summary?pool=wBTC-USDC&refresh=false&bucket=1d
+    
+    bucket: 净值与指标所用的时间桶 (1h/4h/1d/1w), 默认按一年窗口自动选择
     
     返回：
         - 性能指标（净值、收益率、回撤等）
@@ -128,26 +194,27 @@ def get_summary():
     try:
         pool_symbol = request.args.get('pool', 'wBTC-USDC')
         force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        try:
+            bucket = resolve_bucket(8760, request.args.get('bucket'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         # 获取数据
-        data = get_pool_data(pool_symbol, hours=8760, force_refresh=force_refresh)
+        data = get_pool_data(pool_symbol, hours=8760, force_refresh=force_refresh, bucket=bucket)
         
-        if not data['historical_data']:
+        if not snapshot_count(data['historical_data']):
             return jsonify({
                 'success': False,
                 'error': 'No historical data available'
             }), 404
         
-        # 计算净值曲线
-        curve_result = analytics.calculate_net_value_curve(
-            data['historical_data'],
-            data['strategy_allocations']
-        )
+        # 净值曲线 (随数据一起计算并缓存)
+        curve_result = data['net_value_curve']
         
         # 计算性能指标
         metrics = analytics.calculate_performance_metrics(
             curve_result['strategy_curve'],
-            curve_result['timestamps'],
+            data['historical_data']['timestamp'],
             period='ALL'
         )
         
@@ -156,9 +223,14 @@ def get_summary():
             data['strategy_allocations']
         )
         
-        # 当前市场数据
-        latest_market = data['historical_data'][-1]
-        prev_24h = data['historical_data'][-25] if len(data['historical_data']) >= 25 else latest_market
+        # 当前市场数据 (原始小时快照)
+        market_points = snapshot_count(data['market_data'])
+        latest_market = snapshot_row(data['market_data'], -1)
+        prev_24h = snapshot_row(data['market_data'], -25) if market_points >= 25 else latest_market
+        
+        # 降采样时 samples 记录每个桶包含的小时快照数
+        num_snapshots = int(data['historical_data']['samples'].sum()) if 'samples' in data['historical_data'] \
+            else snapshot_count(data['historical_data'])
         
         price_change_24h = 0
         if prev_24h.get('wbtc_price', 0) > 0:
@@ -205,7 +277,9 @@ def get_summary():
                 'lp_apy': latest_market.get('univ3_lp_apy', 0) * 24 * 365 * 100
             },
             'data_stats': {
-                'total_snapshots': len(data['historical_data']),
+                'total_snapshots': num_snapshots,
+                'data_points': snapshot_count(data['historical_data']),
+                'bucket': data['bucket'],
                 'strategy_points': len(data['strategy_allocations']),
                 'start_date': metrics.get('start_date'),
                 'end_date': metrics.get('end_date')
@@ -230,7 +304,9 @@ def get_summary():
 def get_net_value_curve():
     """
     获取净值曲线数据
-    GET /api/v1/analytics/net-value-curve?pool=wBTC-USDC&hours=720
+    GET /api/v1/analytics/net-value-curve?pool=wBTC-USDC&hours=720&bucket=4h
+    
+    bucket: 时间桶 (1h/4h/1d/1w), 默认按窗口长度自动选择
     
     返回：
         - strategy_curve: AI策略净值
@@ -242,19 +318,20 @@ def get_net_value_curve():
         pool_symbol = request.args.get('pool', 'wBTC-USDC')
         hours = int(request.args.get('hours', 720))
         force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        try:
+            bucket = resolve_bucket(hours, request.args.get('bucket'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        data = get_pool_data(pool_symbol, hours, force_refresh)
+        data = get_pool_data(pool_symbol, hours, force_refresh, bucket=bucket)
         
-        if not data['historical_data']:
+        if not snapshot_count(data['historical_data']):
             return jsonify({
                 'success': False,
                 'error': 'No historical data available'
             }), 404
         
-        result = analytics.calculate_net_value_curve(
-            data['historical_data'],
-            data['strategy_allocations']
-        )
+        result = data['net_value_curve']
         
         return jsonify({
             'success': True,
@@ -262,6 +339,7 @@ def get_net_value_curve():
             'meta': {
                 'pool_symbol': pool_symbol,
                 'data_points': len(result['timestamps']),
+                'bucket': bucket,
                 'generated_at': datetime.now().isoformat()
             }
         })
@@ -306,24 +384,21 @@ def get_performance_metrics():
         
         # 获取数据
         hours = 8760 if period == 'ALL' else 720
-        data = get_pool_data(pool_symbol, hours, force_refresh)
+        data = get_pool_data(pool_symbol, hours, force_refresh, bucket=resolve_bucket(hours))
         
-        if not data['historical_data']:
+        if not snapshot_count(data['historical_data']):
             return jsonify({
                 'success': False,
                 'error': 'Insufficient data'
             }), 404
         
-        # 计算净值
-        curve_result = analytics.calculate_net_value_curve(
-            data['historical_data'],
-            data['strategy_allocations']
-        )
+        # 净值 (随数据一起计算并缓存)
+        curve_result = data['net_value_curve']
         
         # 计算指标
         metrics = analytics.calculate_performance_metrics(
             curve_result['strategy_curve'],
-            curve_result['timestamps'],
+            data['historical_data']['timestamp'],
             period=period
         )
         
@@ -436,10 +511,7 @@ def run_simulator():
         )
         
         # 运行AI策略（对比）
-        ai_result = analytics.calculate_net_value_curve(
-            data['historical_data'],
-            data['strategy_allocations']
-        )
+        ai_result = data['net_value_curve']
         
         # 对比分析
         comparison = {
@@ -476,14 +548,23 @@ def refresh_cache():
     """
     强制刷新缓存
     POST /api/v1/analytics/refresh-cache
+    
+    Query参数:
+        pool: 只清除该池子的缓存 (默认: 全部)
     """
     try:
-        global _cache
-        _cache = {'last_fetch': None, 'data': {}}
+        pool_symbol = request.args.get('pool')
+        if pool_symbol:
+            removed = _cache.invalidate(lambda key: key[0] == pool_symbol)
+            message = f'Cache cleared for {pool_symbol}'
+        else:
+            removed = _cache.clear()
+            message = 'Cache cleared successfully'
         
         return jsonify({
             'success': True,
-            'message': 'Cache cleared successfully',
+            'message': message,
+            'entries_removed': removed,
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -493,6 +574,19 @@ def refresh_cache():
         }), 500
 
 
+@app.route('/api/v1/analytics/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    数据缓存统计: 条目数、占用字节、命中/未命中/淘汰/过期次数
+    GET /api/v1/analytics/cache-stats
+    """
+    return jsonify({
+        'success': True,
+        'data': _cache.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
 # ==================== 错误处理 ====================
 
 @app.errorhandler(404)
@@ -507,7 +601,8 @@ def not_found(error):
             'GET  /api/v1/analytics/performance',
             'GET  /api/v1/analytics/allocation-history',
             'POST /api/v1/analytics/simulator',
-            'POST /api/v1/analytics/refresh-cache'
+            'POST /api/v1/analytics/refresh-cache',
+            'GET  /api/v1/analytics/cache-stats'
         ]
     }), 404
 
@@ -541,7 +636,8 @@ if __name__ == '__main__':
     print(f"  GET  http://localhost:{port}/api/v1/analytics/performance?period=ALL")
     print(f"  GET  http://localhost:{port}/api/v1/analytics/allocation-history")
     print(f"  POST http://localhost:{port}/api/v1/analytics/simulator")
-    print(f"  POST http://localhost:{port}/api/v1/analytics/refresh-cache")
+    print(f"  POST http://localhost:{port}/api/v1/analytics/refresh-cache?pool=wBTC-USDC")
+    print(f"  GET  http://localhost:{port}/api/v1/analytics/cache-stats")
     print("="*70 + "\n")
     
     # 预热：检查数据库连接
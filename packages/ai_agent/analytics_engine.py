@@ -5,15 +5,15 @@ DeFi策略量化分析引擎（可独立运行服务）
 
 import os
 import logging
-from datetime import datetime, timedelta
+from itertools import accumulate
 from typing import Dict, List
 
 import numpy as np
-import pandas as pd
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
 from dotenv import load_dotenv
 
+# pandas 只在计算时导入; FastAPI / pydantic 只在独立运行本服务时才需要 (见 create_app),
+# analytics_api 等只使用 StrategyAnalytics 的调用方不必付出这些导入开销
+
 # === 加载环境变量 ===
 load_dotenv()
 
@@ -28,134 +28,205 @@ logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(m
 logger = logging.getLogger("analytics_engine")
 
 
-# ================= 核心分析类 =================
+# ================= 列式快照 =================
+# 数据库直接返回 {列名: numpy 数组} 的列式快照 (见 DatabaseManager.get_pool_snapshots_columnar),
+# timestamp 为 int64 的 Unix 秒 (UTC)。净值和指标计算都在数组上完成, 不再经过逐行 dict 和 DataFrame。
+# 旧的 List[Dict] 输入仍然支持, 会先转换成同样的列式结构。
 
-class StrategyAnalytics:
-    """策略量化分析核心类"""
+SNAPSHOT_NUMERIC_COLUMNS = ('wbtc_price', 'volume_usd', 'liquidity', 'tvl_usd',
+                            'aave_wbtc_apy', 'univ3_lp_apy', 'gas_cost_usd')
 
-    def __init__(self, initial_capital: float = 100000.0):
-        self.initial_capital = initial_capital
 
-    def calculate_net_value_curve(
-        self,
-        historical_data: List[Dict],
-        strategy_allocations: List[Dict]
-    ) -> Dict:
-        """计算策略净值曲线 vs 持有不动基准"""
-        df = pd.DataFrame(historical_data)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp").reset_index(drop=True)
+def to_epoch_seconds(timestamps) -> np.ndarray:
+    """时间戳 (int64 秒 / ISO 字符串 / datetime) 转成 int64 Unix 秒, 不带时区的按 UTC 处理"""
+    values = np.asarray(timestamps)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    import pandas as pd
+
+    parsed = pd.to_datetime(list(timestamps), utc=True).tz_convert(None)
+    return np.asarray(parsed, dtype="datetime64[s]").astype(np.int64)
 
-        alloc_df = pd.DataFrame(strategy_allocations)
-        alloc_df["timestamp"] = pd.to_datetime(alloc_df["timestamp"])
 
-        df = pd.merge_asof(
-            df.sort_values("timestamp"),
-            alloc_df.sort_values("timestamp"),
-            on="timestamp",
-            direction="backward"
-        ).fillna(method="ffill")
+def format_timestamps(epoch_seconds: np.ndarray, sep: str = "T") -> List[str]:
+    """int64 Unix 秒格式化为 YYYY-MM-DD{sep}HH:MM:SS 字符串列表"""
+    formatted = np.datetime_as_string(np.asarray(epoch_seconds, dtype="datetime64[s]"), unit="s")
+    if sep != "T":
+        formatted = np.char.replace(formatted, "T", sep)
+    return formatted.tolist()
 
-        strategy_nav = [self.initial_capital]
-        baseline_nav = [self.initial_capital]
 
-        initial_wbtc_amount = self.initial_capital / df.iloc[0]["wbtc_price"]
-        baseline_wbtc_holdings = initial_wbtc_amount
+def snapshot_columns(historical_data) -> Dict[str, np.ndarray]:
+    """把快照统一成按时间升序的列式结构; 已经是列式的直接返回"""
+    if isinstance(historical_data, dict):
+        return historical_data
 
-        for i in range(1, len(df)):
-            row = df.iloc[i]
-            prev_row = df.iloc[i - 1]
+    timestamps = to_epoch_seconds([row["timestamp"] for row in historical_data])
+    order = np.argsort(timestamps, kind="stable")
+    columns = {"timestamp": timestamps[order]}
+    for column in SNAPSHOT_NUMERIC_COLUMNS:
+        values = np.array([row.get(column) or 0.0 for row in historical_data], dtype=np.float64)
+        columns[column] = values[order]
+    return columns
 
-            prev_nav = strategy_nav[-1]
 
-            aave_alloc = row.get("aave_wbtc_pool", 0.5)
-            lp_alloc = row.get("uniswap_v3_lp", 0.5)
+def snapshot_count(columns: Dict[str, np.ndarray]) -> int:
+    return len(columns["timestamp"])
 
-            aave_value = prev_nav * aave_alloc
-            lp_value = prev_nav * lp_alloc
 
-            aave_return = aave_value * row["aave_wbtc_apy"]
+def snapshot_row(columns: Dict[str, np.ndarray], index: int) -> Dict:
+    """取出第 index 行, 格式与 get_pool_snapshots 返回的行相同 (timestamp 为 ISO 字符串)"""
+    row = {name: float(values[index]) for name, values in columns.items() if name != "timestamp"}
+    row["timestamp"] = format_timestamps(columns["timestamp"][[index]])[0]
+    return row
 
-            price_change_pct = (row["wbtc_price"] - prev_row["wbtc_price"]) / prev_row["wbtc_price"]
-            fee_income = lp_value * row["univ3_lp_apy"]
-            impermanent_loss_pct = self._calculate_impermanent_loss(price_change_pct)
-            impermanent_loss = lp_value * impermanent_loss_pct
 
-            lp_return = fee_income - impermanent_loss
+def _allocation_arrays(strategy_allocations: List[Dict], snapshot_timestamps: np.ndarray):
+    """
+    每个快照时刻生效的配置: 取时间戳不晚于该快照的最后一条配置 (等价于 merge_asof backward),
+    缺失的值沿用上一个快照的配置, 第一条配置之前按 50/50 处理
+    """
+    num_rows = len(snapshot_timestamps)
+    if not strategy_allocations:
+        return np.full(num_rows, 0.5), np.full(num_rows, 0.5)
 
-            gas_cost = row.get("gas_cost_usd", 0)
+    alloc_timestamps = to_epoch_seconds([a["timestamp"] for a in strategy_allocations])
+    order = np.argsort(alloc_timestamps, kind="stable")
+    positions = np.searchsorted(alloc_timestamps[order], snapshot_timestamps, side="right") - 1
 
-            new_nav = prev_nav + aave_return + lp_return - gas_cost
-            strategy_nav.append(new_nav)
+    result = []
+    for key in ("aave_wbtc_pool", "uniswap_v3_lp"):
+        values = np.array([np.nan if a.get(key) is None else float(a[key]) for a in strategy_allocations])[order]
+        mapped = np.where(positions >= 0, values[np.maximum(positions, 0)], np.nan)
+        # 前向填充
+        last_valid = np.maximum.accumulate(np.where(np.isnan(mapped), 0, np.arange(num_rows)))
+        mapped = mapped[last_valid]
+        result.append(np.where(np.isnan(mapped), 0.5, mapped))
+    return result[0], result[1]
 
-            baseline_value = baseline_wbtc_holdings * row["wbtc_price"]
-            baseline_nav.append(baseline_value)
+
+# ================= 核心分析类 =================
+
+class StrategyAnalytics:
+    """策略量化分析核心类"""
+
+    def __init__(self, initial_capital: float = 100000.0):
+        self.initial_capital = initial_capital
+
+    def net_value_arrays(self, historical_data, strategy_allocations: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        计算策略与持有不动基准的净值数组。
+        historical_data 可以是列式快照或 List[Dict]; 返回 timestamps (int64 秒) 与 strategy_nav / baseline_nav。
+
+        数据库降采样的快照带有 wbtc_price_open (桶内第一个价格), 此时第一个桶也计入收益:
+        净值从第一个桶的开盘价起算, 每个点都是该桶结束时的净值。
+        """
+        columns = snapshot_columns(historical_data)
+        timestamps = columns["timestamp"]
+        price = columns["wbtc_price"]
+        aave_alloc, lp_alloc = _allocation_arrays(strategy_allocations, timestamps)
+
+        opening = columns.get("wbtc_price_open")
+        if opening is None:
+            first, prev_price, anchor_price = 1, price[:-1], price[0]
+        else:
+            first, prev_price, anchor_price = 0, np.concatenate([opening[:1], price[:-1]]), opening[0]
+
+        # 每一步的收益参数与无常损失都可以整列计算, 只有净值本身的递推是逐步的
+        price_change_pct = (price[first:] - prev_price) / prev_price
+        impermanent_loss_pct = self._calculate_impermanent_loss(price_change_pct)
+        steps = zip(aave_alloc[first:].tolist(), lp_alloc[first:].tolist(),
+                    columns["aave_wbtc_apy"][first:].tolist(), columns["univ3_lp_apy"][first:].tolist(),
+                    impermanent_loss_pct.tolist(), columns["gas_cost_usd"][first:].tolist())
+
+        def step(prev_nav, factors):
+            aave, lp, aave_apy, lp_apy, il_pct, gas_cost = factors
+            lp_value = prev_nav * lp
+            lp_return = lp_value * lp_apy - lp_value * il_pct
+            return prev_nav + prev_nav * aave * aave_apy + lp_return - gas_cost
+
+        strategy_nav = np.fromiter(accumulate(steps, step, initial=self.initial_capital),
+                                   dtype=np.float64, count=len(timestamps) + 1 - first)[1 - first:]
+
+        baseline_nav = self.initial_capital / anchor_price * price
+        if first:
+            baseline_nav[0] = self.initial_capital
+
+        return {
+            "timestamps": timestamps,
+            "strategy_nav": strategy_nav,
+            "baseline_nav": baseline_nav,
+        }
+
+    def calculate_net_value_curve(self, historical_data, strategy_allocations: List[Dict]) -> Dict:
+        """计算策略净值曲线 vs 持有不动基准 (结果可直接序列化为 JSON)"""
+        arrays = self.net_value_arrays(historical_data, strategy_allocations)
+        strategy_nav, baseline_nav = arrays["strategy_nav"], arrays["baseline_nav"]
 
         strategy_return = (strategy_nav[-1] - self.initial_capital) / self.initial_capital
         baseline_return = (baseline_nav[-1] - self.initial_capital) / self.initial_capital
         excess_return = strategy_return - baseline_return
 
         return {
-            "strategy_curve": strategy_nav,
-            "baseline_curve": baseline_nav,
-            "timestamps": df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist(),
-            "excess_return": excess_return,
-            "strategy_final_return": strategy_return,
-            "baseline_final_return": baseline_return,
+            "strategy_curve": strategy_nav.tolist(),
+            "baseline_curve": baseline_nav.tolist(),
+            "timestamps": format_timestamps(arrays["timestamps"], sep=" "),
+            "excess_return": float(excess_return),
+            "strategy_final_return": float(strategy_return),
+            "baseline_final_return": float(baseline_return),
         }
 
-    def _calculate_impermanent_loss(self, price_change_pct: float) -> float:
-        """计算无常损失百分比"""
-        price_ratio = 1 + price_change_pct
-        if price_ratio <= 0:
-            return 0
-        il = 2 * np.sqrt(price_ratio) / (1 + price_ratio) - 1
-        return abs(il)
+    def _calculate_impermanent_loss(self, price_change_pct):
+        """计算无常损失百分比 (标量或数组)"""
+        price_ratio = 1 + np.asarray(price_change_pct, dtype=np.float64)
+        valid = price_ratio > 0
+        safe_ratio = np.where(valid, price_ratio, 1.0)
+        il = np.where(valid, np.abs(2 * np.sqrt(safe_ratio) / (1 + safe_ratio) - 1), 0.0)
+        return il if il.ndim else float(il)
 
     def calculate_performance_metrics(
         self,
-        net_value_curve: List[float],
-        timestamps: List[str],
+        net_value_curve,
+        timestamps,
         period: str = "ALL"
     ) -> Dict:
-        """计算核心收益指标"""
-        df = pd.DataFrame({
-            "timestamp": pd.to_datetime(timestamps),
-            "nav": net_value_curve,
-        })
-
-        if period != "ALL":
-            end_time = df["timestamp"].max()
-            if period == "1D":
-                start_time = end_time - timedelta(days=1)
-            elif period == "7D":
-                start_time = end_time - timedelta(days=7)
-            elif period == "30D":
-                start_time = end_time - timedelta(days=30)
-            df = df[df["timestamp"] >= start_time].reset_index(drop=True)
-
-        if len(df) < 2:
+        """计算核心收益指标; timestamps 可以是 int64 秒数组或时间字符串列表"""
+        nav = np.asarray(net_value_curve, dtype=np.float64)
+        seconds = to_epoch_seconds(timestamps)
+
+        if period != "ALL" and len(seconds):
+            window_days = {"1D": 1, "7D": 7, "30D": 30}[period]
+            keep = seconds >= seconds.max() - window_days * 86400
+            nav, seconds = nav[keep], seconds[keep]
+
+        if len(nav) < 2:
             return self._empty_metrics()
 
-        df["returns"] = df["nav"].pct_change().fillna(0)
-        period_return = (df["nav"].iloc[-1] - df["nav"].iloc[0]) / df["nav"].iloc[0]
+        returns = np.zeros_like(nav)
+        returns[1:] = nav[1:] / nav[:-1] - 1
+        period_return = (nav[-1] - nav[0]) / nav[0]
 
-        hours = (df["timestamp"].iloc[-1] - df["timestamp"].iloc[0]).total_seconds() / 3600
+        hours = (seconds[-1] - seconds[0]) / 3600
         years = hours / (24 * 365)
         annualized_return = (1 + period_return) ** (1 / years) - 1 if years > 0 else 0
 
-        df["cummax"] = df["nav"].cummax()
-        df["drawdown"] = (df["nav"] - df["cummax"]) / df["cummax"]
-        max_drawdown = df["drawdown"].min()
+        running_max = np.maximum.accumulate(nav)
+        max_drawdown = ((nav - running_max) / running_max).min()
 
-        volatility = df["returns"].std() * np.sqrt(24 * 365)
+        # 按采样间隔年化: 小时数据为 24 * 365, 降采样后的 4h / 1d 序列相应减少
+        step_seconds = float(np.median(np.diff(seconds)))
+        periods_per_year = 365 * 24 * 3600 / step_seconds if step_seconds > 0 else 24 * 365
+        volatility = returns.std(ddof=1) * np.sqrt(periods_per_year)
 
         risk_free_rate = 0.03
         excess_returns = annualized_return - risk_free_rate
         sharpe_ratio = excess_returns / volatility if volatility > 0 else 0
 
-        win_rate = (df["returns"] > 0).sum() / len(df["returns"]) if len(df) > 0 else 0
+        win_rate = (returns > 0).sum() / len(returns)
 
+        start_date, end_date = format_timestamps(seconds[[0, -1]])
         return {
             "annualized_return": float(annualized_return),
             "max_drawdown": float(max_drawdown),
@@ -164,8 +235,8 @@ class StrategyAnalytics:
             "win_rate": float(win_rate),
             "period_return": float(period_return),
             "period": period,
-            "start_date": df["timestamp"].iloc[0].isoformat(),
-            "end_date": df["timestamp"].iloc[-1].isoformat(),
+            "start_date": start_date,
+            "end_date": end_date,
         }
 
     def _empty_metrics(self) -> Dict:
@@ -189,6 +260,8 @@ class StrategyAnalytics:
                 "allocation_history": []
             }
 
+        import pandas as pd
+
         df = pd.DataFrame(strategy_allocations)
 
         # 计算平均配置
@@ -228,7 +301,7 @@ class StrategyAnalytics:
 
     def run_backtest_simulator(
         self,
-        historical_data: List[Dict],
+        historical_data,
         user_allocations: List[Dict]
     ) -> Dict:
         """运行回测模拟器，使用用户自定义的配置策略"""
@@ -237,30 +310,44 @@ class StrategyAnalytics:
 
 # ================= FastAPI 封装层 =================
 
-app = FastAPI(title="DeFi Strategy Analytics Engine", version="1.0")
+def create_app():
+    """创建独立运行的 FastAPI 应用"""
+    from fastapi import FastAPI, HTTPException
+    from pydantic import BaseModel
 
+    app = FastAPI(title="DeFi Strategy Analytics Engine", version="1.0")
 
-class AnalyticsRequest(BaseModel):
-    historical_data: List[Dict]
-    strategy_allocations: List[Dict]
-    period: str = "ALL"
+    class AnalyticsRequest(BaseModel):
+        historical_data: List[Dict]
+        strategy_allocations: List[Dict]
+        period: str = "ALL"
 
+    @app.post("/analyze")
+    def analyze_strategy(req: AnalyticsRequest):
+        try:
+            engine = StrategyAnalytics()
+            result = engine.calculate_net_value_curve(req.historical_data, req.strategy_allocations)
+            metrics = engine.calculate_performance_metrics(result["strategy_curve"], result["timestamps"], req.period)
 
-@app.post("/analyze")
-def analyze_strategy(req: AnalyticsRequest):
-    try:
-        engine = StrategyAnalytics()
-        result = engine.calculate_net_value_curve(req.historical_data, req.strategy_allocations)
-        metrics = engine.calculate_performance_metrics(result["strategy_curve"], result["timestamps"], req.period)
+            return {
+                "success": True,
+                "analytics": result,
+                "metrics": metrics,
+            }
+        except Exception as e:
+            logger.exception("Analysis failed")
+            raise HTTPException(status_code=500, detail=str(e))
 
-        return {
-            "success": True,
-            "analytics": result,
-            "metrics": metrics,
-        }
-    except Exception as e:
-        logger.exception("Analysis failed")
-        raise HTTPException(status_code=500, detail=str(e))
+    return app
+
+
+def __getattr__(name):
+    # uvicorn 通过 "analytics_engine:app" 取属性时才创建应用
+    if name == "app":
+        app = create_app()
+        globals()["app"] = app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ================= 主入口 =================
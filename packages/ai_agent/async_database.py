@@ -0,0 +1,330 @@
+"""
+asyncio 版本的数据库操作
+
+async 服务 (如 agent 的 I/O 循环) 可以用 AsyncDatabaseManager 同时发出多个查询, 不必逐个阻塞线程等待往返:
+
+    async with AsyncDatabaseManager() as db:
+        data = await db.fetch_pool_data('wBTC-USDC', hours=720)   # 快照与策略记录并发读取
+
+两种实现, 方法名、参数和返回格式都与 DatabaseManager 相同 (只是需要 await):
+    - AsyncpgStorage: DATABASE_URL 为 PostgreSQL 且安装了 asyncpg 时使用, 连接池大小 ASYNC_DB_POOL_SIZE。
+      快照读写、策略记录读写和指标缓存直接用 asyncpg 执行, 其余操作 (统计、降采样、汇总刷新) 交给线程适配
+    - ThreadedAsyncStorage: 其他情况 (SQLite 后端或没有 asyncpg), 在有界线程池中调用同步后端,
+      并发度为线程数
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from database import (DATABASE_SSLMODE, DATABASE_URL, PostgresStorage, ROLLUP_BUCKETS, _ROLLUP_REFRESH_SQL,
+                      get_storage_backend)
+from storage import (DEFAULT_FETCH_SIZE, SNAPSHOT_BUCKETS, SNAPSHOT_NUMERIC_COLUMNS, StorageBackend,
+                     empty_snapshot_columns, rows_to_columns)
+
+try:
+    import asyncpg
+except ImportError:  # 可选依赖, 没有时退回线程适配
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# asyncpg 连接池 / 线程适配的线程池大小
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))
+# get_pool_data 在降采样时单独读取的最新小时快照数 (与 analytics_api.MARKET_SNAPSHOT_HOURS 相同)
+MARKET_SNAPSHOT_HOURS = 25
+
+
+def _to_positional(sql: str, params: Dict):
+    """把 psycopg2 的 %(name)s 占位符换成 asyncpg 的 $n, 返回 (sql, 参数列表)"""
+    names: List[str] = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return re.sub(r"%\((\w+)\)s", replace, sql), [params[name] for name in names]
+
+
+def _as_datetime(value) -> datetime:
+    """asyncpg 的 TIMESTAMP 参数只接受 datetime; 字符串按 ISO 解析, 与 PostgreSQL 一样忽略时区"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value.replace(tzinfo=None)
+
+
+class ThreadedAsyncStorage:
+    """在有界线程池中执行同步存储后端的方法: 任意后端方法都可以 await 调用"""
+
+    def __init__(self, backend: StorageBackend, max_workers: int = ASYNC_POOL_SIZE):
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+        return call
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class AsyncpgStorage(ThreadedAsyncStorage):
+    """asyncpg 连接池实现的 PostgreSQL 存储; 未在这里实现的方法由 ThreadedAsyncStorage 转给 PostgresStorage"""
+
+    def __init__(self, pool, max_workers: int = ASYNC_POOL_SIZE):
+        super().__init__(PostgresStorage(), max_workers)
+        self.pool = pool
+
+    @classmethod
+    async def create(cls, dsn: str = DATABASE_URL, pool_size: int = ASYNC_POOL_SIZE) -> "AsyncpgStorage":
+        pool = await asyncpg.create_pool(dsn, min_size=1, max_size=pool_size, ssl=DATABASE_SSLMODE)
+        return cls(pool, pool_size)
+
+    async def close(self):
+        await self.pool.close()
+        await super().close()
+
+    # ========== 池子快照 ==========
+    async def insert_pool_snapshots(self, snapshots: List[Dict]) -> int:
+        """批量插入池子快照, 并在同一事务中重算受影响的汇总桶"""
+        if not snapshots:
+            return 0
+        columns = ('pool_symbol', 'timestamp') + SNAPSHOT_NUMERIC_COLUMNS
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in SNAPSHOT_NUMERIC_COLUMNS)
+        sql = f"""
+        INSERT INTO pool_snapshots ({", ".join(columns)})
+        VALUES ({", ".join(f"${i}" for i in range(1, len(columns) + 1))})
+        ON CONFLICT (pool_symbol, timestamp) DO UPDATE SET {updates}
+        """
+        values = [
+            (s.get("pool_symbol"), _as_datetime(s.get("timestamp")),
+             *(float(s.get(c, 0)) for c in SNAPSHOT_NUMERIC_COLUMNS))
+            for s in snapshots
+        ]
+        ranges = {}
+        for pool_symbol, timestamp, *_ in values:
+            low, high = ranges.get(pool_symbol, (timestamp, timestamp))
+            ranges[pool_symbol] = (min(low, timestamp), max(high, timestamp))
+
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(sql, values)
+                    if await conn.fetchval("SELECT to_regclass('pool_snapshot_rollups') IS NOT NULL"):
+                        for pool_symbol, (start, end) in ranges.items():
+                            for bucket in ROLLUP_BUCKETS:
+                                await conn.execute(*_to_positional(_ROLLUP_REFRESH_SQL, {
+                                    'pool_symbol': pool_symbol, 'bucket': bucket,
+                                    'width': SNAPSHOT_BUCKETS[bucket], 'start': start, 'end': end,
+                                }))
+            logger.info(f"✅ Inserted/Updated {len(values)} pool snapshots")
+            return len(values)
+        except Exception as e:
+            logger.error(f"❌ Error inserting pool snapshots: {e}", exc_info=True)
+            raise
+
+    async def _fetch_snapshot_rows(self, pool_symbol: str, hours: int, limit: Optional[int], latest: bool,
+                                   epoch_timestamps: bool, fetch_size: int) -> List:
+        """在事务内用游标分批读取快照 (与 PostgresStorage._stream_pool_snapshots 相同的查询)"""
+        timestamp_expr = "EXTRACT(EPOCH FROM timestamp)::bigint" if epoch_timestamps else "timestamp"
+        numeric_exprs = ", ".join(f"COALESCE({c}, 0)::float8 AS {c}" for c in SNAPSHOT_NUMERIC_COLUMNS)
+        latest = bool(limit and latest)
+        sql = f"""
+        SELECT {timestamp_expr} AS timestamp, {numeric_exprs}
+        FROM pool_snapshots
+        WHERE pool_symbol = $1 AND timestamp >= $2
+        ORDER BY timestamp {'DESC' if latest else 'ASC'}
+        """
+        params = [pool_symbol, datetime.now() - timedelta(hours=hours)]
+        if limit:
+            sql += " LIMIT $3"
+            params.append(int(limit))
+        if latest:
+            sql = f"SELECT * FROM ({sql}) recent ORDER BY timestamp ASC"
+
+        rows = []
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(sql, *params)
+                while True:
+                    batch = await cursor.fetch(fetch_size)
+                    if not batch:
+                        break
+                    rows.extend(tuple(r) for r in batch)
+        return rows
+
+    async def get_pool_snapshots_columnar(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                                          fetch_size: int = DEFAULT_FETCH_SIZE,
+                                          latest: bool = False) -> Dict[str, np.ndarray]:
+        """列式读取快照, 格式与 DatabaseManager.get_pool_snapshots_columnar 相同; 出错时返回各列为空数组"""
+        columns = ('timestamp',) + SNAPSHOT_NUMERIC_COLUMNS
+        try:
+            rows = await self._fetch_snapshot_rows(pool_symbol, hours, limit, latest, True, fetch_size)
+            logger.info(f"📊 Retrieved {len(rows)} snapshots for {pool_symbol} (columnar, async)")
+            return rows_to_columns(rows, columns)
+        except Exception as e:
+            logger.error(f"Error getting columnar pool snapshots: {e}", exc_info=True)
+            return empty_snapshot_columns(columns)
+
+    async def get_pool_snapshots(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None) -> List[Dict]:
+        """获取池子历史快照（数值为 float，timestamp 为 ISO 字符串）"""
+        try:
+            rows = await self._fetch_snapshot_rows(pool_symbol, hours, limit, False, False, DEFAULT_FETCH_SIZE)
+            snapshots = [
+                {'pool_symbol': pool_symbol, 'timestamp': timestamp.isoformat(),
+                 **dict(zip(SNAPSHOT_NUMERIC_COLUMNS, values))}
+                for timestamp, *values in rows
+            ]
+            logger.info(f"📊 Retrieved {len(snapshots)} snapshots for {pool_symbol} (async)")
+            return snapshots
+        except Exception as e:
+            logger.error(f"Error getting pool snapshots: {e}", exc_info=True)
+            return []
+
+    # ========== 策略执行 ==========
+    async def insert_strategy_execution(self, execution: Dict) -> Optional[int]:
+        """插入策略执行记录"""
+        sql = """
+        INSERT INTO strategy_executions (
+            pool_symbol, timestamp, aave_wbtc_pool, uniswap_v3_lp, tx_hash,
+            model_confidence, safety_bounds, additional_info
+        )
+        VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb, $8::jsonb)
+        RETURNING id
+        """
+        try:
+            record_id = await self.pool.fetchval(
+                sql, execution["pool_symbol"], _as_datetime(execution["timestamp"]),
+                execution["aave_wbtc_pool"], execution["uniswap_v3_lp"],
+                execution.get("tx_hash"), execution.get("model_confidence"),
+                json.dumps(execution.get("safety_bounds", {})), json.dumps(execution.get("additional_info", {})),
+            )
+            logger.info(f"✅ Logged strategy execution (ID={record_id})")
+            return record_id
+        except Exception as e:
+            logger.error(f"❌ Error inserting strategy execution: {e}", exc_info=True)
+            return None
+
+    async def get_strategy_executions(self, pool_symbol: str, hours: int = 720) -> List[Dict]:
+        """获取策略执行历史 (JSONB 列解析成 dict, 与 psycopg2 返回的一致)"""
+        sql = """
+        SELECT * FROM strategy_executions
+        WHERE pool_symbol = $1 AND timestamp >= $2
+        ORDER BY timestamp DESC
+        """
+        try:
+            rows = [dict(r) for r in await self.pool.fetch(sql, pool_symbol, datetime.now() - timedelta(hours=hours))]
+            for row in rows:
+                for key in ("safety_bounds", "additional_info"):
+                    if isinstance(row.get(key), str):
+                        row[key] = json.loads(row[key])
+            logger.info(f"📈 Retrieved {len(rows)} strategy executions for {pool_symbol} (async)")
+            return rows
+        except Exception as e:
+            logger.error(f"❌ Error getting strategy executions: {e}", exc_info=True)
+            return []
+
+    # ========== 缓存指标 ==========
+    async def cache_performance_metrics(self, pool_symbol: str, period: str, metrics: Dict):
+        """缓存性能指标"""
+        sql = """
+        INSERT INTO performance_cache (pool_symbol, period, metrics, calculated_at)
+        VALUES ($1, $2, $3::jsonb, $4)
+        ON CONFLICT (pool_symbol, period)
+        DO UPDATE SET
+            metrics = EXCLUDED.metrics,
+            calculated_at = EXCLUDED.calculated_at
+        """
+        try:
+            await self.pool.execute(sql, pool_symbol, period, json.dumps(metrics), datetime.now())
+            logger.info(f"💾 Cached performance metrics for {pool_symbol} ({period})")
+        except Exception as e:
+            logger.error(f"❌ Error caching metrics: {e}", exc_info=True)
+
+    async def get_cached_metrics(self, pool_symbol: str, period: str, max_age_minutes: int = 15) -> Optional[Dict]:
+        """获取缓存的性能指标"""
+        sql = """
+        SELECT metrics::text AS metrics, calculated_at FROM performance_cache
+        WHERE pool_symbol = $1 AND period = $2 AND calculated_at >= $3
+        """
+        try:
+            row = await self.pool.fetchrow(sql, pool_symbol, period, datetime.now() - timedelta(minutes=max_age_minutes))
+            if not row:
+                return None
+            return {"metrics": json.loads(row["metrics"]), "calculated_at": row["calculated_at"].isoformat()}
+        except Exception as e:
+            logger.error(f"❌ Error getting cached metrics: {e}", exc_info=True)
+            return None
+
+
+async def create_async_storage(backend: Optional[StorageBackend] = None, pool_size: int = ASYNC_POOL_SIZE):
+    """按同步后端选择 async 实现: PostgreSQL 且安装了 asyncpg 时用连接池, 否则用线程适配"""
+    backend = backend or get_storage_backend()
+    if isinstance(backend, PostgresStorage):
+        if asyncpg is not None:
+            return await AsyncpgStorage.create(DATABASE_URL, pool_size)
+        logger.warning("⚠️  asyncpg not installed, running PostgreSQL queries in a thread pool")
+    return ThreadedAsyncStorage(backend, pool_size)
+
+
+class AsyncDatabaseManager:
+    """
+    async 数据库操作类, 需要在 async with 中使用 (进入时建立连接池, 退出时关闭);
+    方法与 DatabaseManager 相同, 调用时需要 await。
+    """
+
+    def __init__(self, backend: Optional[StorageBackend] = None, pool_size: int = ASYNC_POOL_SIZE):
+        self._backend = backend
+        self._pool_size = pool_size
+        self.storage = None
+
+    async def __aenter__(self) -> "AsyncDatabaseManager":
+        self.storage = await create_async_storage(self._backend, self._pool_size)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.storage.close()
+        self.storage = None
+
+    def __getattr__(self, name):
+        if self.__dict__.get('storage') is None:
+            raise RuntimeError("AsyncDatabaseManager must be used inside 'async with'")
+        return getattr(self.storage, name)
+
+    async def fetch_pool_data(self, pool_symbol: str, hours: int = 720, bucket: str = '1h') -> Dict:
+        """
+        并发读取分析所需的数据: 历史快照 (bucket 不为 1h 时为降采样结果)、最新的小时快照和策略执行记录,
+        总耗时约为最慢的一个查询, 而不是各查询之和。返回 {historical_data, market_data, strategy_allocations}。
+        """
+        executions = self.get_strategy_executions(pool_symbol, hours)
+        if bucket == '1h':
+            historical_data, strategy_allocations = await asyncio.gather(
+                self.get_pool_snapshots_columnar(pool_symbol, hours), executions)
+            market_data = {c: v[-MARKET_SNAPSHOT_HOURS:] for c, v in historical_data.items()}
+        else:
+            historical_data, market_data, strategy_allocations = await asyncio.gather(
+                self.get_pool_snapshots_bucketed(pool_symbol, hours, bucket),
+                self.get_pool_snapshots_columnar(pool_symbol, hours, limit=MARKET_SNAPSHOT_HOURS, latest=True),
+                executions)
+        return {
+            'historical_data': historical_data,
+            'market_data': market_data,
+            'strategy_allocations': strategy_allocations,
+        }
@@ -0,0 +1,213 @@
+"""
+WeeklyStrategyDataset 的批量数据加载器
+
+torch DataLoader 默认逐个样本调用 __getitem__ (每次都重新计算标签并新建张量) 再 collate,
+训练循环大部分时间在等数据。WindowBatchLoader 的做法:
+    - 标签在构建时一次性算好 (WeeklyStrategyDataset.precompute_labels)
+    - 输入窗口按行下标直接从特征矩阵中取出, 一个 batch 只需一次 np.take 拷贝
+    - batch 写入预分配的缓冲区, 各 step 之间循环复用, 不再反复申请内存
+    - num_workers > 0 时, 工作进程 (spawn) 通过共享内存访问特征矩阵和标签,
+      把 batch 直接写进共享内存中的缓冲槽, 主进程零拷贝地包装成张量;
+      prefetch_batches 控制最多有多少个 batch 在后台准备
+
+注意: 迭代得到的 (x, y) 指向复用的缓冲区, 下一次取 batch 后内容会被覆盖,
+需要保留的数据必须先拷贝。
+"""
+
+import logging
+import multiprocessing as mp
+import queue
+from collections import deque
+from typing import List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from shared_features import SharedFeatureMatrix
+
+logger = logging.getLogger(__name__)
+
+WORKER_TIMEOUT_SECONDS = 60
+
+
+def _fill_batch(features: np.ndarray, labels: np.ndarray, sample_indices: np.ndarray, stride: int,
+                lookback_hours: int, x_out: np.ndarray, y_out: np.ndarray):
+    """按 (n, lookback) 的行下标直接从连续的特征矩阵中取出窗口, 一次拷贝写入输出缓冲区"""
+    rows = (sample_indices * stride)[:, np.newaxis] + np.arange(lookback_hours)
+    np.take(features, rows, axis=0, out=x_out)
+    np.take(labels, sample_indices, axis=0, out=y_out)
+
+
+def _loader_worker(features_handle, labels_handle, x_slots_handle, y_slots_handle,
+                   lookback_hours: int, stride: int, tasks, done):
+    """工作进程: 从 tasks 取 (slot, sample_indices), 把 batch 写进共享缓冲槽后回报 slot"""
+    features = SharedFeatureMatrix.attach(features_handle)
+    labels = SharedFeatureMatrix.attach(labels_handle)
+    x_slots = SharedFeatureMatrix.attach(x_slots_handle, writable=True)
+    y_slots = SharedFeatureMatrix.attach(y_slots_handle, writable=True)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, sample_indices = task
+            n = len(sample_indices)
+            _fill_batch(features.array, labels.array, sample_indices, stride, lookback_hours,
+                        x_slots.array[slot, :n], y_slots.array[slot, :n])
+            done.put(slot)
+    finally:
+        for matrix in (features, labels, x_slots, y_slots):
+            matrix.close()
+
+
+class WindowBatchLoader:
+    """
+    可替代 DataLoader 传给 WeeklyStrategyTrainer 的批量加载器。
+
+    Args:
+        dataset: WeeklyStrategyDataset
+        indices: 参与迭代的样本下标 (如 time_ordered_split 的结果), 默认全部
+        batch_size / shuffle / drop_last: 与 DataLoader 含义相同; 打乱顺序使用 torch 的全局随机数,
+            因此与检查点中保存的随机数状态一起可以完全复现
+        num_workers: 准备 batch 的工作进程数, 0 表示在主进程中同步准备
+        prefetch_batches: 后台最多预先准备好的 batch 数 (仅 num_workers > 0 时有效)
+        pin_memory: 训练设备为 cuda 时把 batch 放在锁页内存中, 以便异步拷贝到 GPU
+    """
+
+    def __init__(self, dataset, indices: Optional[Sequence[int]] = None, batch_size: int = 32,
+                 shuffle: bool = False, drop_last: bool = False, num_workers: int = 0,
+                 prefetch_batches: int = 2, pin_memory: bool = False):
+        self.features = np.ascontiguousarray(dataset.features)
+        self.labels = dataset.precompute_labels()
+        self.lookback_hours = dataset.lookback_hours
+        self.stride = dataset.stride
+        self.indices = np.asarray(range(len(dataset)) if indices is None else indices, dtype=np.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_workers = max(0, num_workers)
+        self.prefetch_batches = max(1, prefetch_batches)
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+
+        num_slots = self.prefetch_batches + 1 if self.num_workers else 1
+        x_shape = (num_slots, batch_size, self.lookback_hours, self.features.shape[1])
+        y_shape = (num_slots, batch_size, self.labels.shape[1])
+        self._workers: List[mp.Process] = []
+        self._shared: List[SharedFeatureMatrix] = []
+        if self.num_workers:
+            self._x_slots = SharedFeatureMatrix.create(np.zeros(x_shape, dtype=np.float32))
+            self._y_slots = SharedFeatureMatrix.create(np.zeros(y_shape, dtype=np.float32))
+            self._shared += [self._x_slots, self._y_slots]
+            self._x_buffers = torch.from_numpy(self._x_slots.array)
+            self._y_buffers = torch.from_numpy(self._y_slots.array)
+        else:
+            self._x_buffers = torch.empty(x_shape, dtype=torch.float32, pin_memory=self.pin_memory)
+            self._y_buffers = torch.empty(y_shape, dtype=torch.float32, pin_memory=self.pin_memory)
+        if self.pin_memory and self.num_workers:
+            # 共享内存不能直接锁页, 每个槽对应一块锁页缓冲, 取出时拷贝一次
+            self._x_pinned = torch.empty(x_shape, dtype=torch.float32, pin_memory=True)
+            self._y_pinned = torch.empty(y_shape, dtype=torch.float32, pin_memory=True)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.indices) // self.batch_size
+        return -(-len(self.indices) // self.batch_size)
+
+    def _batches(self) -> List[np.ndarray]:
+        order = self.indices[torch.randperm(len(self.indices)).numpy()] if self.shuffle else self.indices
+        return [order[i * self.batch_size:(i + 1) * self.batch_size] for i in range(len(self))]
+
+    def _start_workers(self):
+        ctx = mp.get_context('spawn')
+        features = SharedFeatureMatrix.create(self.features)
+        labels = SharedFeatureMatrix.create(self.labels)
+        self._shared += [features, labels]
+        self._tasks, self._done = ctx.Queue(), ctx.Queue()
+        for _ in range(self.num_workers):
+            worker = ctx.Process(target=_loader_worker, daemon=True,
+                                 args=(features.handle, labels.handle, self._x_slots.handle, self._y_slots.handle,
+                                       self.lookback_hours, self.stride, self._tasks, self._done))
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"  Batch loader started {self.num_workers} worker processes "
+                    f"(prefetch {self.prefetch_batches} batches of {self.batch_size})")
+
+    def _wait_for(self, slot: int, completed: set):
+        while slot not in completed:
+            try:
+                completed.add(self._done.get(timeout=WORKER_TIMEOUT_SECONDS))
+            except queue.Empty:
+                dead = [w.pid for w in self._workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Batch loader worker(s) {dead} exited unexpectedly.")
+        completed.remove(slot)
+
+    def _slot_tensors(self, slot: int, n: int):
+        x, y = self._x_buffers[slot, :n], self._y_buffers[slot, :n]
+        if self.pin_memory and self.num_workers:
+            x = self._x_pinned[slot, :n].copy_(x)
+            y = self._y_pinned[slot, :n].copy_(y)
+        return x, y
+
+    def __iter__(self):
+        batches = self._batches()
+        if not self.num_workers:
+            x_buffer, y_buffer = self._x_buffers[0].numpy(), self._y_buffers[0].numpy()
+            for sample_indices in batches:
+                n = len(sample_indices)
+                _fill_batch(self.features, self.labels, sample_indices, self.stride, self.lookback_hours,
+                            x_buffer[:n], y_buffer[:n])
+                yield self._x_buffers[0, :n], self._y_buffers[0, :n]
+            return
+
+        if not self._workers:
+            self._start_workers()
+        free = deque(range(self.prefetch_batches + 1))
+        pending, completed = deque(), set()
+        submitted = 0
+
+        def submit():
+            nonlocal submitted
+            slot = free.popleft()
+            self._tasks.put((slot, batches[submitted]))
+            pending.append((slot, len(batches[submitted])))
+            submitted += 1
+
+        try:
+            while submitted < min(self.prefetch_batches, len(batches)):
+                submit()
+            held = None
+            while pending:
+                slot, n = pending.popleft()
+                self._wait_for(slot, completed)
+                if held is not None:
+                    free.append(held)
+                if submitted < len(batches):
+                    submit()
+                held = slot
+                yield self._slot_tensors(slot, n)
+        finally:
+            # 迭代被提前中断时等待已提交的任务完成, 避免它们的回报混进下一个 epoch
+            for slot, _ in pending:
+                self._wait_for(slot, completed)
+
+    def close(self):
+        """停止工作进程并释放共享内存"""
+        if self._workers:
+            for _ in self._workers:
+                self._tasks.put(None)
+            for worker in self._workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            self._workers = []
+        self._x_buffers = self._y_buffers = None
+        for matrix in self._shared:
+            matrix.close()
+        self._shared = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
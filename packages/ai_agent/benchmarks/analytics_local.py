@@ -0,0 +1,113 @@
+"""
+本地端到端基准: 不依赖外部数据库, 用嵌入式 SQLite 跑完整链路
+    1. 用 migrate_to_database.DataMigrator 把 JSON 数据导入临时 SQLite 文件
+    2. 通过 Flask 测试客户端多次调用 analytics API 的各个接口, 统计冷 (refresh=true) / 热 (缓存) 耗时中位数
+
+分析接口按 "最近 N 小时" 取数, 默认把数据整体平移到最新快照落在当前小时 (--no-shift 关闭)。
+
+用法 (在 packages/ai_agent 目录下):
+    python benchmarks/analytics_local.py
+    python benchmarks/analytics_local.py --runs 50 --db /tmp/analytics.db --keep
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+ENDPOINTS = [
+    '/api/v1/analytics/health',
+    '/api/v1/analytics/summary?pool={pool}',
+    '/api/v1/analytics/net-value-curve?pool={pool}&hours=720',
+    '/api/v1/analytics/net-value-curve?pool={pool}&hours=8760&bucket=1d',
+    '/api/v1/analytics/performance?pool={pool}&period=30D',
+    '/api/v1/analytics/allocation-history?pool={pool}&hours=720',
+]
+
+
+def shifted_data_file(data_file: str, directory: str) -> str:
+    """把所有快照平移整数个小时, 使最新快照落在当前小时, 写到 directory 下并返回路径"""
+    with open(data_file, 'r') as f:
+        data = json.load(f)
+    latest = max(int(s['periodStartUnix']) for pool in data['pools'].values() for s in pool.get('snapshots', []))
+    offset = (int(time.time()) // 3600 * 3600) - latest
+    for pool in data['pools'].values():
+        for snap in pool.get('snapshots', []):
+            snap['periodStartUnix'] = int(snap['periodStartUnix']) + offset
+    path = os.path.join(directory, 'shifted_defi_data.json')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return path
+
+
+def time_endpoint(client, url: str, runs: int):
+    """返回 (状态码, 冷耗时中位数 ms, 热耗时中位数 ms)"""
+    cold, warm, status = [], [], None
+    separator = '&' if '?' in url else '?'
+    for _ in range(runs):
+        start = time.perf_counter()
+        status = client.get(f"{url}{separator}refresh=true").status_code
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        client.get(url)
+        warm.append(time.perf_counter() - start)
+    return status, statistics.median(cold) * 1e3, statistics.median(warm) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 SQLite 端到端基准 (迁移 + analytics API)')
+    parser.add_argument('--data-file', default=os.path.join('data', 'complete_defi_data.json'), help='数据文件')
+    parser.add_argument('--db', help='SQLite 文件路径 (默认: 临时目录, 结束后删除)')
+    parser.add_argument('--runs', type=int, default=20, help='每个接口调用的次数')
+    parser.add_argument('--no-shift', action='store_true', help='不平移数据时间戳')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='analytics_bench_')
+    db_path = os.path.abspath(args.db or os.path.join(workdir, 'bench.db'))
+    # 必须在导入 database 之前设置, 进程内共用的后端按 DATABASE_URL 创建
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+
+    from migrate_to_database import DataMigrator
+    import analytics_api
+    logging.getLogger().setLevel(logging.WARNING)
+
+    data_file = args.data_file if args.no_shift else shifted_data_file(args.data_file, workdir)
+    migrator = DataMigrator(data_file)
+    start = time.perf_counter()
+    migrator.run_full_migration()
+    migrate_seconds = time.perf_counter() - start
+
+    pool = next(iter(migrator.load_json_data()['pools']))
+    client = analytics_api.app.test_client()
+    endpoints = {}
+    for template in ENDPOINTS:
+        url = template.format(pool=pool)
+        status, cold_ms, warm_ms = time_endpoint(client, url, args.runs)
+        endpoints[url] = {'status': status, 'cold_median_ms': cold_ms, 'warm_median_ms': warm_ms}
+
+    report = {
+        'database': db_path,
+        'snapshots': migrator.stats['successful_snapshots'],
+        'migrate_seconds': migrate_seconds,
+        'runs': args.runs,
+        'endpoints': endpoints,
+    }
+    print(json.dumps(report, indent=2))
+
+    if not args.keep and not args.db:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    sys.exit(0 if all(e['status'] == 200 for e in endpoints.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+增量推理一致性与耗时基准: 用历史数据逐小时回放, 每一步分别用
+    - 整窗重算 (StrategyPredictor.predict, cached=False)
+    - 增量推理 (环形缓冲, 只标准化新增的行)
+计算预测, 检查两者逐位相同, 并统计各自的耗时。
+加 --last-query-attention 时增量推理再只用最后一个 query 计算 attention, 此时只要求误差在容差内。
+
+用法 (在 packages/ai_agent 目录下):
+    python benchmarks/cached_inference.py --pool wBTC-USDC
+    python benchmarks/cached_inference.py --pool wBTC-USDC --format mmap --steps 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+from features import create_feature_sequences_from_snapshots  # noqa: E402
+from predict import LAST_QUERY_TOLERANCE, StrategyPredictor, resolve_model_package_path  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量推理一致性与耗时基准')
+    parser.add_argument('--pool', default='wBTC-USDC', help='池子符号')
+    parser.add_argument('--format', default='fp32', choices=['fp32', 'mmap', 'int8'], help='模型包格式')
+    parser.add_argument('--data-file', default=os.path.join('data', 'complete_defi_data.json'), help='数据文件')
+    parser.add_argument('--steps', type=int, default=0, help='回放的小时数 (默认: 全部)')
+    parser.add_argument('--last-query-attention', action='store_true', help='增量推理时只用最后一个 query 计算 attention')
+    args = parser.parse_args()
+
+    with open(args.data_file, 'r') as f:
+        pool_data = json.load(f)['pools'][args.pool]
+    feature_sequences = create_feature_sequences_from_snapshots(
+        pool_data['snapshots'], pool_data['aave_current_reserves'], pool_data['gas_current'])
+
+    package_path = resolve_model_package_path(args.pool, args.format)
+    full = StrategyPredictor(package_path)
+    cached = StrategyPredictor(package_path, cached=True, last_query_attention=args.last_query_attention)
+
+    lookback = full.lookback_hours
+    ends = range(lookback, len(feature_sequences) + 1)
+    if args.steps:
+        ends = ends[-args.steps:]
+
+    full_times, cached_times, mismatches, max_diff = [], [], 0, 0.0
+    for end in ends:
+        history = feature_sequences[:end]
+        start = time.perf_counter()
+        reference = full.predict(history)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        prediction = cached.predict(history)
+        cached_times.append(time.perf_counter() - start)
+
+        if not np.array_equal(reference, prediction):
+            mismatches += 1
+            max_diff = max(max_diff, float(np.max(np.abs(reference - prediction))))
+
+    report = {
+        'pool': args.pool,
+        'format': args.format,
+        'last_query_attention': cached.last_query_attention,
+        'steps': len(ends),
+        'mismatches': mismatches,
+        'max_abs_diff': max_diff,
+        'rows_scaled_cached': cached.window_buffer.rows_scaled,
+        'rows_scaled_full': len(ends) * lookback,
+        'full_median_ms': statistics.median(full_times) * 1e3,
+        'cached_median_ms': statistics.median(cached_times) * 1e3,
+    }
+    print(json.dumps(report, indent=2))
+    tolerance = LAST_QUERY_TOLERANCE if cached.last_query_attention else 0.0
+    sys.exit(1 if max_diff > tolerance else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+导入耗时基准: 在全新的解释器进程中分别导入 agent / analytics_api / predict,
+统计多次运行的耗时中位数, 并列出 -X importtime 报告中累计耗时最高的模块。
+
+用法 (在 packages/ai_agent 目录下):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --output benchmarks/import_time_history.jsonl
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['agent', 'analytics_api', 'predict']
+# 导入时会被检查是否已加载的重量级依赖
+HEAVY_MODULES = ['torch', 'pandas', 'sklearn', 'fastapi', 'pydantic', 'onnxruntime']
+
+
+def _subprocess_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # database.py 需要 DATABASE_URL 或 LOCAL_DATABASE_PATH, 导入阶段不会真正连接
+    if not env.get('LOCAL_DATABASE_PATH'):
+        env.setdefault('DATABASE_URL', 'postgresql://benchmark@localhost/benchmark')
+    return env
+
+
+def time_import(module: str, runs: int) -> Tuple[List[float], List[str]]:
+    """返回每次导入的耗时(秒，已扣除解释器空启动耗时)和导入后已加载的重量级依赖"""
+    code = (
+        "import sys, time; t = time.perf_counter(); "
+        f"import {module}; elapsed = time.perf_counter() - t; "
+        f"print(elapsed); print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    timings, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=AGENT_DIR, env=_subprocess_env(),
+                             capture_output=True, text=True, check=True).stdout.splitlines()
+        timings.append(float(out[-2]))
+        loaded = [m for m in out[-1].split(',') if m]
+    return timings, loaded
+
+
+def top_imports(module: str, limit: int) -> List[Tuple[str, float]]:
+    """解析 -X importtime 输出, 返回累计耗时最高的顶层依赖 (模块名, 毫秒)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=AGENT_DIR, env=_subprocess_env(), capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        parts = line[len('import time:'):].split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative_us, name = parts[1], parts[2]
+        # 名字前的缩进表示导入层级, 只保留被测模块直接导入的依赖
+        if len(name) - len(name.lstrip(' ')) != 3:
+            continue
+        entries.append((name.strip(), int(cumulative_us) / 1000))
+    return sorted(entries, key=lambda e: e[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量 agent / analytics_api / predict 的导入耗时')
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help='要测量的模块')
+    parser.add_argument('--runs', type=int, default=5, help='每个模块重复测量次数')
+    parser.add_argument('--top', type=int, default=5, help='列出累计耗时最高的依赖数量')
+    parser.add_argument('--output', default=None, help='追加写入 JSONL 结果文件, 用于跟踪历史变化')
+    args = parser.parse_args()
+
+    record = {'timestamp': datetime.now().isoformat(), 'python': sys.version.split()[0], 'results': {}}
+    print(f"{'module':<16}{'median_ms':>12}{'min_ms':>10}{'max_ms':>10}  heavy deps loaded")
+    for module in args.modules:
+        timings, loaded = time_import(module, args.runs)
+        median_ms = statistics.median(timings) * 1000
+        print(f"{module:<16}{median_ms:>12.1f}{min(timings) * 1000:>10.1f}{max(timings) * 1000:>10.1f}  "
+              f"{', '.join(loaded) or '-'}")
+        for name, cumulative_ms in top_imports(module, args.top):
+            print(f"{'':<16}  {name:<28}{cumulative_ms:>8.1f} ms")
+        record['results'][module] = {
+            'median_ms': round(median_ms, 2),
+            'runs_ms': [round(t * 1000, 2) for t in timings],
+            'heavy_modules_loaded': loaded,
+        }
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        print(f"\nResults appended to {args.output}")
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    main()
+    print(f"\nBenchmark finished in {time.perf_counter() - start:.1f}s")
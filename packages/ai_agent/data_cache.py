@@ -0,0 +1,207 @@
+"""
+analytics API 的数据缓存
+
+每个条目单独记录写入时间, 超过 ttl_seconds 即视为过期; 所有条目的估算内存合计超过 max_bytes 时
+按 LRU 淘汰最久未使用的条目。所有操作加锁, 可以在 Flask 的多个请求线程中共用。
+缓存的值直接返回, 不做拷贝 (列式快照中的 numpy 数组可能很大), 调用方不能修改。
+
+get_or_compute 在缓存未命中时避免惊群:
+    - single-flight: 同一个键同时只有一个线程在计算, 其余并发请求等待这一次计算的结果
+    - stale-while-revalidate: 过期不超过 stale_seconds 的条目仍直接返回, 同时在后台线程刷新
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value: Any) -> int:
+    """估算对象占用的字节数: numpy 数组取 nbytes, 容器递归累加各元素"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(np.empty(0))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    stored_at: float
+
+
+class TTLCache:
+    """线程安全的 TTL + LRU 缓存, 按估算字节数限制总大小"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, stale_seconds: float = 0.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # 正在计算的键 -> 计算结果, 并发请求在同一个 Future 上等待
+        self._inflight: Dict[Hashable, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.background_refreshes = 0
+
+    def _remove(self, key: Hashable) -> _Entry:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[_Entry], bool]:
+        """(条目, 是否未过期); 超过有效期加 stale_seconds 的条目被删除。调用方持有锁"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        age = time.monotonic() - entry.stored_at
+        if age >= self.ttl_seconds + self.stale_seconds:
+            self._remove(key)
+            self.expirations += 1
+            return None, False
+        self._entries.move_to_end(key)
+        return entry, age < self.ttl_seconds
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """未过期时返回缓存的值, 否则返回 None"""
+        with self._lock:
+            entry, fresh = self._lookup(key)
+            if not fresh:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], force: bool = False) -> Any:
+        """
+        返回 key 的缓存值, 没有时调用 compute() 计算并写入缓存:
+            - 未过期: 直接返回
+            - 已过期但在 stale_seconds 内: 返回旧值, 并在后台线程重新计算 (同一个键只启动一次)
+            - 不存在: 同步计算; 同一个键已有计算在进行时等待它的结果, 不重复计算
+            - force=True: 总是重新同步计算, 不等待已在进行的计算 (它可能在新数据写入之前就已开始),
+              并取代它写入缓存的资格
+        compute 抛出的异常会传给所有等待的调用方, 不写入缓存。
+        """
+        with self._lock:
+            entry, fresh = (None, False) if force else self._lookup(key)
+            if fresh:
+                self.hits += 1
+                return entry.value
+            future = None if force else self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            if entry is not None:
+                self.stale_hits += 1
+                if leader:
+                    self.background_refreshes += 1
+                    threading.Thread(target=self._fill, args=(key, compute, future, True),
+                                     name=f"cache-refresh-{key}", daemon=True).start()
+                return entry.value
+            if leader:
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            self._fill(key, compute, future)
+        return future.result()
+
+    def _fill(self, key: Hashable, compute: Callable[[], Any], future: Future, background: bool = False):
+        value, error = None, None
+        try:
+            value = compute()
+            size = estimate_size(value)
+            with self._lock:
+                # 计算期间键被 invalidate / clear 或被 force 的计算取代时, 结果可能早于最新的数据,
+                # 只交给已在等待的调用方, 不写入缓存
+                if self._inflight.get(key) is future:
+                    self._store(key, value, size)
+        except BaseException as e:
+            error = e
+            if background:
+                logger.warning(f"Background cache refresh for {key!r} failed: {e}", exc_info=True)
+        finally:
+            # 无论哪一步出错都先完成 Future (等待方没有超时, 未完成会一直阻塞), 然后才移除 in-flight 条目
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def _store(self, key: Hashable, value: Any, size: int):
+        """写入条目并按 LRU 淘汰到 max_bytes 以内; 调用方持有锁"""
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = _Entry(value, size, time.monotonic())
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """写入条目; 单个条目超过 max_bytes 时不缓存"""
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            self._store(key, value, size)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """删除键满足 predicate 的条目, 返回删除的个数; 这些键正在进行的计算完成后不再写入缓存"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            for key in [key for key in self._inflight if predicate(key)]:
+                del self._inflight[key]
+            return len(keys)
+
+    def clear(self) -> int:
+        """删除所有条目, 返回删除的个数; 正在进行的计算完成后不再写入缓存"""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._inflight.clear()
+            return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale_hits + self.coalesced
+            now = time.monotonic()
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'stale_seconds': self.stale_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'coalesced': self.coalesced,
+                'background_refreshes': self.background_refreshes,
+                'inflight': len(self._inflight),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                # 旧值和等待他人计算的结果都不需要自己访问数据库, 计入命中
+                'hit_rate': (self.hits + self.stale_hits + self.coalesced) / lookups if lookups else 0.0,
+                'oldest_age_seconds': max((now - e.stored_at for e in self._entries.values()), default=0.0),
+            }
@@ -2,8 +2,6 @@
 
 import requests
 import json
-import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 import time
 from typing import Dict, List, Optional
@@ -81,6 +79,20 @@ class MultiPoolDeFiDataFetcher:
         logger.info(f"  Total unique snapshots fetched: {len(unique_snapshots)}")
         return unique_snapshots
 
+    def get_latest_snapshot_timestamp(self, pool_address: str) -> Optional[int]:
+        """只查询最新一条小时快照的 periodStartUnix, 用于判断数据是否有更新; 查询失败时返回 None"""
+        query = """
+        query GetLatestPoolHourlySnapshot($poolAddress: String!) {
+            poolHourDatas(
+                where: { pool: $poolAddress },
+                orderBy: periodStartUnix, orderDirection: desc, first: 1
+            ) { periodStartUnix }
+        }
+        """
+        result = self.execute_query(self.subgraph_urls["uniswap_v3_base"], query, {"poolAddress": pool_address.lower()})
+        snapshots = result.get("poolHourDatas", [])
+        return int(snapshots[0]['periodStartUnix']) if snapshots else None
+
     def get_aave_reserves_data(self, asset_addresses: List[str]) -> List[Dict]:
         query = """
         query GetReserveData($assetIds: [String!]) {
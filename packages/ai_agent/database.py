@@ -1,5 +1,10 @@
 """
-数据库操作封装 - PostgreSQL 直连版（兼容 Supabase）
+数据库操作封装
+
+DatabaseManager 按 DATABASE_URL 选择存储后端 (见 create_storage_backend):
+    - postgres:// / postgresql://  PostgreSQL 直连（兼容 Supabase）, 即本文件中的 PostgresStorage
+    - sqlite:///path/to/file.db     嵌入式 SQLite 文件 (sqlite_storage.SQLiteStorage)
+    - 未设置                        仅当显式设置了 LOCAL_DATABASE_PATH 时使用该本地 SQLite 文件, 否则报错
 """
 
 import os
@@ -7,51 +12,337 @@ import json
 import logging
 import psycopg2
 import psycopg2.extras
-from decimal import Decimal
-from typing import List, Dict, Optional
+import psycopg2.pool
+import threading
+import time
+import uuid
+import numpy as np
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from sqlite_storage import SQLiteStorage
+from storage import (BUCKETED_COLUMNS, COPY_PROGRESS_EVERY, DEFAULT_FETCH_SIZE, SNAPSHOT_BUCKETS,
+                     SNAPSHOT_NUMERIC_COLUMNS, StorageBackend, empty_snapshot_columns, rows_to_columns)
+
 # ========== 初始化 ==========
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("❌ DATABASE_URL not found in environment variables")
+# 本地自建的 PostgreSQL 通常没有 SSL, 可设为 disable / prefer
+DATABASE_SSLMODE = os.getenv("DATABASE_SSLMODE", "require")
+# 未设置 DATABASE_URL 时使用的本地 SQLite 文件; 必须显式设置, 不会静默退回到默认路径
+LOCAL_DATABASE_PATH = os.getenv("LOCAL_DATABASE_PATH")
+
+# PostgresStorage 使用的连接池; analytics API 的一个请求会并发占用多个连接 (见 analytics_api.get_pool_data)。
+# psycopg2 的连接池最多保留 minconn 个空闲连接, 归还时多出来的连接会被直接关闭,
+# 所以 minconn 默认取一个请求的并发读取数 (快照 + 最新快照 + 策略记录), 否则并发读取时每次都要重新握手
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", 10))
+DB_POOL_MIN_CONNECTIONS = min(int(os.getenv("DB_POOL_MIN_CONNECTIONS", 3)), DB_POOL_MAX_CONNECTIONS)
+# 连接都在使用中时等待空闲连接的最长时间 (秒)
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 10))
+
+
+def _check_postgres_url():
+    if not DATABASE_URL or not DATABASE_URL.startswith(("postgres://", "postgresql://")):
+        raise ValueError("❌ DATABASE_URL is not a PostgreSQL connection string")
+
 
 def get_connection():
-    """获取数据库连接"""
-    return psycopg2.connect(DATABASE_URL, sslmode="require")
+    """获取一个独立的 PostgreSQL 连接 (不经过连接池, 用于迁移等管理操作, 用完自行 close)"""
+    _check_postgres_url()
+    return psycopg2.connect(DATABASE_URL, sslmode=DATABASE_SSLMODE)
 
 
-class DatabaseManager:
-    """数据库操作类"""
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool 用尽时直接抛 PoolError, 用信号量让调用方排队等待
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONNECTIONS)
+
+
+def acquire_connection():
+    """
+    从连接池取一个连接 (第一次调用时建池并预先打开 DB_POOL_MIN_CONNECTIONS 个连接), 用完必须交给 release_connection。
+    池中保留至多 DB_POOL_MIN_CONNECTIONS 个空闲连接, 这部分查询不需要重新做 TCP/TLS 握手。
+    连接都在使用中时最多等待 DB_POOL_TIMEOUT_SECONDS 秒, 超时抛 TimeoutError。
+    """
+    global _pool
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS):
+        raise TimeoutError(f"No free database connection after {DB_POOL_TIMEOUT_SECONDS}s "
+                           f"(DB_POOL_MAX_CONNECTIONS={DB_POOL_MAX_CONNECTIONS})")
+    try:
+        with _pool_lock:
+            if _pool is None:
+                _check_postgres_url()
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_CONNECTIONS, DB_POOL_MAX_CONNECTIONS, DATABASE_URL, sslmode=DATABASE_SSLMODE)
+        conn = _pool.getconn()
+        if conn.closed:
+            # 已断开的连接 (如数据库重启) 丢弃后重新建立
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def release_connection(conn):
+    """把连接还给连接池: 未提交的事务会被回滚, 已断开的连接会被丢弃"""
+    try:
+        _pool.putconn(conn)
+    finally:
+        _pool_slots.release()
+
+
+# 健康检查统计的缓存时间 (秒)
+HEALTH_STATS_TTL_SECONDS = float(os.getenv("HEALTH_STATS_TTL_SECONDS", 30))
+_stats_cache: Dict = {}
+_stats_lock = threading.Lock()
+# 物化在 pool_snapshot_rollups 中的汇总粒度 (见 db_migrations 0002), 写入快照时增量维护
+ROLLUP_BUCKETS = ('4h', '1d')
+
+_ROLLUP_REFRESH_SQL = """
+WITH bounds AS (
+    SELECT to_timestamp((EXTRACT(EPOCH FROM %(start)s::timestamp)::bigint / %(width)s) * %(width)s)
+               AT TIME ZONE 'UTC' AS lower_bound,
+           to_timestamp((EXTRACT(EPOCH FROM %(end)s::timestamp)::bigint / %(width)s + 1) * %(width)s)
+               AT TIME ZONE 'UTC' AS upper_bound
+)
+INSERT INTO pool_snapshot_rollups (
+    pool_symbol, bucket, bucket_start, price_open, price_high, price_low, price_close,
+    volume_usd, liquidity_avg, tvl_usd_avg, aave_wbtc_apy_avg, univ3_lp_apy_avg, gas_cost_usd,
+    samples, refreshed_at
+)
+SELECT
+    s.pool_symbol,
+    %(bucket)s,
+    to_timestamp((EXTRACT(EPOCH FROM s.timestamp)::bigint / %(width)s) * %(width)s) AT TIME ZONE 'UTC',
+    (array_agg(s.wbtc_price ORDER BY s.timestamp ASC))[1],
+    MAX(s.wbtc_price),
+    MIN(s.wbtc_price),
+    (array_agg(s.wbtc_price ORDER BY s.timestamp DESC))[1],
+    SUM(s.volume_usd),
+    AVG(s.liquidity),
+    AVG(s.tvl_usd),
+    AVG(s.aave_wbtc_apy),
+    AVG(s.univ3_lp_apy),
+    SUM(s.gas_cost_usd),
+    COUNT(*),
+    now()
+FROM pool_snapshots s, bounds
+WHERE s.pool_symbol = %(pool_symbol)s
+  AND s.timestamp >= bounds.lower_bound AND s.timestamp < bounds.upper_bound
+GROUP BY 1, 3
+ON CONFLICT (pool_symbol, bucket, bucket_start) DO UPDATE SET
+    price_open = EXCLUDED.price_open,
+    price_high = EXCLUDED.price_high,
+    price_low = EXCLUDED.price_low,
+    price_close = EXCLUDED.price_close,
+    volume_usd = EXCLUDED.volume_usd,
+    liquidity_avg = EXCLUDED.liquidity_avg,
+    tvl_usd_avg = EXCLUDED.tvl_usd_avg,
+    aave_wbtc_apy_avg = EXCLUDED.aave_wbtc_apy_avg,
+    univ3_lp_apy_avg = EXCLUDED.univ3_lp_apy_avg,
+    gas_cost_usd = EXCLUDED.gas_cost_usd,
+    samples = EXCLUDED.samples,
+    refreshed_at = EXCLUDED.refreshed_at
+"""
+
+
+def refresh_rollups(cur, ranges: Iterable[Tuple[str, datetime, datetime]]) -> int:
+    """
+    在当前事务中用原始快照重算 ranges [(pool_symbol, 最早时间, 最晚时间), ...] 所覆盖的汇总桶。
+    只重算与新写入数据相交的桶, 桶内其余小时的数据也会一起重新汇总, 因此结果与全量重算相同。
+    汇总表不存在 (迁移 0002 尚未执行) 时跳过。返回更新的汇总行数。
+    """
+    cur.execute("SELECT to_regclass('pool_snapshot_rollups') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    refreshed = 0
+    for pool_symbol, start, end in ranges:
+        for bucket in ROLLUP_BUCKETS:
+            cur.execute(_ROLLUP_REFRESH_SQL, {
+                'pool_symbol': pool_symbol, 'bucket': bucket, 'width': SNAPSHOT_BUCKETS[bucket],
+                'start': start, 'end': end,
+            })
+            refreshed += cur.rowcount
+    return refreshed
+
+
+def _coarsest_rollup(bucket: str) -> Optional[str]:
+    """能整除 bucket 的最粗的物化汇总粒度; 没有 (如 1h) 时返回 None"""
+    width = SNAPSHOT_BUCKETS[bucket]
+    candidates = [r for r in ROLLUP_BUCKETS if width % SNAPSHOT_BUCKETS[r] == 0]
+    return max(candidates, key=SNAPSHOT_BUCKETS.get) if candidates else None
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _copy_text_value(value) -> str:
+    """按 COPY text 格式转义单个值: NULL 写作 \\N, 反斜杠/制表符/换行需要转义"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class _CopyRowReader:
+    """
+    把行元组的迭代器包装成 copy_expert 读取的文件对象, 按需生成 COPY text 格式的数据,
+    不需要先把全部行拼成一个大字符串
+    """
+
+    def __init__(self, rows: Iterable[tuple], progress_every: int = COPY_PROGRESS_EVERY,
+                 total: Optional[int] = None):
+        self._rows = iter(rows)
+        self.total = total
+        self._pending = b''
+        self.progress_every = progress_every
+        self.rows_written = 0
+        self._started = time.perf_counter()
+
+    def read(self, size: int = -1) -> bytes:
+        parts, length = [self._pending], len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ('\t'.join(_copy_text_value(v) for v in row) + '\n').encode()
+            parts.append(line)
+            length += len(line)
+            self.rows_written += 1
+            if self.progress_every and self.rows_written % self.progress_every == 0:
+                elapsed = time.perf_counter() - self._started
+                percent = f", {self.rows_written / self.total * 100:.1f}%" if self.total else ""
+                logger.info(f"  💾 COPY 已写入 {self.rows_written:,} 行 "
+                            f"({self.rows_written / elapsed:,.0f} 行/秒{percent})")
+        data = b''.join(parts)
+        if size < 0:
+            self._pending = b''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+
+class PostgresStorage(StorageBackend):
+    """PostgreSQL 存储后端, 每次操作从连接池借用一个连接, 结构由 db_migrations 管理"""
+    @staticmethod
+    def ensure_schema(start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """执行待执行的结构迁移, 并为 [start, end] 所在的月份创建 pool_snapshots 分区"""
+        # db_migrations 依赖本模块, 在这里再导入
+        from db_migrations import ensure_pool_snapshot_partitions, upgrade
+        upgrade()
+        if start is not None:
+            ensure_pool_snapshot_partitions(start, end)
+
     @staticmethod
-    def get_database_stats() -> Dict:
-        """简单的数据库统计（用于健康检查）"""
+    def get_database_stats(exact: bool = False, max_age_seconds: Optional[float] = None) -> Dict:
+        """
+        数据库统计（用于健康检查）
+
+        默认只读目录估算值, 不扫描数据表:
+            - 行数取 pg_class.reltuples (分区表为各分区之和), 由 ANALYZE / autovacuum 维护
+            - 每个池子的最早/最晚时间通过主键 (pool_symbol, timestamp) 索引取得, 池子列表用索引跳跃扫描
+        结果在进程内缓存 max_age_seconds 秒 (默认 HEALTH_STATS_TTL_SECONDS), 负载均衡探针频繁调用时
+        绝大多数请求不访问数据库。
+
+        exact=True 时用 COUNT(*) 精确统计总数和每个池子的行数 (供迁移后核对), 不使用缓存。
+        """
+        ttl = HEALTH_STATS_TTL_SECONDS if max_age_seconds is None else max_age_seconds
+        if not exact:
+            with _stats_lock:
+                cached = _stats_cache.get('stats')
+                if cached and time.monotonic() - _stats_cache['at'] < ttl:
+                    return {**cached, "cache_age_seconds": round(time.monotonic() - _stats_cache['at'], 3)}
+
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) FROM pool_snapshots;")
-                snapshots_count = cur.fetchone()[0]
-                cur.execute("SELECT COUNT(*) FROM strategy_executions;")
-                strategies_count = cur.fetchone()[0]
-            return {
-                "snapshots_count": int(snapshots_count),
-                "strategies_count": int(strategies_count),
-                "status": "ok"
-            }
+                if exact:
+                    stats = PostgresStorage._exact_stats(cur)
+                else:
+                    stats = PostgresStorage._estimated_stats(cur)
+            conn.commit()
+            stats["status"] = "ok"
+            if not exact:
+                with _stats_lock:
+                    _stats_cache.update(stats=stats, at=time.monotonic())
+            return {**stats, "cache_age_seconds": 0.0}
         except Exception as e:
             logger.error(f"get_database_stats error: {e}", exc_info=True)
             return {"status": "error", "error": str(e)}
         finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+            if conn:
+                release_connection(conn)
 
+    @staticmethod
+    def _estimated_stats(cur) -> Dict:
+        # 只累加存放数据的表 (普通表或分区), 跳过分区表本身 (relkind 'p'):
+        # PG14+ 对分区表执行 ANALYZE 后它的 reltuples 是全表行数, 与各分区相加会重复计数。
+        # 从未 ANALYZE 过的表 reltuples 为 -1
+        cur.execute("""
+        SELECT t.name, COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+        FROM (VALUES ('pool_snapshots'), ('strategy_executions')) AS t(name)
+        LEFT JOIN pg_class c
+          ON (c.oid = to_regclass(t.name)
+              OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(t.name)))
+         AND c.relkind <> 'p'
+        GROUP BY t.name
+        """)
+        counts = dict(cur.fetchall())
+        # 递归地每次取下一个更大的 pool_symbol, 每一步都是一次索引查找, 不扫描整张表
+        cur.execute("""
+        WITH RECURSIVE pools AS (
+            (SELECT pool_symbol FROM pool_snapshots ORDER BY pool_symbol LIMIT 1)
+            UNION ALL
+            SELECT (SELECT s.pool_symbol FROM pool_snapshots s
+                    WHERE s.pool_symbol > pools.pool_symbol ORDER BY s.pool_symbol LIMIT 1)
+            FROM pools WHERE pools.pool_symbol IS NOT NULL
+        )
+        SELECT p.pool_symbol,
+               (SELECT MIN(s.timestamp) FROM pool_snapshots s WHERE s.pool_symbol = p.pool_symbol),
+               (SELECT MAX(s.timestamp) FROM pool_snapshots s WHERE s.pool_symbol = p.pool_symbol)
+        FROM pools p
+        WHERE p.pool_symbol IS NOT NULL
+        """)
+        snapshots = [
+            {"pool_symbol": pool, "count": None, "earliest": _isoformat(earliest), "latest": _isoformat(latest)}
+            for pool, earliest, latest in cur.fetchall()
+        ]
+        return {
+            "snapshots_count": int(counts.get('pool_snapshots', 0)),
+            "strategies_count": int(counts.get('strategy_executions', 0)),
+            "estimated": True,
+            "snapshots": snapshots,
+            "strategies": [],
+        }
+
+    @staticmethod
+    def _exact_stats(cur) -> Dict:
+        cur.execute("""
+        SELECT pool_symbol, COUNT(*), MIN(timestamp), MAX(timestamp)
+        FROM pool_snapshots GROUP BY pool_symbol ORDER BY pool_symbol
+        """)
+        snapshots = [
+            {"pool_symbol": pool, "count": int(count), "earliest": _isoformat(earliest), "latest": _isoformat(latest)}
+            for pool, count, earliest, latest in cur.fetchall()
+        ]
+        cur.execute("SELECT pool_symbol, COUNT(*) FROM strategy_executions GROUP BY pool_symbol ORDER BY pool_symbol")
+        strategies = [{"pool_symbol": pool, "count": int(count)} for pool, count in cur.fetchall()]
+        return {
+            "snapshots_count": sum(s["count"] for s in snapshots),
+            "strategies_count": sum(s["count"] for s in strategies),
+            "estimated": False,
+            "snapshots": snapshots,
+            "strategies": strategies,
+        }
 
     # ========== 池子快照 ==========
     @staticmethod
@@ -74,6 +365,7 @@ class DatabaseManager:
             aave_wbtc_apy = EXCLUDED.aave_wbtc_apy,
             univ3_lp_apy = EXCLUDED.univ3_lp_apy,
             gas_cost_usd = EXCLUDED.gas_cost_usd
+        RETURNING pool_symbol, timestamp
         """
 
         values = [
@@ -91,10 +383,17 @@ class DatabaseManager:
             for s in snapshots
         ]
 
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor() as cur:
-                psycopg2.extras.execute_values(cur, sql, values)
+                written = psycopg2.extras.execute_values(cur, sql, values, fetch=True)
+                # 在同一事务中增量更新受影响的汇总桶
+                ranges = {}
+                for pool_symbol, timestamp in written:
+                    low, high = ranges.get(pool_symbol, (timestamp, timestamp))
+                    ranges[pool_symbol] = (min(low, timestamp), max(high, timestamp))
+                refresh_rollups(cur, [(p, low, high) for p, (low, high) in ranges.items()])
             conn.commit()
             logger.info(f"✅ Inserted/Updated {len(values)} pool snapshots")
             return len(values)
@@ -105,62 +404,261 @@ class DatabaseManager:
             raise
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
 
     @staticmethod
-    def get_pool_snapshots(pool_symbol: str, hours: int = 720, limit: Optional[int] = None) -> List[Dict]:
-        """获取池子历史快照（并把 Decimal 转为 float，timestamp 转为 ISO）"""
+    def bulk_load_pool_snapshots(snapshots: Iterable[Dict], progress_every: int = COPY_PROGRESS_EVERY,
+                                 total: Optional[int] = None) -> int:
+        """
+        批量导入池子快照 (用于回填大量历史数据), 结果与 insert_pool_snapshots 相同。
+
+        在同一个连接、同一个事务中:
+            1. 建临时表 (列类型与 pool_snapshots 一致, 提交时自动删除)
+            2. 用 COPY ... FROM STDIN 把行流式写入临时表
+            3. 一条 INSERT ... ON CONFLICT 合并进 pool_snapshots; 同一 (pool_symbol, timestamp)
+               出现多次时以最后一次为准
+            4. 重算导入范围内的汇总桶 (pool_snapshot_rollups)
+        snapshots 可以是生成器, 不会一次性展开到内存里; 已知总行数时传入 total, 进度日志会带百分比。
+        返回合并的行数。
+        """
+        columns = ('pool_symbol', 'timestamp') + SNAPSHOT_NUMERIC_COLUMNS
+        column_list = ", ".join(columns)
+        updates = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in SNAPSHOT_NUMERIC_COLUMNS)
+        rows = (
+            (s.get("pool_symbol"), s.get("timestamp"), *(float(s.get(c, 0)) for c in SNAPSHOT_NUMERIC_COLUMNS))
+            for s in snapshots
+        )
+
+        conn = None
         try:
-            cutoff = (datetime.now() - timedelta(hours=hours))
-            sql = """
-            SELECT * FROM pool_snapshots
-            WHERE pool_symbol = %s AND timestamp >= %s
-            ORDER BY timestamp ASC
-            """
-            if limit:
-                sql += f" LIMIT {limit}"
-
-            conn = get_connection()
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute(sql, (pool_symbol, cutoff))
-                rows = cur.fetchall() or []
-
-            # 转换 Decimal -> float，转换 timestamp -> ISO str
-            cleaned = []
-            numeric_keys = {'wbtc_price', 'volume_usd', 'liquidity', 'tvl_usd',
-                            'aave_wbtc_apy', 'univ3_lp_apy', 'gas_cost_usd'}
-            for r in rows:
-                newr = dict(r)
-                # timestamp -> ISO string
-                ts = newr.get('timestamp')
-                if isinstance(ts, datetime):
-                    newr['timestamp'] = ts.isoformat()
-                # convert decimals
-                for k in numeric_keys:
-                    v = newr.get(k)
-                    if isinstance(v, Decimal):
-                        newr[k] = float(v)
-                    elif v is None:
-                        newr[k] = 0.0
-                    else:
-                        try:
-                            newr[k] = float(v)
-                        except Exception:
-                            # leave as is if cannot cast
-                            pass
-                cleaned.append(newr)
-
-            logger.info(f"📊 Retrieved {len(cleaned)} snapshots for {pool_symbol}")
-            return cleaned
+            conn = acquire_connection()
+            started = time.perf_counter()
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                CREATE TEMP TABLE pool_snapshots_staging ON COMMIT DROP AS
+                SELECT {column_list} FROM pool_snapshots WITH NO DATA
+                """)
+                # 记录写入顺序, 合并时同键取最后一条
+                cur.execute("ALTER TABLE pool_snapshots_staging ADD COLUMN load_seq BIGSERIAL")
+
+                reader = _CopyRowReader(rows, progress_every, total)
+                cur.copy_expert(f"COPY pool_snapshots_staging ({column_list}) FROM STDIN", reader)
+                logger.info(f"  💾 COPY 完成: {reader.rows_written:,} 行 ({time.perf_counter() - started:.1f}s), 开始合并")
+
+                cur.execute(f"""
+                INSERT INTO pool_snapshots ({column_list})
+                SELECT DISTINCT ON (pool_symbol, timestamp) {column_list}
+                FROM pool_snapshots_staging
+                ORDER BY pool_symbol, timestamp, load_seq DESC
+                ON CONFLICT (pool_symbol, timestamp) DO UPDATE SET
+            {updates}
+                """)
+                merged = cur.rowcount
+
+                cur.execute("""
+                SELECT pool_symbol, MIN(timestamp), MAX(timestamp)
+                FROM pool_snapshots_staging GROUP BY pool_symbol
+                """)
+                rollups = refresh_rollups(cur, cur.fetchall())
+            conn.commit()
+            logger.info(f"✅ Bulk loaded {merged:,} pool snapshots in {time.perf_counter() - started:.1f}s "
+                        f"({rollups:,} rollup rows refreshed)")
+            return merged
         except Exception as e:
-            logger.error(f"Error getting pool snapshots: {e}", exc_info=True)
-            return []
+            logger.error(f"❌ Error bulk loading pool snapshots: {e}", exc_info=True)
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                release_connection(conn)
+
+    @staticmethod
+    def _stream_pool_snapshots(pool_symbol: str, hours: int, fetch_size: int, limit: Optional[int],
+                               epoch_timestamps: bool, latest: bool = False) -> Iterator[List[tuple]]:
+        """
+        用服务端命名游标分批读取快照, 每批最多 fetch_size 行, 内存占用与窗口长度无关。
+        数值列在 SQL 中转成 float8 (NULL 记为 0), psycopg2 直接返回 float, 不再经过 Decimal。
+        latest=True 时 limit 取的是窗口内最新的 limit 行 (仍按时间升序返回)。
+        """
+        timestamp_expr = "EXTRACT(EPOCH FROM timestamp)::bigint" if epoch_timestamps else "timestamp"
+        numeric_exprs = ", ".join(f"COALESCE({c}, 0)::float8 AS {c}" for c in SNAPSHOT_NUMERIC_COLUMNS)
+        latest = bool(limit and latest)
+        sql = f"""
+        SELECT pool_symbol, {timestamp_expr} AS timestamp, {numeric_exprs}
+        FROM pool_snapshots
+        WHERE pool_symbol = %s AND timestamp >= %s
+        ORDER BY timestamp {'DESC' if latest else 'ASC'}
+        """
+        params = [pool_symbol, datetime.now() - timedelta(hours=hours)]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(int(limit))
+        if latest:
+            sql = f"SELECT * FROM ({sql}) recent ORDER BY timestamp ASC"
+
+        conn = acquire_connection()
+        try:
+            # 命名游标 = 服务端游标, 结果集留在数据库端, 每次 fetchmany 只传输一批
+            with conn.cursor(name=f"pool_snapshots_{uuid.uuid4().hex}") as cur:
+                cur.itersize = fetch_size
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield rows
         finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+            release_connection(conn)
 
+    @staticmethod
+    def iter_pool_snapshots(pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                            fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Dict]:
+        """逐行流式读取快照, 每行的格式与 get_pool_snapshots 相同 (数值为 float, timestamp 为 ISO 字符串)"""
+        columns = ('pool_symbol', 'timestamp') + SNAPSHOT_NUMERIC_COLUMNS
+        for rows in PostgresStorage._stream_pool_snapshots(pool_symbol, hours, fetch_size, limit,
+                                                           epoch_timestamps=False):
+            for row in rows:
+                record = dict(zip(columns, row))
+                if isinstance(record['timestamp'], datetime):
+                    record['timestamp'] = record['timestamp'].isoformat()
+                yield record
+
+    @staticmethod
+    def iter_pool_snapshot_chunks(pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                                  fetch_size: int = DEFAULT_FETCH_SIZE,
+                                  latest: bool = False) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        按列分块流式读取快照: 每块是 {列名: numpy 数组}, 最多 fetch_size 行。
+        timestamp 为 int64 的 Unix 秒, 其余数值列为 float64。
+        """
+        for rows in PostgresStorage._stream_pool_snapshots(pool_symbol, hours, fetch_size, limit,
+                                                           epoch_timestamps=True, latest=latest):
+            _, timestamps, *numeric = zip(*rows)
+            chunk = {'timestamp': np.fromiter(timestamps, dtype=np.int64, count=len(rows))}
+            for column, values in zip(SNAPSHOT_NUMERIC_COLUMNS, numeric):
+                chunk[column] = np.fromiter(values, dtype=np.float64, count=len(rows))
+            yield chunk
+
+    @staticmethod
+    def get_pool_snapshots_bucketed(pool_symbol: str, hours: int = 8760, bucket: str = '1d') -> Dict[str, np.ndarray]:
+        """
+        在数据库端把快照聚合到固定时间桶 (1h / 4h / 1d / 1w), 返回与 get_pool_snapshots_columnar 相同的列式结构,
+        长窗口只需要传输 hours / 桶长 行。
+
+        timestamp 为桶起点 (int64 Unix 秒), 各列聚合方式:
+            wbtc_price                          桶内最后一个价格 (另有 wbtc_price_open/high/low)
+            liquidity / tvl_usd                 桶内平均值
+            volume_usd / gas_cost_usd           桶内合计
+            aave_wbtc_apy / univ3_lp_apy        小时收益率在桶内合计, 即整个桶的收益率
+        因此每一行仍然表示 "上一行到这一行之间" 的收益与成本, 可以直接交给净值计算。
+        另有 samples 列记录每个桶包含的小时快照数。出错时各列为空数组。
+
+        优先从能整除 bucket 的最粗的物化汇总 (pool_snapshot_rollups) 读取并在其上再聚合,
+        汇总表不存在或 bucket 没有可用的汇总 (1h) 时直接聚合原始快照。
+        """
+        if bucket not in SNAPSHOT_BUCKETS:
+            raise ValueError(f"Unsupported bucket {bucket!r}, expected one of {list(SNAPSHOT_BUCKETS)}")
+
+        raw_sql = """
+        SELECT
+            (EXTRACT(EPOCH FROM timestamp)::bigint / %(width)s) * %(width)s AS timestamp,
+            (array_agg(wbtc_price ORDER BY timestamp DESC))[1]::float8 AS wbtc_price,
+            (array_agg(wbtc_price ORDER BY timestamp ASC))[1]::float8 AS wbtc_price_open,
+            COALESCE(MAX(wbtc_price), 0)::float8 AS wbtc_price_high,
+            COALESCE(MIN(wbtc_price), 0)::float8 AS wbtc_price_low,
+            COALESCE(SUM(volume_usd), 0)::float8 AS volume_usd,
+            COALESCE(AVG(liquidity), 0)::float8 AS liquidity,
+            COALESCE(AVG(tvl_usd), 0)::float8 AS tvl_usd,
+            COALESCE(SUM(aave_wbtc_apy), 0)::float8 AS aave_wbtc_apy,
+            COALESCE(SUM(univ3_lp_apy), 0)::float8 AS univ3_lp_apy,
+            COALESCE(SUM(gas_cost_usd), 0)::float8 AS gas_cost_usd,
+            COUNT(*) AS samples
+        FROM pool_snapshots
+        WHERE pool_symbol = %(pool_symbol)s AND timestamp >= %(cutoff)s
+        GROUP BY 1
+        ORDER BY 1
+        """
+        # 汇总行中的平均值按小时数加权还原成合计; 包含 cutoff 的那个汇总桶也算在内
+        rollup_sql = """
+        SELECT
+            (EXTRACT(EPOCH FROM bucket_start)::bigint / %(width)s) * %(width)s AS timestamp,
+            (array_agg(price_close ORDER BY bucket_start DESC))[1]::float8 AS wbtc_price,
+            (array_agg(price_open ORDER BY bucket_start ASC))[1]::float8 AS wbtc_price_open,
+            COALESCE(MAX(price_high), 0)::float8 AS wbtc_price_high,
+            COALESCE(MIN(price_low), 0)::float8 AS wbtc_price_low,
+            COALESCE(SUM(volume_usd), 0)::float8 AS volume_usd,
+            COALESCE(SUM(liquidity_avg * samples) / SUM(samples), 0)::float8 AS liquidity,
+            COALESCE(SUM(tvl_usd_avg * samples) / SUM(samples), 0)::float8 AS tvl_usd,
+            COALESCE(SUM(aave_wbtc_apy_avg * samples), 0)::float8 AS aave_wbtc_apy,
+            COALESCE(SUM(univ3_lp_apy_avg * samples), 0)::float8 AS univ3_lp_apy,
+            COALESCE(SUM(gas_cost_usd), 0)::float8 AS gas_cost_usd,
+            SUM(samples)::bigint AS samples
+        FROM pool_snapshot_rollups
+        WHERE pool_symbol = %(pool_symbol)s AND bucket = %(rollup)s
+          AND bucket_start > %(cutoff)s::timestamp - %(rollup_width)s * interval '1 second'
+        GROUP BY 1
+        ORDER BY 1
+        """
+        rollup = _coarsest_rollup(bucket)
+        params = {
+            'width': SNAPSHOT_BUCKETS[bucket],
+            'pool_symbol': pool_symbol,
+            'cutoff': datetime.now() - timedelta(hours=hours),
+            'rollup': rollup,
+            'rollup_width': SNAPSHOT_BUCKETS[rollup] if rollup else None,
+        }
+
+        conn = None
+        try:
+            conn = acquire_connection()
+            with conn.cursor() as cur:
+                if rollup:
+                    cur.execute("SELECT to_regclass('pool_snapshot_rollups') IS NOT NULL")
+                    rollup = rollup if cur.fetchone()[0] else None
+                cur.execute(rollup_sql if rollup else raw_sql, params)
+                rows = cur.fetchall()
+            snapshots = rows_to_columns(rows, BUCKETED_COLUMNS)
+            source = f"{rollup} rollup" if rollup else "raw snapshots"
+            logger.info(f"📊 Retrieved {len(rows)} {bucket} buckets for {pool_symbol} ({hours}h, from {source})")
+            return snapshots
+        except Exception as e:
+            logger.error(f"Error getting bucketed pool snapshots: {e}", exc_info=True)
+            return empty_snapshot_columns(BUCKETED_COLUMNS)
+        finally:
+            if conn:
+                release_connection(conn)
+
+    @staticmethod
+    def refresh_pool_rollups(pool_symbol: Optional[str] = None, hours: Optional[int] = None) -> int:
+        """
+        定时刷新汇总 (用于绕过 insert_pool_snapshots / bulk_load_pool_snapshots 直接写入的数据):
+        只重算最近 hours 小时 (默认全部历史) 内有数据的桶。返回更新的汇总行数。
+        """
+        sql = """
+        SELECT pool_symbol, MIN(timestamp), MAX(timestamp) FROM pool_snapshots
+        WHERE (%(pool_symbol)s::text IS NULL OR pool_symbol = %(pool_symbol)s)
+          AND (%(cutoff)s::timestamp IS NULL OR timestamp >= %(cutoff)s)
+        GROUP BY pool_symbol
+        """
+        cutoff = datetime.now() - timedelta(hours=hours) if hours else None
+        conn = None
+        try:
+            conn = acquire_connection()
+            with conn.cursor() as cur:
+                cur.execute(sql, {'pool_symbol': pool_symbol, 'cutoff': cutoff})
+                refreshed = refresh_rollups(cur, cur.fetchall())
+            conn.commit()
+            logger.info(f"✅ Refreshed {refreshed:,} rollup rows")
+            return refreshed
+        except Exception as e:
+            logger.error(f"❌ Error refreshing rollups: {e}", exc_info=True)
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                release_connection(conn)
 
     # ========== 策略执行 ==========
     @staticmethod
@@ -175,8 +673,9 @@ class DatabaseManager:
                 %(tx_hash)s, %(model_confidence)s, %(safety_bounds)s, %(additional_info)s)
         RETURNING id
         """
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor() as cur:
                 cur.execute(sql, {
                     **execution,
@@ -194,7 +693,7 @@ class DatabaseManager:
             return None
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
 
     @staticmethod
     def get_strategy_executions(pool_symbol: str, hours: int = 720) -> List[Dict]:
@@ -206,8 +705,9 @@ class DatabaseManager:
         ORDER BY timestamp DESC
         """
 
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(sql, (pool_symbol, cutoff))
                 rows = cur.fetchall()
@@ -218,7 +718,7 @@ class DatabaseManager:
             return []
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
 
     # ========== 缓存指标 ==========
     @staticmethod
@@ -232,8 +732,9 @@ class DatabaseManager:
             metrics = EXCLUDED.metrics,
             calculated_at = EXCLUDED.calculated_at
         """
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor() as cur:
                 cur.execute(sql, (
                     pool_symbol, period, json.dumps(metrics), datetime.now()
@@ -246,7 +747,7 @@ class DatabaseManager:
                 conn.rollback()
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
 
     @staticmethod
     def get_cached_metrics(pool_symbol: str, period: str, max_age_minutes: int = 15) -> Optional[Dict]:
@@ -256,15 +757,70 @@ class DatabaseManager:
         WHERE pool_symbol = %s AND period = %s AND calculated_at >= %s
         """
         cutoff = datetime.now() - timedelta(minutes=max_age_minutes)
+        conn = None
         try:
-            conn = get_connection()
+            conn = acquire_connection()
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(sql, (pool_symbol, period, cutoff))
                 row = cur.fetchone()
-            return json.loads(row["metrics"]) if row else None
+            if not row:
+                return None
+            # metrics 列为 JSONB 时 psycopg2 已解析成 dict, 旧的 TEXT 列仍是 JSON 字符串
+            metrics = row["metrics"]
+            return {
+                "metrics": json.loads(metrics) if isinstance(metrics, str) else metrics,
+                "calculated_at": row["calculated_at"].isoformat(),
+            }
         except Exception as e:
             logger.error(f"❌ Error getting cached metrics: {e}", exc_info=True)
             return None
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
+
+
+def create_storage_backend(url: Optional[str] = None) -> StorageBackend:
+    """
+    按连接串创建存储后端 (默认取 DATABASE_URL):
+        postgres://... / postgresql://...   PostgresStorage
+        sqlite:///relative/path.db          SQLiteStorage, 相对当前目录; sqlite:////abs/path.db 为绝对路径
+        未设置                              SQLiteStorage(LOCAL_DATABASE_PATH), 两者都未设置时报错
+    """
+    url = DATABASE_URL if url is None else url
+    if not url:
+        if not LOCAL_DATABASE_PATH:
+            raise ValueError("❌ DATABASE_URL not found in environment variables "
+                             "(set LOCAL_DATABASE_PATH to use a local SQLite file instead)")
+        logger.warning(f"⚠️  DATABASE_URL not set, using local SQLite database {LOCAL_DATABASE_PATH}")
+        return SQLiteStorage(LOCAL_DATABASE_PATH)
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url[len("sqlite:///"):])
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresStorage()
+    raise ValueError(f"❌ Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_storage_backend() -> StorageBackend:
+    """进程内共用的默认存储后端, 第一次使用时按 DATABASE_URL 创建"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_storage_backend()
+        return _backend
+
+
+class DatabaseManager:
+    """
+    数据库操作类: 方法调用转发给存储后端 (方法列表见 storage.StorageBackend)。
+    默认使用进程内共用的后端, 也可以显式传入 (如基准测试中使用临时的 SQLite 文件)。
+    """
+
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or get_storage_backend()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
@@ -0,0 +1,337 @@
+"""
+数据库结构迁移 (pool_snapshots / pool_snapshot_rollups / strategy_executions / performance_cache)
+
+每个迁移有一个递增的版本号, 已执行的版本记录在 schema_migrations 表中; upgrade 只执行尚未执行的版本,
+每个版本在单独的事务中执行, 并用 advisory lock 防止多个进程同时升级。
+
+pool_snapshots 按 timestamp 每月一个分区 (RANGE 分区), 主键 (pool_symbol, timestamp) 兼作
+"某个池子最近 N 小时" 查询的索引, 另有 timestamp 上的 BRIN 索引用于跨池子的时间范围扫描。
+查询按时间过滤时只会扫描相关月份的分区, 历史增长到多个池子 × 多年后延迟也不随之上升。
+超出已有分区范围的行写入默认分区, 之后 ensure_pool_snapshot_partitions 会把它们移到对应月份的分区。
+
+用法 (在 packages/ai_agent 目录下):
+    python db_migrations.py status
+    python db_migrations.py upgrade
+    python db_migrations.py partitions --start 2023-01 --months-ahead 3
+    python db_migrations.py refresh-rollups --hours 48
+"""
+
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Callable, List, Optional, Tuple
+
+from database import SNAPSHOT_NUMERIC_COLUMNS, PostgresStorage, get_connection, refresh_rollups
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 升级时预先创建到未来几个月的分区
+PARTITION_MONTHS_AHEAD = 3
+# 所有迁移共用的 advisory lock 键
+MIGRATION_LOCK_KEY = 0x706f6f6c
+
+
+# ========== 分区维护 ==========
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"pool_snapshots_y{month.year}m{month.month:02d}"
+
+
+def _is_partitioned(cur, table: str) -> Optional[bool]:
+    """表不存在时返回 None"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return None if row is None else row[0] == 'p'
+
+
+def _create_month_partition(cur, month: date) -> bool:
+    """
+    创建 month 所在月份的分区; 已存在时返回 False。
+    默认分区中已有该月份的行时, 先把这些行移到新表再挂载为分区 (否则 PostgreSQL 会拒绝创建)。
+    """
+    name = _partition_name(month)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]:
+        return False
+
+    lower, upper = month, _add_months(month, 1)
+    cur.execute(f"CREATE TABLE {name} (LIKE pool_snapshots INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+    WITH moved AS (
+        DELETE FROM pool_snapshots_default
+        WHERE timestamp >= %s AND timestamp < %s
+        RETURNING *
+    )
+    INSERT INTO {name} SELECT * FROM moved
+    """, (lower, upper))
+    if cur.rowcount:
+        logger.info(f"  ↪ moved {cur.rowcount} rows from pool_snapshots_default into {name}")
+    cur.execute(f"ALTER TABLE pool_snapshots ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                (lower.isoformat(), upper.isoformat()))
+    return True
+
+
+def _ensure_partitions(cur, start, end) -> int:
+    """确保 [start 所在月, end 所在月] 的每个月都有分区, 返回新建的分区数"""
+    month, last, created = _month_start(start), _month_start(end), 0
+    while month <= last:
+        created += _create_month_partition(cur, month)
+        month = _add_months(month, 1)
+    return created
+
+
+def ensure_pool_snapshot_partitions(start, end=None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """
+    为 [start, end] 覆盖的月份以及未来 months_ahead 个月创建 pool_snapshots 分区 (已有的跳过)。
+    批量导入历史数据前调用, 可以让数据直接写进对应月份的分区。
+    """
+    end = max(end or datetime.now(), datetime.now())
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            if not _is_partitioned(cur, 'pool_snapshots'):
+                raise RuntimeError("pool_snapshots is not partitioned, run `python db_migrations.py upgrade` first")
+            created = _ensure_partitions(cur, start, _add_months(_month_start(end), months_ahead))
+        conn.commit()
+        if created:
+            logger.info(f"✅ Created {created} pool_snapshots partitions")
+        return created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ========== 迁移 ==========
+
+def _create_schema(cur):
+    """
+    建表与索引。已有未分区的旧 pool_snapshots 时, 先改名为 pool_snapshots_legacy,
+    建好分区表和覆盖其时间范围的分区后把两表共有的列拷贝过来。旧表保留, 确认数据无误后再手动删除。
+    """
+    legacy = _is_partitioned(cur, 'pool_snapshots') is False
+    if legacy:
+        logger.info("  ↪ converting existing pool_snapshots into a partitioned table")
+        cur.execute("ALTER TABLE pool_snapshots RENAME TO pool_snapshots_legacy")
+        for constraint in ('pool_snapshots_pkey', 'pool_snapshots_pool_symbol_timestamp_key'):
+            cur.execute(f"ALTER TABLE pool_snapshots_legacy DROP CONSTRAINT IF EXISTS {constraint}")
+
+    numeric_columns = ",\n        ".join(f"{c} DOUBLE PRECISION NOT NULL DEFAULT 0" for c in SNAPSHOT_NUMERIC_COLUMNS)
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS pool_snapshots (
+        pool_symbol TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        {numeric_columns},
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (pool_symbol, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS pool_snapshots_default PARTITION OF pool_snapshots DEFAULT")
+    cur.execute("CREATE INDEX IF NOT EXISTS pool_snapshots_timestamp_brin ON pool_snapshots USING BRIN (timestamp)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS strategy_executions (
+        id BIGSERIAL PRIMARY KEY,
+        pool_symbol TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        aave_wbtc_pool DOUBLE PRECISION NOT NULL,
+        uniswap_v3_lp DOUBLE PRECISION NOT NULL,
+        tx_hash TEXT,
+        model_confidence DOUBLE PRECISION,
+        safety_bounds JSONB,
+        additional_info JSONB,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS strategy_executions_pool_timestamp_idx
+    ON strategy_executions (pool_symbol, timestamp DESC)
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS performance_cache (
+        pool_symbol TEXT NOT NULL,
+        period TEXT NOT NULL,
+        metrics JSONB NOT NULL,
+        calculated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (pool_symbol, period)
+    )
+    """)
+
+    if legacy:
+        cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM pool_snapshots_legacy")
+        earliest, latest = cur.fetchone()
+        if earliest is not None:
+            _ensure_partitions(cur, earliest, latest)
+        cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'pool_snapshots_legacy'
+        ORDER BY ordinal_position
+        """)
+        legacy_columns = [row[0] for row in cur.fetchall()]
+        # 旧表缺少的数值列取新表的默认值 0, created_at 缺少时取 now()
+        copied = [c for c in ('pool_symbol', 'timestamp') + SNAPSHOT_NUMERIC_COLUMNS + ('created_at',)
+                  if c in legacy_columns]
+        columns = ", ".join(copied)
+        cur.execute(f"""
+        INSERT INTO pool_snapshots ({columns})
+        SELECT {columns} FROM pool_snapshots_legacy
+        ON CONFLICT (pool_symbol, timestamp) DO NOTHING
+        """)
+        logger.info(f"  ↪ copied {cur.rowcount} rows from pool_snapshots_legacy")
+        skipped = [c for c in legacy_columns if c not in copied]
+        if skipped:
+            logger.warning(f"⚠️  columns not copied from pool_snapshots_legacy: {', '.join(skipped)}")
+        logger.info("  ↪ kept pool_snapshots_legacy; drop it with 'DROP TABLE pool_snapshots_legacy' once verified")
+
+
+def _create_rollups(cur):
+    """
+    物化汇总表: 每个池子每个 4h / 1d 桶一行 (价格 OHLC、成交量合计、平均 TVL/流动性/APY、gas 合计)。
+    建表后用现有快照全量回填; 之后由写入快照时的增量刷新维护 (database.refresh_rollups)。
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pool_snapshot_rollups (
+        pool_symbol TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        bucket_start TIMESTAMP NOT NULL,
+        price_open DOUBLE PRECISION NOT NULL,
+        price_high DOUBLE PRECISION NOT NULL,
+        price_low DOUBLE PRECISION NOT NULL,
+        price_close DOUBLE PRECISION NOT NULL,
+        volume_usd DOUBLE PRECISION NOT NULL,
+        liquidity_avg DOUBLE PRECISION NOT NULL,
+        tvl_usd_avg DOUBLE PRECISION NOT NULL,
+        aave_wbtc_apy_avg DOUBLE PRECISION NOT NULL,
+        univ3_lp_apy_avg DOUBLE PRECISION NOT NULL,
+        gas_cost_usd DOUBLE PRECISION NOT NULL,
+        samples INTEGER NOT NULL,
+        refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (pool_symbol, bucket, bucket_start)
+    )
+    """)
+    cur.execute("SELECT pool_symbol, MIN(timestamp), MAX(timestamp) FROM pool_snapshots GROUP BY pool_symbol")
+    refreshed = refresh_rollups(cur, cur.fetchall())
+    logger.info(f"  ↪ backfilled {refreshed} rollup rows")
+
+
+# (版本号, 名称, 迁移函数); 只能在末尾追加, 已发布的迁移不要修改
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'create_schema', _create_schema),
+    (2, 'create_rollups', _create_rollups),
+]
+
+
+def _ensure_migrations_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """)
+
+
+def applied_versions() -> List[int]:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            _ensure_migrations_table(cur)
+            cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+            versions = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return versions
+    finally:
+        conn.close()
+
+
+def upgrade(target: Optional[int] = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[int]:
+    """
+    依次执行尚未执行的迁移 (直到 target 版本, 默认全部), 然后补齐到未来 months_ahead 个月的分区。
+    每个迁移单独一个事务, 失败时回滚该迁移并抛出异常, 之前已完成的迁移保留。返回本次执行的版本号。
+    """
+    conn = get_connection()
+    applied_now = []
+    try:
+        for version, name, migrate in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+                _ensure_migrations_table(cur)
+                cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+                logger.info(f"⬆️  Applying migration {version:04d}_{name}")
+                migrate(cur)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            applied_now.append(version)
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            if _is_partitioned(cur, 'pool_snapshots'):
+                today = datetime.now()
+                created = _ensure_partitions(cur, today, _add_months(_month_start(today), months_ahead))
+                if created:
+                    logger.info(f"✅ Created {created} pool_snapshots partitions")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"✅ Schema is at version {max(applied_versions(), default=0)} "
+                f"({len(applied_now)} migration(s) applied)")
+    return applied_now
+
+
+def _parse_month(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库结构迁移')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='显示已执行和待执行的迁移')
+    upgrade_parser = subparsers.add_parser('upgrade', help='执行待执行的迁移')
+    upgrade_parser.add_argument('--target', type=int, default=None, help='升级到指定版本 (默认: 最新)')
+    upgrade_parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD, help='预建未来几个月的分区')
+    partitions_parser = subparsers.add_parser('partitions', help='创建 pool_snapshots 的月分区')
+    partitions_parser.add_argument('--start', type=_parse_month, required=True, help='起始月份 YYYY-MM')
+    partitions_parser.add_argument('--end', type=_parse_month, default=None, help='结束月份 YYYY-MM (默认: 当前月)')
+    partitions_parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD, help='预建未来几个月的分区')
+    rollups_parser = subparsers.add_parser('refresh-rollups', help='重算汇总表 (定时任务)')
+    rollups_parser.add_argument('--pool', default=None, help='只刷新指定池子 (默认: 全部)')
+    rollups_parser.add_argument('--hours', type=int, default=None, help='只刷新最近 N 小时 (默认: 全部历史)')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        applied = set(applied_versions())
+        for version, name, _ in MIGRATIONS:
+            print(f"  [{'x' if version in applied else ' '}] {version:04d}_{name}")
+    elif args.command == 'upgrade':
+        upgrade(args.target, args.months_ahead)
+    elif args.command == 'refresh-rollups':
+        PostgresStorage.refresh_pool_rollups(args.pool, args.hours)
+    else:
+        end = datetime.combine(args.end, datetime.min.time()) if args.end else None
+        ensure_pool_snapshot_partitions(args.start, end, args.months_ahead)
+
+
+if __name__ == "__main__":
+    main()
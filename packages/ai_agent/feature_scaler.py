@@ -0,0 +1,41 @@
+"""
+轻量级特征标准化器 - 只依赖 numpy
+
+训练阶段使用 sklearn 的 StandardScaler，推理阶段只需要 mean/scale 两个数组。
+把参数抽出来后，导出的模型包（TorchScript / ONNX 等）无需再 pickle sklearn 对象。
+"""
+
+from typing import Dict
+
+import numpy as np
+
+
+class ArrayScaler:
+    """与 StandardScaler.transform 等价的纯 numpy 实现"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float32)
+        self.scale_ = np.asarray(scale, dtype=np.float32)
+        if self.mean_.shape != self.scale_.shape:
+            raise ValueError(f"Scaler mean/scale shape mismatch: {self.mean_.shape} vs {self.scale_.shape}")
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> "ArrayScaler":
+        """从已拟合的 sklearn StandardScaler 构造"""
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones_like(scaler.mean_)
+        return cls(scaler.mean_, scale)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ArrayScaler":
+        return cls(data['mean'], data['scale'])
+
+    def to_dict(self) -> Dict:
+        return {'mean': self.mean_.tolist(), 'scale': self.scale_.tolist()}
+
+    @property
+    def n_features(self) -> int:
+        return int(self.mean_.shape[0])
+
+    def transform(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        return (X - self.mean_) / self.scale_
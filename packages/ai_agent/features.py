@@ -0,0 +1,67 @@
+# 特征工程: 把 Uniswap V3 小时快照转换为模型输入的28维特征向量序列
+# 训练 (ai_strategy_system.py) 和推理 (predict.py) 共用; 本模块不依赖 torch, pandas 也只在调用时才导入
+
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 特征向量各维度的含义, 顺序与 create_feature_sequences_from_snapshots 中的 feature_vector 一致
+# 模型包的 manifest 会记录这份 schema, 加载时用于检测特征版本不一致
+FEATURE_NAMES = [
+    'price', 'price_ma_24', 'price_return_1h', 'price_volatility_24h',
+    'volume_usd', 'volume_ma_24',
+    'liquidity', 'tvl_usd', 'tvl_change_24h',
+    'aave_wbtc_apy',
+    'gas_base_fee_gwei',
+    'hour_of_day_sin',
+] + [f'padding_{i}' for i in range(12, 28)]
+
+def create_feature_sequences_from_snapshots(snapshots: List[Dict], aave_reserves: List[Dict], gas_data: Dict) -> List[Dict]:
+    if not snapshots: return []
+        
+    import pandas as pd
+
+    df = pd.DataFrame(snapshots)
+    numeric_cols = ['token0Price', 'volumeUSD', 'liquidity', 'tvlUSD']
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['timestamp'] = pd.to_datetime(df['periodStartUnix'], unit='s')
+    df = df.sort_values('timestamp').ffill().fillna(0)
+
+    df['price_ma_24'] = df['token0Price'].rolling(24, min_periods=1).mean()
+    df['price_return_1h'] = df['token0Price'].pct_change(1).fillna(0)
+    df['price_volatility_24h'] = df['price_return_1h'].rolling(24, min_periods=1).std().fillna(0)
+    df['volume_ma_24'] = df['volumeUSD'].rolling(24, min_periods=1).mean()
+    df['tvl_change_24h'] = df['tvlUSD'].pct_change(24).fillna(0)
+
+    # usdc_apy = 3.5
+    wbtc_apy = 0.1 
+    for reserve in aave_reserves:
+        # if reserve['symbol'] == 'USDC':
+        if reserve['symbol'] == 'WBTC':
+            usdc_apy = (float(reserve.get('liquidityRate', 0)) / 1e27) * 100
+            logger.info(f"USDC APY from AAVE: {usdc_apy:.2f}%")
+            break
+
+    feature_sequences = []
+    for _, row in df.iterrows():
+        feature_vector = [
+            row['token0Price'], row['price_ma_24'], row['price_return_1h'], row['price_volatility_24h'],
+            row['volumeUSD'], row['volume_ma_24'],
+            row['liquidity'], row['tvlUSD'], row['tvl_change_24h'],
+            wbtc_apy, 
+            gas_data.get('base_fee_gwei', 0.001),
+            np.sin(2 * np.pi * row['timestamp'].hour / 24)
+        ]
+        padding = [0] * (28 - len(feature_vector))
+        feature_vector.extend(padding)
+
+        feature_sequences.append({
+            'timestamp': row['timestamp'].isoformat(),
+            'price_current': row['token0Price'],
+            'feature_vector': feature_vector
+        })
+    return feature_sequences
@@ -1,5 +1,5 @@
 """
-数据迁移脚本：将 complete_defi_data.json 导入 PostgreSQL
+数据迁移脚本：将 complete_defi_data.json 导入数据库 (PostgreSQL, 或未配置时的本地 SQLite)
 """
 import json
 import os
@@ -126,55 +126,47 @@ class DataMigrator:
         gas_data = pool_data.get('gas_current', {})
         gas_cost_usd = gas_data.get('base_fee_gwei', 0.001) * 0.01  # 估算
         
-        # 转换所有快照
+        # 转换所有快照 (生成器, 边转换边写入数据库)
         raw_snapshots = pool_data.get('snapshots', [])
         logger.info(f"  📦 原始快照数: {len(raw_snapshots)}")
         
-        transformed_snapshots = []
-        for raw_snap in raw_snapshots:
-            snapshot = self.transform_snapshot(
-                pool_symbol, 
-                raw_snap, 
-                aave_wbtc_apy, 
-                gas_cost_usd
-            )
-            if snapshot:
-                transformed_snapshots.append(snapshot)
+        transformed_snapshots = (
+            self.transform_snapshot(pool_symbol, raw_snap, aave_wbtc_apy, gas_cost_usd)
+            for raw_snap in raw_snapshots
+        )
         
-        logger.info(f"  ✅ 有效快照数: {len(transformed_snapshots)}")
+        # COPY 到临时表后一次合并, 整个池子只用一个连接和一个事务
+        try:
+            total_inserted = self.db.bulk_load_pool_snapshots(
+                (s for s in transformed_snapshots if s), total=len(raw_snapshots)
+            )
+        except Exception as e:
+            logger.error(f"  ❌ 批量导入失败: {e}")
+            self.stats['failed_snapshots'] += len(raw_snapshots)
+            return
         
-        if not transformed_snapshots:
+        if not total_inserted:
             logger.warning(f"  ⚠️  没有有效数据，跳过")
             return
         
-        # 批量插入 (每次500条，避免超时)
-        batch_size = 500
-        total_inserted = 0
-        
-        for i in range(0, len(transformed_snapshots), batch_size):
-            batch = transformed_snapshots[i:i + batch_size]
-            
-            try:
-                inserted = self.db.insert_pool_snapshots(batch)
-                total_inserted += inserted
-                
-                progress = (i + len(batch)) / len(transformed_snapshots) * 100
-                logger.info(
-                    f"  💾 批次 {i//batch_size + 1}: "
-                    f"插入 {len(batch)} 条 "
-                    f"({progress:.1f}%)"
-                )
-                
-            except Exception as e:
-                logger.error(f"  ❌ 批次插入失败: {e}")
-                self.stats['failed_snapshots'] += len(batch)
-                continue
-        
         self.stats['successful_snapshots'] += total_inserted
         self.stats['pools_processed'] += 1
         
         logger.info(f"  ✅ 池子处理完成，共插入 {total_inserted} 条记录")
     
+    def prepare_schema(self, pools: Dict):
+        """建表/执行待执行的结构迁移, 并确保 JSON 数据覆盖的时间范围可以写入 (PostgreSQL 为按月分区)"""
+        timestamps = [
+            int(snap['periodStartUnix'])
+            for pool_data in pools.values()
+            for snap in pool_data.get('snapshots', [])
+            if 'periodStartUnix' in snap
+        ]
+        if timestamps:
+            self.db.ensure_schema(datetime.fromtimestamp(min(timestamps)), datetime.fromtimestamp(max(timestamps)))
+        else:
+            self.db.ensure_schema()
+    
     def migrate_strategy_logs(self):
         """迁移策略执行日志（如果存在）"""
         log_file = 'logs/strategy_executions.jsonl'
@@ -232,7 +224,7 @@ class DataMigrator:
         logger.info(f"{'='*70}")
         
         try:
-            stats = self.db.get_database_stats()
+            stats = self.db.get_database_stats(exact=True)
             
             # 显示快照统计
             logger.info("\n📊 池子快照统计:")
@@ -269,7 +261,7 @@ class DataMigrator:
     def run_full_migration(self):
         """运行完整迁移流程"""
         logger.info("\n" + "="*70)
-        logger.info("🚀 开始数据迁移到 PostgreSQL (Supabase)")
+        logger.info("🚀 开始数据迁移到数据库")
         logger.info("="*70)
         
         start_time = datetime.now()
@@ -290,6 +282,9 @@ class DataMigrator:
                 for pool_data in pools.values()
             )
             
+            # 建表/升级结构, 并预先建好数据覆盖月份的分区
+            self.prepare_schema(pools)
+            
             for pool_symbol, pool_data in pools.items():
                 self.migrate_pool_snapshots(pool_symbol, pool_data)
             
@@ -327,7 +322,7 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(
-        description='将 DeFi 数据从 JSON 迁移到 PostgreSQL'
+        description='将 DeFi 数据从 JSON 迁移到数据库'
     )
     parser.add_argument(
         '--json-file',
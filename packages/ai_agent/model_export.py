@@ -0,0 +1,229 @@
+# 模型导出工具: 把训练得到的 fp32 模型包转换为推理专用的格式
+#   int8: 动态量化 + TorchScript trace
+#   onnx: ONNX 计算图 + scaler 参数, 供 onnxruntime 无 torch 推理
+#   mmap: 免 pickle 的内存映射目录包 (见 model_package.py)
+# 导出后都会在时间序列末尾的留出窗口上校验输出与 fp32 模型的一致性
+
+import argparse
+import io
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from ai_strategy_system import WeeklyStrategyLSTM
+from feature_scaler import ArrayScaler
+from features import create_feature_sequences_from_snapshots
+from model_package import load_model_package, save_model_package
+from onnx_predictor import ONNX_METADATA_SUFFIX, OnnxStrategyPredictor
+from predict import resolve_model_package_path
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOOKBACK_HOURS = 72
+ONNX_OPSET_VERSION = 14
+
+
+def load_fp32_package(package_path: str) -> Tuple[nn.Module, ArrayScaler, Dict]:
+    """加载训练脚本保存的 torch.save 模型包，返回 (model, scaler, config)"""
+    package = torch.load(package_path, map_location='cpu')
+    model = WeeklyStrategyLSTM(input_dim=28)
+    model.load_state_dict(package['model_state_dict'])
+    model.eval()
+    scaler = ArrayScaler.from_sklearn(package['scaler'])
+    config = package.get('config', {'lookback_hours': DEFAULT_LOOKBACK_HOURS})
+    return model, scaler, config
+
+
+def load_holdout_windows(pool_data: Dict, scaler: ArrayScaler, lookback_hours: int,
+                         holdout_fraction: float = 0.2, stride: int = 1, max_windows: int = 64,
+                         gap_hours: Optional[int] = None) -> np.ndarray:
+    """
+    取时间序列末尾 holdout_fraction 部分的滑动窗口作为校验样本。
+    训练区间的末尾与第一个校验窗口之间至少间隔 gap_hours (默认且不小于 lookback_hours) 行,
+    校验窗口中的行不会出现在任何训练序列里。
+    返回形状为 (N, lookback_hours, input_dim) 的已标准化数组。
+    """
+    feature_sequences = create_feature_sequences_from_snapshots(
+        pool_data['snapshots'],
+        pool_data['aave_current_reserves'],
+        pool_data['gas_current']
+    )
+    features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
+    if len(features) < lookback_hours:
+        raise ValueError(f"Not enough data for hold-out windows. Need {lookback_hours} hours, but only have {len(features)}.")
+
+    scaled = scaler.transform(features)
+    gap_hours = max(gap_hours or 0, lookback_hours)
+    first_start = int(len(scaled) * (1 - holdout_fraction)) + gap_hours
+    starts = list(range(first_start, len(scaled) - lookback_hours + 1, stride))[-max_windows:]
+    if not starts:
+        raise ValueError(f"Not enough data for hold-out windows: {len(features)} hours, the last "
+                         f"{holdout_fraction:.0%} minus a {gap_hours}h gap is shorter than {lookback_hours} hours.")
+    return np.stack([scaled[s:s + lookback_hours] for s in starts]).astype(np.float32)
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """对 LSTM 和 Linear 层做 int8 动态量化（仅 CPU）"""
+    return torch.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def check_accuracy(reference: Callable[[np.ndarray], np.ndarray], candidate: Callable[[np.ndarray], np.ndarray],
+                   windows: np.ndarray, tolerance: float) -> Dict:
+    """
+    比较两个推理函数在同一批窗口上的输出。
+    allocation 误差按绝对值衡量，tolerance 作用于所有输出维度的最大绝对误差。
+    """
+    ref = reference(windows)
+    cand = candidate(windows)
+    abs_err = np.abs(ref - cand)
+    report = {
+        'num_windows': int(len(windows)),
+        'max_abs_error': float(abs_err.max()),
+        'mean_abs_error': float(abs_err.mean()),
+        'allocation_max_abs_error': float(abs_err[:, :2].max()),
+        'boundary_max_abs_error': float(abs_err[:, 2:].max()),
+        'tolerance': tolerance,
+    }
+    report['passed'] = report['max_abs_error'] <= tolerance
+    return report
+
+
+def _torch_runner(model) -> Callable[[np.ndarray], np.ndarray]:
+    def run(windows: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return model(torch.from_numpy(windows)).numpy()
+    return run
+
+
+def export_int8_torchscript(package_path: str, output_path: str, holdout_windows: np.ndarray,
+                            tolerance: float = 0.02) -> Dict:
+    """
+    导出 int8 动态量化 + TorchScript trace 的模型包。
+    scaler 参数和 config 以 extra files 的形式写入同一个文件，加载时不需要 sklearn。
+    """
+    model, scaler, config = load_fp32_package(package_path)
+
+    quantized = quantize_dynamic(model)
+    example = torch.from_numpy(holdout_windows[:1])
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, example, check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+
+    report = check_accuracy(_torch_runner(model), _torch_runner(traced), holdout_windows, tolerance)
+    logger.info(f"  Int8 accuracy check: max abs error {report['max_abs_error']:.6f} "
+                f"(allocation {report['allocation_max_abs_error']:.6f}) over {report['num_windows']} windows")
+    if not report['passed']:
+        raise ValueError(f"Quantized model deviates from fp32 by {report['max_abs_error']:.6f} "
+                         f"(tolerance {tolerance}). Refusing to export.")
+
+    extra_files = {
+        'scaler.json': json.dumps(scaler.to_dict()),
+        'config.json': json.dumps({**config, 'source_package': os.path.basename(package_path), 'precision': 'int8'}),
+    }
+    tmp_path = output_path + '.tmp'
+    torch.jit.save(traced, tmp_path, _extra_files=extra_files)
+    os.replace(tmp_path, output_path)
+    logger.info(f"  Int8 TorchScript package saved to {output_path}")
+    return report
+
+
+def export_onnx(package_path: str, output_path: str, holdout_windows: np.ndarray,
+                tolerance: float = 1e-4) -> Dict:
+    """
+    导出 ONNX 模型，scaler 参数和 config 写入同名的 .onnx.json 文件。
+    导出后用 onnxruntime 加载并与 torch fp32 输出做一致性校验。
+    """
+    model, scaler, config = load_fp32_package(package_path)
+
+    # 先导出到内存再整体写盘，避免留下写了一半的模型文件
+    buffer = io.BytesIO()
+    example = torch.from_numpy(holdout_windows[:1])
+    torch.onnx.export(
+        model, (example,), buffer,
+        input_names=['features'],
+        output_names=['strategy'],
+        dynamic_axes={'features': {0: 'batch'}, 'strategy': {0: 'batch'}},
+        opset_version=ONNX_OPSET_VERSION,
+    )
+    metadata = {
+        'scaler': scaler.to_dict(),
+        'config': {**config, 'source_package': os.path.basename(package_path), 'opset_version': ONNX_OPSET_VERSION},
+    }
+    # 先写临时文件并在临时文件上校验, 通过后才替换现有的模型包, 校验失败时保留上一次的导出
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    with open(tmp_path + ONNX_METADATA_SUFFIX, 'w') as f:
+        json.dump(metadata, f)
+
+    try:
+        onnx_predictor = OnnxStrategyPredictor(tmp_path)
+        report = check_accuracy(_torch_runner(model), onnx_predictor.run, holdout_windows, tolerance)
+        logger.info(f"  ONNX parity check: max abs error {report['max_abs_error']:.2e} over {report['num_windows']} windows")
+        if not report['passed']:
+            raise ValueError(f"ONNX model deviates from torch by {report['max_abs_error']:.2e} "
+                             f"(tolerance {tolerance}). Refusing to export.")
+    except Exception:
+        os.remove(tmp_path)
+        os.remove(tmp_path + ONNX_METADATA_SUFFIX)
+        raise
+
+    os.replace(tmp_path, output_path)
+    os.replace(tmp_path + ONNX_METADATA_SUFFIX, output_path + ONNX_METADATA_SUFFIX)
+    logger.info(f"  ONNX package saved to {output_path}")
+    return report
+
+
+def export_mmap_package(package_path: str, output_path: str, holdout_windows: np.ndarray,
+                        tolerance: float = 0.0) -> Dict:
+    """把 torch.save 模型包转换为内存映射目录包，并校验重新加载后的输出完全一致"""
+    model, scaler, config = load_fp32_package(package_path)
+    save_model_package(output_path, model, scaler, config)
+
+    mapped_model, _, _ = load_model_package(output_path)
+    report = check_accuracy(_torch_runner(model), _torch_runner(mapped_model), holdout_windows, tolerance)
+    logger.info(f"  Mmap package check: max abs error {report['max_abs_error']:.2e} over {report['num_windows']} windows")
+    if not report['passed']:
+        raise ValueError(f"Reloaded mmap package deviates from the source by {report['max_abs_error']:.2e}.")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出推理用的模型包 (int8 TorchScript / ONNX / mmap)')
+    parser.add_argument('--pool', default='wBTC-USDC', help='池子符号')
+    parser.add_argument('--format', choices=['int8', 'onnx', 'mmap'], default='int8', help='导出格式')
+    parser.add_argument('--data-file', default=os.path.join('data', 'complete_defi_data.json'),
+                        help='用于构造留出校验窗口的数据文件')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='与 fp32 输出的最大允许绝对误差 (默认 int8: 0.02, onnx: 1e-4, mmap: 0)')
+    parser.add_argument('--holdout-fraction', type=float, default=0.2,
+                        help='序列末尾用于构造留出校验窗口的比例 (与训练区间之间另有一个 lookback 的间隔)')
+    args = parser.parse_args()
+
+    package_path = resolve_model_package_path(args.pool, 'fp32')
+
+    with open(args.data_file, 'r') as f:
+        pool_data = json.load(f).get('pools', {}).get(args.pool)
+    if not pool_data:
+        raise ValueError(f"No data for pool {args.pool} in {args.data_file}")
+
+    _, scaler, config = load_fp32_package(package_path)
+    windows = load_holdout_windows(pool_data, scaler, config.get('lookback_hours', DEFAULT_LOOKBACK_HOURS),
+                                   holdout_fraction=args.holdout_fraction)
+    output_path = resolve_model_package_path(args.pool, args.format)
+    if args.format == 'onnx':
+        export_onnx(package_path, output_path, windows, tolerance=args.tolerance or 1e-4)
+    elif args.format == 'mmap':
+        export_mmap_package(package_path, output_path, windows, tolerance=args.tolerance or 0.0)
+    else:
+        export_int8_torchscript(package_path, output_path, windows, tolerance=args.tolerance or 0.02)
+
+
+if __name__ == "__main__":
+    main()
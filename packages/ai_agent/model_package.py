@@ -0,0 +1,130 @@
+"""
+免 pickle、可内存映射的模型包格式
+
+目录结构:
+    model_package_<pool>.pkg/
+        manifest.json   格式版本、模型结构参数、lookback_hours、input_dim、特征 schema、scaler、张量索引
+        weights.bin     所有张量的原始字节, 按 64 字节对齐依次排列
+
+加载时 weights.bin 通过 np.memmap 映射, 模型参数直接指向映射的页面而不做拷贝,
+因此同一台机器上的多个 agent 进程加载同一个模型时共享物理内存页。
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from ai_strategy_system import WeeklyStrategyLSTM
+from feature_scaler import ArrayScaler
+from features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+WEIGHTS_FILE = 'weights.bin'
+TENSOR_ALIGNMENT = 64
+
+
+def save_model_package(package_dir: str, model: WeeklyStrategyLSTM, scaler: ArrayScaler, config: Dict):
+    """
+    写出模型包目录。先写到临时目录再整体替换，读者不会看到写了一半的包。
+    """
+    tmp_dir = package_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    tensors = {}
+    offset = 0
+    with open(os.path.join(tmp_dir, WEIGHTS_FILE), 'wb') as f:
+        for name, tensor in model.state_dict().items():
+            array = tensor.detach().cpu().contiguous().numpy()
+            padding = (-offset) % TENSOR_ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(array.tobytes())
+            tensors[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+
+    manifest = {
+        'format_version': PACKAGE_FORMAT_VERSION,
+        'model': {
+            'class': type(model).__name__,
+            'input_dim': model.lstm.input_size,
+            'hidden_dim': model.lstm.hidden_size,
+            'num_layers': model.lstm.num_layers,
+            'num_heads': model.attention.num_heads,
+        },
+        'lookback_hours': config.get('lookback_hours', 72),
+        'input_dim': model.lstm.input_size,
+        'feature_schema': FEATURE_NAMES,
+        'config': config,
+        'scaler': scaler.to_dict(),
+        'tensors': tensors,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = package_dir + '.old'
+    if os.path.exists(package_dir):
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(package_dir, old_dir)
+    os.replace(tmp_dir, package_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"  Memory-mappable model package saved to {package_dir}")
+
+
+def read_manifest(package_dir: str) -> Dict:
+    """读取并校验 manifest, 与当前代码不兼容时抛出 ValueError"""
+    manifest_path = os.path.join(package_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Model package manifest not found at: {manifest_path}")
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    version = manifest.get('format_version')
+    if version != PACKAGE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model package format version {version} (expected {PACKAGE_FORMAT_VERSION}).")
+    if manifest['feature_schema'] != FEATURE_NAMES:
+        raise ValueError("Model package feature schema does not match the current feature pipeline. "
+                         "Retrain or re-export the model.")
+    if manifest['input_dim'] != len(FEATURE_NAMES) or len(manifest['scaler']['mean']) != manifest['input_dim']:
+        raise ValueError(f"Model package input_dim {manifest['input_dim']} does not match "
+                         f"feature schema ({len(FEATURE_NAMES)}) or scaler ({len(manifest['scaler']['mean'])}).")
+    return manifest
+
+
+def load_model_package(package_dir: str) -> Tuple[nn.Module, ArrayScaler, Dict]:
+    """
+    加载模型包，返回 (model, scaler, manifest)。模型参数直接映射到 weights.bin。
+    """
+    manifest = read_manifest(package_dir)
+    model = WeeklyStrategyLSTM(**{k: v for k, v in manifest['model'].items() if k != 'class'})
+
+    # copy-on-write 映射: 推理时从不写权重, 各进程共享同一份页缓存
+    weights = np.memmap(os.path.join(package_dir, WEIGHTS_FILE), dtype=np.uint8, mode='c')
+    params = dict(model.named_parameters())
+    params.update(model.named_buffers())
+    missing = set(params) - set(manifest['tensors'])
+    if missing:
+        raise ValueError(f"Model package is missing tensors: {sorted(missing)}")
+
+    for name, spec in manifest['tensors'].items():
+        if name not in params:
+            raise ValueError(f"Model package contains unexpected tensor '{name}'.")
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        array = np.frombuffer(weights, dtype=dtype, count=count, offset=spec['offset']).reshape(spec['shape'])
+        target = params[name]
+        if tuple(target.shape) != tuple(array.shape):
+            raise ValueError(f"Tensor '{name}' has shape {tuple(array.shape)}, expected {tuple(target.shape)}.")
+        target.data = torch.from_numpy(array)
+
+    model.eval()
+    return model, ArrayScaler.from_dict(manifest['scaler']), manifest
@@ -0,0 +1,72 @@
+"""
+基于 onnxruntime 的策略推理后端（不依赖 torch）
+
+模型文件由 model_export.py 导出：
+    models/model_package_<pool>.onnx        ONNX 计算图
+    models/model_package_<pool>.onnx.json   scaler 参数与 config
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+import onnxruntime as ort
+
+from feature_scaler import ArrayScaler
+
+logger = logging.getLogger(__name__)
+
+ONNX_METADATA_SUFFIX = '.json'
+
+
+class OnnxStrategyPredictor:
+    """
+    与 predict.StrategyPredictor 接口一致的 onnxruntime CPU 推理实现。
+    """
+    def __init__(self, model_package_path: str, num_threads: Optional[int] = None):
+        metadata_path = model_package_path + ONNX_METADATA_SUFFIX
+        for path in (model_package_path, metadata_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Model package not found at: {path}")
+
+        logger.info(f"Loading ONNX model package from: {model_package_path}")
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_package_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        self.scaler = ArrayScaler.from_dict(metadata['scaler'])
+        self.config = metadata.get('config', {'lookback_hours': 72})
+        self.lookback_hours = self.config['lookback_hours']
+
+        logger.info(f"ONNX model loaded successfully. Lookback window: {self.lookback_hours} hours.")
+
+    def prepare_input_data(self, feature_sequences: list) -> np.ndarray:
+        """
+        准备用于预测的输入数组，形状为 (1, lookback_hours, input_dim)。
+        """
+        if len(feature_sequences) < self.lookback_hours:
+            raise ValueError(f"Not enough recent data. Need {self.lookback_hours} hours, but only have {len(feature_sequences)}.")
+
+        recent_sequences = feature_sequences[-self.lookback_hours:]
+        recent_features = np.array([seq['feature_vector'] for seq in recent_sequences], dtype=np.float32)
+
+        return self.scaler.transform(recent_features)[np.newaxis, ...]
+
+    def run(self, windows: np.ndarray) -> np.ndarray:
+        """对已标准化的窗口批量推理，windows 形状为 (N, lookback_hours, input_dim)"""
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(windows, dtype=np.float32)})[0]
+
+    def predict(self, feature_sequences: list) -> np.ndarray:
+        """
+        执行预测。
+        """
+        return self.run(self.prepare_input_data(feature_sequences))[0]
@@ -1,49 +1,156 @@
 # --- START OF FILE predict_strategy.py ---
 
-import torch
-import torch.nn as nn
+# torch / 模型定义只在真正加载模型时才导入, 让 agent 进程启动时不必付出这部分开销
 import numpy as np
 import json
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Any
-from dotenv import load_dotenv
+from typing import Dict, Any, Tuple
 
 from data_fetcher import MultiPoolDeFiDataFetcher 
-from ai_strategy_system import WeeklyStrategyLSTM, create_feature_sequences_from_snapshots
+from features import create_feature_sequences_from_snapshots
+from feature_scaler import ArrayScaler
+from window_cache import ScaledWindowBuffer
+from prediction_cache import PredictionCache, model_package_hash
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 模型包格式 -> 文件后缀
+# fp32: 训练脚本保存的 torch.save 模型包
+# int8: model_export.py 导出的动态量化 TorchScript 模型包
+# onnx: model_export.py 导出的 ONNX 模型, 由 onnxruntime 执行
+# mmap: model_package.py 定义的免 pickle 目录格式, 权重通过内存映射加载
+MODEL_FORMAT_SUFFIXES = {
+    'fp32': '.pth',
+    'int8': '.int8.pt',
+    'onnx': '.onnx',
+    'mmap': '.pkg',
+}
+
+
+def resolve_model_package_path(pool_symbol: str, model_format: str = 'fp32') -> str:
+    """根据池子符号和模型格式返回模型包路径"""
+    if model_format not in MODEL_FORMAT_SUFFIXES:
+        raise ValueError(f"Unknown model format '{model_format}'. Must be one of: {list(MODEL_FORMAT_SUFFIXES)}")
+    sanitized_symbol = pool_symbol.replace('/', '-')
+    return f'models/model_package_{sanitized_symbol}{MODEL_FORMAT_SUFFIXES[model_format]}'
+
+
+def load_predictor(model_package_path: str, cached: bool = False, verify_every: int = 0,
+                   last_query_attention: bool = False):
+    """根据模型包后缀选择推理后端; 增量推理相关参数只对 torch 后端生效"""
+    if model_package_path.endswith(MODEL_FORMAT_SUFFIXES['onnx']):
+        from onnx_predictor import OnnxStrategyPredictor
+        return OnnxStrategyPredictor(model_package_path)
+    return StrategyPredictor(model_package_path, cached=cached, verify_every=verify_every,
+                             last_query_attention=last_query_attention)
+
+
+# MC dropout 单次估计的默认耗时预算 (毫秒), 超出时告警; 可由 STRATEGY_MC_LATENCY_BUDGET_MS 覆盖
+MC_LATENCY_BUDGET_MS = 50.0
+
+# last_query_attention 模式与整窗重算比对时允许的最大绝对误差
+LAST_QUERY_TOLERANCE = 1e-6
+
+_PREDICTION_CACHE = PredictionCache(max_entries=int(os.getenv('STRATEGY_PREDICTION_CACHE_SIZE', 32)))
+
+# 增量推理模式下跨调用复用的 predictor (窗口缓存保存在 predictor 上),
+# 键为 (模型包路径, 推理选项), 值为 (模型包修改时间 st_mtime_ns, predictor)
+_PREDICTOR_CACHE: Dict[Tuple, Tuple[int, Any]] = {}
+
+
+def _get_cached_predictor(model_package_path: str, verify_every: int, last_query_attention: bool):
+    try:
+        mtime_ns = os.stat(model_package_path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Model package not found at: {model_package_path}") from None
+    key = (model_package_path, verify_every, last_query_attention)
+    cached = _PREDICTOR_CACHE.get(key)
+    if cached is None or cached[0] != mtime_ns:
+        # 选项不同的调用各自持有 predictor; 模型包被重新训练/导出 (修改时间变化) 后重新加载
+        cached = (mtime_ns, load_predictor(model_package_path, cached=True, verify_every=verify_every,
+                                           last_query_attention=last_query_attention))
+        _PREDICTOR_CACHE[key] = cached
+    return cached[1]
+
+
 class StrategyPredictor:
     """
-    使用已训练的模型包 (.pth) 来预测最新的DeFi策略。
+    使用已训练的模型包来预测最新的DeFi策略。
+    支持 fp32 模型包 (.pth)、int8 量化的 TorchScript 模型包 (.int8.pt)
+    以及可内存映射的目录模型包 (.pkg)。
     """
-    def __init__(self, model_package_path: str, device: str = 'cpu'):
+    def __init__(self, model_package_path: str, device: str = 'cpu', cached: bool = False,
+                 verify_every: int = 0, last_query_attention: bool = False):
         if not os.path.exists(model_package_path):
             raise FileNotFoundError(f"Model package not found at: {model_package_path}")
         
+        import torch
         self.device = torch.device(device)
         logger.info(f"Loading model package from: {model_package_path}")
         
+        if model_package_path.endswith(MODEL_FORMAT_SUFFIXES['int8']):
+            self._load_torchscript_package(model_package_path)
+        elif model_package_path.endswith(MODEL_FORMAT_SUFFIXES['mmap']):
+            self._load_mmap_package(model_package_path)
+        else:
+            self._load_fp32_package(model_package_path)
+        self.model.eval()
+        self.lookback_hours = self.config['lookback_hours']
+
+        # 增量推理模式: 标准化后的输入窗口保存在环形缓冲中, 每次只处理新增的行, 结果与整窗重算逐位相同;
+        # last_query_attention=True 时额外只用最后一个时间步做 attention query (误差 1e-7 量级, 不再逐位相同);
+        # verify_every > 0 时每 N 次增量预测与整窗重算比对一次, 不一致则告警并重建缓冲
+        self.cached = cached
+        self.verify_every = verify_every
+        self.last_query_attention = last_query_attention and hasattr(self.model, 'forward_last_query')
+        self.cached_predictions = 0
+        self.window_buffer = ScaledWindowBuffer(self.scaler, self.lookback_hours, len(self.scaler.mean_)) if cached else None
+        
+        logger.info(f"Model loaded successfully. Lookback window: {self.lookback_hours} hours.")
+
+    def _load_fp32_package(self, model_package_path: str):
+        import torch
+        from ai_strategy_system import WeeklyStrategyLSTM
+        
         package = torch.load(model_package_path, map_location=self.device)
         
         self.model = WeeklyStrategyLSTM(input_dim=28)
         self.model.load_state_dict(package['model_state_dict'])
         self.model.to(self.device)
-        self.model.eval()
         
         self.scaler = package['scaler']
         self.config = package.get('config', {'lookback_hours': 72})
-        self.lookback_hours = self.config['lookback_hours']
+
+    def _load_mmap_package(self, model_package_path: str):
+        from model_package import load_model_package
         
-        logger.info(f"Model loaded successfully. Lookback window: {self.lookback_hours} hours.")
+        # 权重映射在 CPU 内存上, 移到其他设备会产生一份拷贝
+        self.model, self.scaler, manifest = load_model_package(model_package_path)
+        self.model.to(self.device)
+        self.config = {**manifest['config'], 'lookback_hours': manifest['lookback_hours']}
+
+    def _load_torchscript_package(self, model_package_path: str):
+        import torch
+        
+        # 动态量化算子只有 CPU 实现
+        if self.device.type != 'cpu':
+            logger.warning(f"Int8 model packages only run on CPU, ignoring device '{self.device}'.")
+            self.device = torch.device('cpu')
+        
+        extra_files = {'scaler.json': '', 'config.json': ''}
+        self.model = torch.jit.load(model_package_path, map_location=self.device, _extra_files=extra_files)
+        self.scaler = ArrayScaler.from_dict(json.loads(extra_files['scaler.json']))
+        self.config = json.loads(extra_files['config.json'])
 
-    def prepare_input_data(self, feature_sequences: list) -> torch.Tensor:
+    def prepare_input_data(self, feature_sequences: list) -> "torch.Tensor":
         """
         准备用于预测的输入张量。
         """
+        import torch
+        
         if len(feature_sequences) < self.lookback_hours:
             raise ValueError(f"Not enough recent data. Need {self.lookback_hours} hours, but only have {len(feature_sequences)}.")
         
@@ -56,10 +163,21 @@ class StrategyPredictor:
         
         return input_tensor
 
+    def _forward(self, input_tensor):
+        # TorchScript 模型包只导出了 forward, 没有 forward_last_query
+        if self.last_query_attention:
+            return self.model.forward_last_query(input_tensor)
+        return self.model(input_tensor)
+
     def predict(self, feature_sequences: list) -> np.ndarray:
         """
         执行预测。
         """
+        import torch
+        
+        if self.cached:
+            return self._predict_cached(feature_sequences)
+
         input_tensor = self.prepare_input_data(feature_sequences)
         
         with torch.no_grad():
@@ -67,26 +185,133 @@ class StrategyPredictor:
         
         return prediction.cpu().numpy()[0]
 
-def get_latest_strategy(pool_symbol: str, pool_config: Dict[str, Any], api_key: str = None) -> Dict:
+    def _predict_cached(self, feature_sequences: list) -> np.ndarray:
+        import torch
+
+        self.window_buffer.sync(feature_sequences)
+        input_tensor = torch.from_numpy(self.window_buffer.window()).unsqueeze(0).to(self.device)
+        with torch.no_grad():
+            prediction = self._forward(input_tensor).cpu().numpy()[0]
+        self.cached_predictions += 1
+
+        if self.verify_every and self.cached_predictions % self.verify_every == 0:
+            with torch.no_grad():
+                reference = self.model(self.prepare_input_data(feature_sequences)).cpu().numpy()[0]
+            matches = np.allclose(prediction, reference, rtol=0, atol=LAST_QUERY_TOLERANCE) \
+                if self.last_query_attention else np.array_equal(prediction, reference)
+            if not matches:
+                logger.warning(f"Cached prediction differs from full recompute "
+                               f"(max abs diff {np.max(np.abs(prediction - reference)):.3e}), rebuilding window cache.")
+                self.window_buffer.reset()
+                return reference
+        return prediction
+
+    def predict_with_uncertainty(self, feature_sequences: list, num_samples: int = 16,
+                                 dropout_scope: str = 'all', seed: int = None) -> Dict[str, Any]:
+        """
+        MC dropout: 打开 dropout 做 num_samples 次随机前向, 返回预测均值和标准差。
+        num_samples 次前向合并为一个 batch (输入窗口复制 num_samples 份) 一次算完。
+
+        dropout_scope='all' 时 LSTM 层间、attention 和全连接层的 dropout 全部打开;
+        'head' 时 LSTM + attention 只算一次, 只对全连接层做 num_samples 次采样, 耗时几乎与单次预测相同,
+        但不反映 LSTM / attention 部分的不确定性。
+        """
+        import time
+        import torch
+        import torch.nn as nn
+
+        if not hasattr(self.model, 'encode'):
+            raise ValueError("MC dropout needs an fp32 or mmap model package; "
+                             "TorchScript packages are traced in eval mode without dropout.")
+        if dropout_scope not in ('all', 'head'):
+            raise ValueError(f"dropout_scope must be 'all' or 'head', got '{dropout_scope}'.")
+
+        start = time.perf_counter()
+        if self.cached:
+            self.window_buffer.sync(feature_sequences)
+            input_tensor = torch.from_numpy(self.window_buffer.window()).unsqueeze(0).to(self.device)
+        else:
+            input_tensor = self.prepare_input_data(feature_sequences)
+
+        stochastic = self.model if dropout_scope == 'all' else self.model.feature_extractor
+        dropout_modules = [m for m in stochastic.modules() if isinstance(m, (nn.Dropout, nn.LSTM, nn.MultiheadAttention))]
+        rng_devices = [self.device.index or 0] if self.device.type == 'cuda' else []
+        with torch.no_grad(), torch.random.fork_rng(devices=rng_devices):
+            if seed is not None:
+                torch.manual_seed(seed)
+            try:
+                if dropout_scope == 'all':
+                    for m in dropout_modules:
+                        m.train()
+                    samples = self.model(input_tensor.expand(num_samples, -1, -1).contiguous())
+                else:
+                    final_features = self.model.encode(input_tensor)
+                    for m in dropout_modules:
+                        m.train()
+                    samples = self.model.decode(final_features.expand(num_samples, -1))
+            finally:
+                self.model.eval()
+        samples = samples.cpu().numpy()
+
+        return {
+            'mean': samples.mean(axis=0),
+            'std': samples.std(axis=0),
+            'num_samples': num_samples,
+            'dropout_scope': dropout_scope,
+            'latency_ms': (time.perf_counter() - start) * 1e3,
+        }
+
+def get_latest_strategy(pool_symbol: str, pool_config: Dict[str, Any], api_key: str = None,
+                        model_format: str = None) -> Dict:
     """
     为单个池子执行完整的预测流程，并返回策略字典。
     (这是从原 main 函数重构而来的)
+    
+    model_format 未指定时读取环境变量 STRATEGY_MODEL_FORMAT（默认 fp32）。
+    STRATEGY_CACHED_INFERENCE=1 时启用增量推理模式: predictor 在进程内复用, 每次只标准化新增的行,
+    并每 STRATEGY_CACHE_VERIFY_EVERY 次 (默认 24) 与整窗重算比对一次;
+    STRATEGY_LAST_QUERY_ATTENTION=1 时再启用只算最后一个 query 的 attention。
+    STRATEGY_MC_SAMPLES>0 时用 MC dropout 估计预测不确定性 (STRATEGY_MC_SCOPE 取 all/head),
+    返回结果中的 allocations 为采样均值, 另附 uncertainty 和由其换算的 model_confidence。
+
+    结果按 (池子, 模型包哈希, 最新快照时间戳, 推理选项) 缓存 (容量 STRATEGY_PREDICTION_CACHE_SIZE, 默认 32,
+    0 表示关闭): 先只查询最新快照的时间戳, 与上次相同时直接返回缓存的策略。
+    注意 Aave 利率和 gas 是按调用时的当前值取的, 命中缓存时沿用的是同一小时内第一次预测时的值。
     """
     logging.info(f"Generating new strategy for pool: {pool_symbol}")
 
+    model_format = model_format or os.getenv('STRATEGY_MODEL_FORMAT', 'fp32')
+    package_path = resolve_model_package_path(pool_symbol, model_format)
+    if not os.path.exists(package_path):
+        logging.error(f"Could not generate strategy for {pool_symbol}: model package not found at {package_path}")
+        raise FileNotFoundError(f"Model package not found at: {package_path}")
+
+    # --- 步骤 0: 数据水位没有变化时直接返回缓存 ---
+    fetcher = MultiPoolDeFiDataFetcher(pools_config={pool_symbol: pool_config}, api_key=api_key)
+    inference_options = tuple(os.getenv(name, '') for name in (
+        'STRATEGY_MC_SAMPLES', 'STRATEGY_MC_SCOPE', 'STRATEGY_LAST_QUERY_ATTENTION'))
+    cache_key_prefix = (pool_symbol, model_package_hash(package_path), inference_options)
+    watermark = fetcher.get_latest_snapshot_timestamp(pool_config['address']) if _PREDICTION_CACHE.max_entries > 0 else None
+    if watermark is not None:
+        cached_strategy = _PREDICTION_CACHE.get(cache_key_prefix + (watermark,))
+        if cached_strategy is not None:
+            logging.info(f"Data unchanged since {cached_strategy['based_on_data_until']}, returning cached strategy "
+                         f"(cache hit rate {_PREDICTION_CACHE.stats()['hit_rate']:.1%}).")
+            return cached_strategy
+
     # --- 步骤 1: 加载模型 ---
-    sanitized_symbol = pool_symbol.replace('/', '-')
-    model_package_path = f'models/model_package_{sanitized_symbol}.pth'
-    
     try:
-        predictor = StrategyPredictor(model_package_path)
+        if os.getenv('STRATEGY_CACHED_INFERENCE', '0') == '1':
+            predictor = _get_cached_predictor(package_path, int(os.getenv('STRATEGY_CACHE_VERIFY_EVERY', 24)),
+                                              os.getenv('STRATEGY_LAST_QUERY_ATTENTION', '0') == '1')
+        else:
+            predictor = load_predictor(package_path)
     except FileNotFoundError as e:
         logging.error(f"Could not generate strategy for {pool_symbol}: {e}")
         raise e
 
     # --- 步骤 2: 获取最新数据 ---
     logging.info(f"Fetching latest {predictor.lookback_hours} hours of data...")
-    fetcher = MultiPoolDeFiDataFetcher(pools_config={pool_symbol: pool_config}, api_key=api_key)
     # 稍微多获取一点数据以防万一
     weeks_to_fetch = (predictor.lookback_hours / 24 / 7) + 1 
     raw_data = fetcher.run_full_data_collection(weeks=weeks_to_fetch)
@@ -101,7 +326,30 @@ def get_latest_strategy(pool_symbol: str, pool_config: Dict[str, Any], api_key:
         pool_data['aave_current_reserves'],
         pool_data['gas_current']
     )
-    strategy_vector = predictor.predict(feature_sequences)
+    mc_samples = int(os.getenv('STRATEGY_MC_SAMPLES', 0))
+    uncertainty = None
+    if mc_samples > 0 and hasattr(predictor, 'predict_with_uncertainty') and hasattr(predictor.model, 'encode'):
+        estimate = predictor.predict_with_uncertainty(feature_sequences, num_samples=mc_samples,
+                                                      dropout_scope=os.getenv('STRATEGY_MC_SCOPE', 'all'))
+        strategy_vector = estimate['mean']
+        allocation_std = float(estimate['std'][0])
+        uncertainty = {
+            "method": "mc_dropout",
+            "num_samples": mc_samples,
+            "dropout_scope": estimate['dropout_scope'],
+            "allocation_std": allocation_std,
+            "price_bound_std": float(estimate['std'][2]),
+            "volatility_threshold_std": float(estimate['std'][3]),
+            "latency_ms": estimate['latency_ms'],
+        }
+        latency_budget_ms = float(os.getenv('STRATEGY_MC_LATENCY_BUDGET_MS', MC_LATENCY_BUDGET_MS))
+        if estimate['latency_ms'] > latency_budget_ms:
+            logging.warning(f"MC dropout with {mc_samples} samples took {estimate['latency_ms']:.1f} ms "
+                            f"(budget {latency_budget_ms} ms); consider fewer samples or STRATEGY_MC_SCOPE=head.")
+    else:
+        if mc_samples > 0:
+            logging.warning(f"Model package {package_path} does not support MC dropout, predicting without uncertainty.")
+        strategy_vector = predictor.predict(feature_sequences)
 
     # --- 步骤 5: 解析并返回结果 ---
     last_snapshot = feature_sequences[-1]
@@ -113,7 +361,7 @@ def get_latest_strategy(pool_symbol: str, pool_config: Dict[str, Any], api_key:
         "pool_symbol": pool_symbol,
         "prediction_generated_at": datetime.now().isoformat(),
         "based_on_data_until": last_snapshot['timestamp'],
-        "model_package": model_package_path,
+        "model_package": package_path,
         "allocations": {
             "aave_wbtc_pool": float(strategy_vector[0]),
             "uniswap_v3_lp": float(strategy_vector[1])
@@ -133,5 +381,16 @@ def get_latest_strategy(pool_symbol: str, pool_config: Dict[str, Any], api_key:
             "expected_price_range_usd": f"${float(current_price * (1 - price_bound_pct)):.2f} - ${float(current_price * (1 + price_bound_pct)):.2f}"
         }
     }
+    if uncertainty is not None:
+        # 配比在 [0, 1] 内, 标准差最大为 0.5, 据此把标准差映射为 [0, 1] 的置信度
+        final_strategy["uncertainty"] = uncertainty
+        final_strategy["model_confidence"] = max(0.0, 1.0 - 2 * uncertainty["allocation_std"])
 
+    last_snapshot_timestamp = max(int(s['periodStartUnix']) for s in pool_data['snapshots'])
+    _PREDICTION_CACHE.put(cache_key_prefix + (last_snapshot_timestamp,), final_strategy)
     return final_strategy
+
+
+def prediction_cache_stats() -> Dict[str, Any]:
+    """预测缓存的命中率等统计"""
+    return _PREDICTION_CACHE.stats()
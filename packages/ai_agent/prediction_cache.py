@@ -0,0 +1,94 @@
+"""
+预测结果缓存
+
+数据源按小时出快照, 同一小时内重复调用 get_latest_strategy 得到的输入完全相同。
+缓存键为 (池子, 模型包内容哈希, 最后一个输入快照的时间戳, 推理选项), 命中时直接返回上次的策略,
+不再拉取全量数据、构造特征和运行模型。缓存容量有上限, 按 LRU 淘汰, 并统计命中率。
+"""
+
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# {模型包路径: ((修改时间, 大小), 哈希)}, 模型包没有变化时不重新计算哈希
+_PACKAGE_HASHES: Dict[str, Tuple[Tuple, str]] = {}
+
+
+def _package_files(package_path: str):
+    """模型包包含的文件: 目录格式为目录下全部文件, ONNX 还包括 scaler/config 附属文件"""
+    if os.path.isdir(package_path):
+        return sorted(os.path.join(package_path, name) for name in os.listdir(package_path))
+    files = [package_path]
+    if os.path.exists(package_path + '.json'):
+        files.append(package_path + '.json')
+    return files
+
+
+def model_package_hash(package_path: str) -> str:
+    """模型包内容的 sha256 (前 16 位), 按文件修改时间和大小缓存"""
+    files = _package_files(package_path)
+    signature = tuple((os.path.getmtime(f), os.path.getsize(f)) for f in files)
+    cached = _PACKAGE_HASHES.get(package_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    package_hash = digest.hexdigest()[:16]
+    _PACKAGE_HASHES[package_path] = (signature, package_hash)
+    return package_hash
+
+
+class PredictionCache:
+    """线程安全的有界 LRU 缓存, 存取时都返回深拷贝, 调用方修改结果不会影响缓存"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
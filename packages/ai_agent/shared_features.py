@@ -0,0 +1,60 @@
+"""
+进程间共享的只读特征矩阵
+
+主进程把特征矩阵拷贝进一块 multiprocessing.shared_memory, 工作进程只需拿到
+(name, shape, dtype) 句柄即可零拷贝地映射同一块内存, 不必为每个任务重复 pickle 整个矩阵。
+"""
+
+from multiprocessing import shared_memory
+from typing import Tuple
+
+import numpy as np
+
+SharedMatrixHandle = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedFeatureMatrix:
+    """共享内存中的 numpy 数组。创建者负责 unlink, 附加方只负责 close。"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, array: np.ndarray) -> "SharedFeatureMatrix":
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        matrix = cls(shm, array.shape, array.dtype, owner=True)
+        matrix.array[...] = array
+        return matrix
+
+    @classmethod
+    def attach(cls, handle: SharedMatrixHandle, writable: bool = False) -> "SharedFeatureMatrix":
+        name, shape, dtype = handle
+        # 附加方应是创建者通过 multiprocessing 启动的子进程: 它们共用创建者的 resource_tracker,
+        # 重复注册同一名字是无害的, 共享内存的生命周期仍由创建者的 unlink 决定
+        shm = shared_memory.SharedMemory(name=name)
+        matrix = cls(shm, tuple(shape), np.dtype(dtype), owner=False)
+        matrix.array.flags.writeable = writable
+        return matrix
+
+    @property
+    def handle(self) -> SharedMatrixHandle:
+        return self._shm.name, tuple(self.array.shape), self.array.dtype.str
+
+    def close(self):
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # 仍有张量等外部对象引用这块内存, 映射留给垃圾回收时释放; unlink 不受影响
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,370 @@
+"""
+嵌入式 SQLite 存储后端
+
+数据保存在单个本地文件中, 不需要数据库服务, 用于本地开发、离线回测和端到端基准测试。
+与 PostgresStorage 的差异:
+    - 时间戳以整数 Unix 秒保存 (不带时区, 与 PostgreSQL 的 TIMESTAMP 列取值一致), 列式读取时不需要转换
+    - 没有分区和物化汇总, 降采样直接在原始快照上聚合 (本地数据量下足够快), refresh_pool_rollups 不做任何事
+    - 统计总是精确计数 (estimated 为 False)
+表结构在第一次连接时自动创建, 并启用 WAL, 读请求不会被写入阻塞。
+"""
+
+import calendar
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from storage import (BUCKETED_COLUMNS, COPY_PROGRESS_EVERY, DEFAULT_FETCH_SIZE, SNAPSHOT_BUCKETS,
+                     SNAPSHOT_NUMERIC_COLUMNS, StorageBackend, empty_snapshot_columns, rows_to_columns)
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+_SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS pool_snapshots (
+    pool_symbol TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    {", ".join(f"{c} REAL" for c in SNAPSHOT_NUMERIC_COLUMNS)},
+    PRIMARY KEY (pool_symbol, timestamp)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS strategy_executions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pool_symbol TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    aave_wbtc_pool REAL NOT NULL,
+    uniswap_v3_lp REAL NOT NULL,
+    tx_hash TEXT,
+    model_confidence REAL,
+    safety_bounds TEXT,
+    additional_info TEXT,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS strategy_executions_pool_timestamp_idx
+    ON strategy_executions (pool_symbol, timestamp);
+
+CREATE TABLE IF NOT EXISTS performance_cache (
+    pool_symbol TEXT NOT NULL,
+    period TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    calculated_at INTEGER NOT NULL,
+    PRIMARY KEY (pool_symbol, period)
+);
+"""
+
+_UPSERT_SNAPSHOT_SQL = f"""
+INSERT INTO pool_snapshots (pool_symbol, timestamp, {", ".join(SNAPSHOT_NUMERIC_COLUMNS)})
+VALUES ({", ".join("?" * (len(SNAPSHOT_NUMERIC_COLUMNS) + 2))})
+ON CONFLICT (pool_symbol, timestamp) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in SNAPSHOT_NUMERIC_COLUMNS)}
+"""
+
+# 窗口函数取每个桶的首末价格, 其余列与 PostgresStorage 的原始快照聚合相同
+_BUCKETED_SQL = f"""
+WITH s AS (
+    SELECT
+        (timestamp / :width) * :width AS bucket_start,
+        {", ".join(SNAPSHOT_NUMERIC_COLUMNS)},
+        FIRST_VALUE(wbtc_price) OVER w AS price_open,
+        LAST_VALUE(wbtc_price) OVER w AS price_close
+    FROM pool_snapshots
+    WHERE pool_symbol = :pool_symbol AND timestamp >= :cutoff
+    WINDOW w AS (PARTITION BY timestamp / :width ORDER BY timestamp
+                 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+)
+SELECT
+    bucket_start,
+    MAX(price_close),
+    MAX(price_open),
+    COALESCE(MAX(wbtc_price), 0),
+    COALESCE(MIN(wbtc_price), 0),
+    COALESCE(SUM(volume_usd), 0),
+    COALESCE(AVG(liquidity), 0),
+    COALESCE(AVG(tvl_usd), 0),
+    COALESCE(SUM(aave_wbtc_apy), 0),
+    COALESCE(SUM(univ3_lp_apy), 0),
+    COALESCE(SUM(gas_cost_usd), 0),
+    COUNT(*)
+FROM s
+GROUP BY bucket_start
+ORDER BY bucket_start
+"""
+
+
+def _to_epoch(value) -> int:
+    """datetime / ISO 字符串 / Unix 秒 -> 整数 Unix 秒; 带时区的时间与 PostgreSQL TIMESTAMP 列一样忽略时区"""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return calendar.timegm(value.replace(tzinfo=None).timetuple())
+
+
+def _from_epoch(seconds: int) -> datetime:
+    return _EPOCH + timedelta(seconds=int(seconds))
+
+
+def _cutoff(**delta) -> int:
+    return _to_epoch(datetime.now() - timedelta(**delta))
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite 存储后端, 每次操作使用一个新连接 (SQLite 打开连接的开销很小)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """打开连接并在第一次使用时建表; 块正常结束时提交, 出错时回滚"""
+        self.ensure_schema()
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def ensure_schema(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """建表 (幂等); SQLite 没有分区, start / end 不需要处理"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA_SQL)
+            self._schema_ready = True
+            logger.info(f"✅ SQLite storage ready: {self.path}")
+
+    def get_database_stats(self, exact: bool = False, max_age_seconds: Optional[float] = None) -> Dict:
+        """数据库统计（用于健康检查）; 本地文件直接精确计数, 不缓存"""
+        try:
+            with self._connect() as conn:
+                snapshots = [
+                    {"pool_symbol": pool, "count": count,
+                     "earliest": _from_epoch(earliest).isoformat(), "latest": _from_epoch(latest).isoformat()}
+                    for pool, count, earliest, latest in conn.execute("""
+                    SELECT pool_symbol, COUNT(*), MIN(timestamp), MAX(timestamp)
+                    FROM pool_snapshots GROUP BY pool_symbol ORDER BY pool_symbol
+                    """)
+                ]
+                strategies = [
+                    {"pool_symbol": pool, "count": count}
+                    for pool, count in conn.execute("""
+                    SELECT pool_symbol, COUNT(*) FROM strategy_executions
+                    GROUP BY pool_symbol ORDER BY pool_symbol
+                    """)
+                ]
+            return {
+                "snapshots_count": sum(s["count"] for s in snapshots),
+                "strategies_count": sum(s["count"] for s in strategies),
+                "estimated": False,
+                "snapshots": snapshots,
+                "strategies": strategies,
+                "status": "ok",
+                "cache_age_seconds": 0.0,
+            }
+        except Exception as e:
+            logger.error(f"get_database_stats error: {e}", exc_info=True)
+            return {"status": "error", "error": str(e)}
+
+    # ========== 池子快照 ==========
+    @staticmethod
+    def _snapshot_row(s: Dict) -> tuple:
+        return (s.get("pool_symbol"), _to_epoch(s.get("timestamp")),
+                *(float(s.get(c, 0)) for c in SNAPSHOT_NUMERIC_COLUMNS))
+
+    def insert_pool_snapshots(self, snapshots: List[Dict]) -> int:
+        """批量插入池子快照"""
+        if not snapshots:
+            return 0
+        try:
+            with self._connect() as conn:
+                conn.executemany(_UPSERT_SNAPSHOT_SQL, [self._snapshot_row(s) for s in snapshots])
+            logger.info(f"✅ Inserted/Updated {len(snapshots)} pool snapshots")
+            return len(snapshots)
+        except Exception as e:
+            logger.error(f"❌ Error inserting pool snapshots: {e}", exc_info=True)
+            raise
+
+    def bulk_load_pool_snapshots(self, snapshots: Iterable[Dict], progress_every: int = COPY_PROGRESS_EVERY,
+                                 total: Optional[int] = None) -> int:
+        """
+        批量导入池子快照: 在一个事务里用 executemany 逐行 upsert, snapshots 可以是生成器。
+        同一 (pool_symbol, timestamp) 出现多次时以最后一次为准; 返回合并的行数 (不同的键的个数)。
+        """
+        keys = set()
+        started = time.perf_counter()
+
+        def rows():
+            for count, s in enumerate(snapshots, 1):
+                row = self._snapshot_row(s)
+                keys.add(row[:2])
+                yield row
+                if progress_every and count % progress_every == 0:
+                    elapsed = time.perf_counter() - started
+                    percent = f", {count / total * 100:.1f}%" if total else ""
+                    logger.info(f"  💾 已写入 {count:,} 行 ({count / elapsed:,.0f} 行/秒{percent})")
+
+        try:
+            with self._connect() as conn:
+                conn.executemany(_UPSERT_SNAPSHOT_SQL, rows())
+            logger.info(f"✅ Bulk loaded {len(keys):,} pool snapshots in {time.perf_counter() - started:.1f}s")
+            return len(keys)
+        except Exception as e:
+            logger.error(f"❌ Error bulk loading pool snapshots: {e}", exc_info=True)
+            raise
+
+    def _stream_pool_snapshots(self, pool_symbol: str, hours: int, fetch_size: int, limit: Optional[int],
+                               latest: bool = False) -> Iterator[List[tuple]]:
+        """分批读取 (timestamp, 数值列...) 元组, 按时间升序; NULL 数值记为 0"""
+        numeric_exprs = ", ".join(f"COALESCE({c}, 0)" for c in SNAPSHOT_NUMERIC_COLUMNS)
+        latest = bool(limit and latest)
+        sql = f"""
+        SELECT timestamp, {numeric_exprs}
+        FROM pool_snapshots
+        WHERE pool_symbol = ? AND timestamp >= ?
+        ORDER BY timestamp {'DESC' if latest else 'ASC'}
+        """
+        params = [pool_symbol, _cutoff(hours=hours)]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        if latest:
+            sql = f"SELECT * FROM ({sql}) ORDER BY timestamp ASC"
+
+        with self._connect() as conn:
+            cur = conn.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def iter_pool_snapshots(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                            fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Dict]:
+        """逐行流式读取快照, 每行的格式与 get_pool_snapshots 相同 (数值为 float, timestamp 为 ISO 字符串)"""
+        for rows in self._stream_pool_snapshots(pool_symbol, hours, fetch_size, limit):
+            for timestamp, *values in rows:
+                record = {'pool_symbol': pool_symbol, 'timestamp': _from_epoch(timestamp).isoformat()}
+                record.update(zip(SNAPSHOT_NUMERIC_COLUMNS, map(float, values)))
+                yield record
+
+    def iter_pool_snapshot_chunks(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                                  fetch_size: int = DEFAULT_FETCH_SIZE,
+                                  latest: bool = False) -> Iterator[Dict[str, np.ndarray]]:
+        """按列分块流式读取快照: 每块是 {列名: numpy 数组}, 最多 fetch_size 行"""
+        for rows in self._stream_pool_snapshots(pool_symbol, hours, fetch_size, limit, latest):
+            yield rows_to_columns(rows, ('timestamp',) + SNAPSHOT_NUMERIC_COLUMNS)
+
+    def get_pool_snapshots_bucketed(self, pool_symbol: str, hours: int = 8760, bucket: str = '1d') -> Dict[str, np.ndarray]:
+        """把快照聚合到固定时间桶, 结果与 PostgresStorage.get_pool_snapshots_bucketed 相同 (始终聚合原始快照)"""
+        if bucket not in SNAPSHOT_BUCKETS:
+            raise ValueError(f"Unsupported bucket {bucket!r}, expected one of {list(SNAPSHOT_BUCKETS)}")
+        params = {'width': SNAPSHOT_BUCKETS[bucket], 'pool_symbol': pool_symbol, 'cutoff': _cutoff(hours=hours)}
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(_BUCKETED_SQL, params).fetchall()
+            logger.info(f"📊 Retrieved {len(rows)} {bucket} buckets for {pool_symbol} ({hours}h, from raw snapshots)")
+            return rows_to_columns(rows, BUCKETED_COLUMNS)
+        except Exception as e:
+            logger.error(f"Error getting bucketed pool snapshots: {e}", exc_info=True)
+            return empty_snapshot_columns(BUCKETED_COLUMNS)
+
+    def refresh_pool_rollups(self, pool_symbol: Optional[str] = None, hours: Optional[int] = None) -> int:
+        """SQLite 后端没有物化汇总, 无需刷新"""
+        return 0
+
+    # ========== 策略执行 ==========
+    def insert_strategy_execution(self, execution: Dict) -> Optional[int]:
+        """插入策略执行记录"""
+        sql = """
+        INSERT INTO strategy_executions (
+            pool_symbol, timestamp, aave_wbtc_pool, uniswap_v3_lp, tx_hash,
+            model_confidence, safety_bounds, additional_info, created_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        try:
+            with self._connect() as conn:
+                cur = conn.execute(sql, (
+                    execution["pool_symbol"], _to_epoch(execution["timestamp"]),
+                    execution["aave_wbtc_pool"], execution["uniswap_v3_lp"],
+                    execution.get("tx_hash"), execution.get("model_confidence"),
+                    json.dumps(execution.get("safety_bounds", {})),
+                    json.dumps(execution.get("additional_info", {})),
+                    int(time.time()),
+                ))
+                record_id = cur.lastrowid
+            logger.info(f"✅ Logged strategy execution (ID={record_id})")
+            return record_id
+        except Exception as e:
+            logger.error(f"❌ Error inserting strategy execution: {e}", exc_info=True)
+            return None
+
+    def get_strategy_executions(self, pool_symbol: str, hours: int = 720) -> List[Dict]:
+        """获取策略执行历史 (格式与 PostgresStorage 相同: timestamp 为 datetime, JSON 列已解析)"""
+        sql = """
+        SELECT * FROM strategy_executions
+        WHERE pool_symbol = ? AND timestamp >= ?
+        ORDER BY timestamp DESC
+        """
+        try:
+            with self._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                rows = [dict(row) for row in conn.execute(sql, (pool_symbol, _cutoff(hours=hours)))]
+            for row in rows:
+                row["timestamp"] = _from_epoch(row["timestamp"])
+                row["created_at"] = _from_epoch(row["created_at"])
+                for key in ("safety_bounds", "additional_info"):
+                    row[key] = json.loads(row[key]) if row[key] else None
+            logger.info(f"📈 Retrieved {len(rows)} strategy executions for {pool_symbol}")
+            return rows
+        except Exception as e:
+            logger.error(f"❌ Error getting strategy executions: {e}", exc_info=True)
+            return []
+
+    # ========== 缓存指标 ==========
+    def cache_performance_metrics(self, pool_symbol: str, period: str, metrics: Dict):
+        """缓存性能指标"""
+        sql = """
+        INSERT INTO performance_cache (pool_symbol, period, metrics, calculated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (pool_symbol, period)
+        DO UPDATE SET
+            metrics = excluded.metrics,
+            calculated_at = excluded.calculated_at
+        """
+        try:
+            with self._connect() as conn:
+                conn.execute(sql, (pool_symbol, period, json.dumps(metrics), _to_epoch(datetime.now())))
+            logger.info(f"💾 Cached performance metrics for {pool_symbol} ({period})")
+        except Exception as e:
+            logger.error(f"❌ Error caching metrics: {e}", exc_info=True)
+
+    def get_cached_metrics(self, pool_symbol: str, period: str, max_age_minutes: int = 15) -> Optional[Dict]:
+        """获取缓存的性能指标"""
+        sql = """
+        SELECT metrics, calculated_at FROM performance_cache
+        WHERE pool_symbol = ? AND period = ? AND calculated_at >= ?
+        """
+        try:
+            with self._connect() as conn:
+                row = conn.execute(sql, (pool_symbol, period, _cutoff(minutes=max_age_minutes))).fetchone()
+            if not row:
+                return None
+            return {"metrics": json.loads(row[0]), "calculated_at": _from_epoch(row[1]).isoformat()}
+        except Exception as e:
+            logger.error(f"❌ Error getting cached metrics: {e}", exc_info=True)
+            return None
@@ -0,0 +1,146 @@
+"""
+存储后端接口
+
+DatabaseManager (database.py) 的全部读写都转发给一个 StorageBackend, 目前有两种实现:
+    - PostgresStorage (database.py): 生产环境, 连接 DATABASE_URL 指向的 PostgreSQL / Supabase
+    - SQLiteStorage (sqlite_storage.py): 嵌入式单文件数据库, 不依赖外部服务,
+      用于本地开发、离线回测和端到端基准测试
+两种实现的方法签名和返回格式相同, 调用方不需要关心数据存在哪里。
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NUMERIC_COLUMNS = ('wbtc_price', 'volume_usd', 'liquidity', 'tvl_usd',
+                            'aave_wbtc_apy', 'univ3_lp_apy', 'gas_cost_usd')
+# 流式读取时每批取回的行数
+DEFAULT_FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", 2000))
+# 批量导入时每写入多少行输出一次进度
+COPY_PROGRESS_EVERY = 50000
+# 降采样支持的时间桶 (秒)
+SNAPSHOT_BUCKETS = {'1h': 3600, '4h': 4 * 3600, '1d': 24 * 3600, '1w': 7 * 24 * 3600}
+# get_pool_snapshots_bucketed 返回的列, timestamp 与 samples 为 int64, 其余为 float64
+BUCKETED_COLUMNS = ('timestamp', 'wbtc_price', 'wbtc_price_open', 'wbtc_price_high', 'wbtc_price_low',
+                    'volume_usd', 'liquidity', 'tvl_usd', 'aave_wbtc_apy', 'univ3_lp_apy', 'gas_cost_usd',
+                    'samples')
+_INTEGER_COLUMNS = ('timestamp', 'samples')
+
+
+def empty_snapshot_columns(columns: Iterable[str] = ('timestamp',) + SNAPSHOT_NUMERIC_COLUMNS) -> Dict[str, np.ndarray]:
+    """各列都为空数组的列式快照 (读取出错或没有数据时返回)"""
+    return {c: np.zeros(0, dtype=np.int64 if c in _INTEGER_COLUMNS else np.float64) for c in columns}
+
+
+def rows_to_columns(rows: List[tuple], columns: Iterable[str]) -> Dict[str, np.ndarray]:
+    """把按 columns 顺序排列的行元组转成 {列名: numpy 数组}"""
+    columns = tuple(columns)
+    if not rows:
+        return empty_snapshot_columns(columns)
+    return {
+        c: np.array(values, dtype=np.int64 if c in _INTEGER_COLUMNS else np.float64)
+        for c, values in zip(columns, zip(*rows))
+    }
+
+
+class StorageBackend(ABC):
+    """
+    存储后端接口。时间戳统一按不带时区的时间处理 (与 PostgreSQL 的 TIMESTAMP 列一致),
+    列式结果中的 timestamp 为 int64 Unix 秒, 逐行结果中的 timestamp 为 ISO 字符串。
+    """
+
+    @abstractmethod
+    def ensure_schema(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """创建或升级表结构, 并确保能容纳 [start, end] 时间范围内的快照"""
+
+    @abstractmethod
+    def get_database_stats(self, exact: bool = False, max_age_seconds: Optional[float] = None) -> Dict:
+        """
+        数据库统计 (用于健康检查): snapshots_count, strategies_count, estimated, snapshots, strategies,
+        status, cache_age_seconds; 出错时返回 {"status": "error", "error": ...}
+        """
+
+    # ========== 池子快照 ==========
+    @abstractmethod
+    def insert_pool_snapshots(self, snapshots: List[Dict]) -> int:
+        """批量插入/更新池子快照, 返回写入的行数"""
+
+    @abstractmethod
+    def bulk_load_pool_snapshots(self, snapshots: Iterable[Dict], progress_every: int = COPY_PROGRESS_EVERY,
+                                 total: Optional[int] = None) -> int:
+        """流式批量导入快照 (snapshots 可以是生成器), 同键以最后一条为准, 返回合并的行数"""
+
+    @abstractmethod
+    def iter_pool_snapshots(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                            fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Dict]:
+        """逐行流式读取快照, 按时间升序, 数值为 float, timestamp 为 ISO 字符串"""
+
+    @abstractmethod
+    def iter_pool_snapshot_chunks(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                                  fetch_size: int = DEFAULT_FETCH_SIZE,
+                                  latest: bool = False) -> Iterator[Dict[str, np.ndarray]]:
+        """按列分块流式读取快照, 每块最多 fetch_size 行; latest=True 时 limit 取窗口内最新的行"""
+
+    @abstractmethod
+    def get_pool_snapshots_bucketed(self, pool_symbol: str, hours: int = 8760, bucket: str = '1d') -> Dict[str, np.ndarray]:
+        """
+        把快照聚合到固定时间桶, 返回 BUCKETED_COLUMNS 的列式结构 (聚合方式见
+        PostgresStorage.get_pool_snapshots_bucketed); bucket 不在 SNAPSHOT_BUCKETS 中时抛 ValueError
+        """
+
+    @abstractmethod
+    def refresh_pool_rollups(self, pool_symbol: Optional[str] = None, hours: Optional[int] = None) -> int:
+        """重算最近 hours 小时内的物化汇总, 返回更新的汇总行数"""
+
+    # ========== 策略执行 ==========
+    @abstractmethod
+    def insert_strategy_execution(self, execution: Dict) -> Optional[int]:
+        """插入策略执行记录, 返回记录 ID, 出错时返回 None"""
+
+    @abstractmethod
+    def get_strategy_executions(self, pool_symbol: str, hours: int = 720) -> List[Dict]:
+        """最近 hours 小时的策略执行记录, 按时间降序, 出错时返回空列表"""
+
+    # ========== 缓存指标 ==========
+    @abstractmethod
+    def cache_performance_metrics(self, pool_symbol: str, period: str, metrics: Dict):
+        """缓存性能指标"""
+
+    @abstractmethod
+    def get_cached_metrics(self, pool_symbol: str, period: str, max_age_minutes: int = 15) -> Optional[Dict]:
+        """max_age_minutes 内缓存的指标 {"metrics": ..., "calculated_at": ISO 字符串}, 没有时返回 None"""
+
+    # ========== 基于上面接口的通用实现 ==========
+    def get_pool_snapshots_columnar(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None,
+                                    fetch_size: int = DEFAULT_FETCH_SIZE, latest: bool = False) -> Dict[str, np.ndarray]:
+        """
+        列式读取快照: {列名: numpy 数组}, timestamp 为 int64 Unix 秒, 其余为 float64。
+        latest=True 时只取窗口内最新的 limit 行。
+        游标返回的元组直接写进数组, 不构造逐行 dict; 出错时返回各列为空数组。
+        """
+        columns = ('timestamp',) + SNAPSHOT_NUMERIC_COLUMNS
+        try:
+            chunks = list(self.iter_pool_snapshot_chunks(pool_symbol, hours, limit, fetch_size, latest))
+            snapshots = {c: np.concatenate([chunk[c] for chunk in chunks]) for c in columns} \
+                if chunks else empty_snapshot_columns(columns)
+            logger.info(f"📊 Retrieved {len(snapshots['timestamp'])} snapshots for {pool_symbol} (columnar)")
+            return snapshots
+        except Exception as e:
+            logger.error(f"Error getting columnar pool snapshots: {e}", exc_info=True)
+            return empty_snapshot_columns(columns)
+
+    def get_pool_snapshots(self, pool_symbol: str, hours: int = 720, limit: Optional[int] = None) -> List[Dict]:
+        """获取池子历史快照（数值为 float，timestamp 为 ISO 字符串）"""
+        try:
+            snapshots = list(self.iter_pool_snapshots(pool_symbol, hours, limit))
+            logger.info(f"📊 Retrieved {len(snapshots)} snapshots for {pool_symbol}")
+            return snapshots
+        except Exception as e:
+            logger.error(f"Error getting pool snapshots: {e}", exc_info=True)
+            return []
@@ -0,0 +1,219 @@
+# WeeklyStrategyLSTM 超参数搜索: 随机采样若干组配置, 用 successive halving 逐轮淘汰较差的一半以上,
+# 只有表现好的配置才会获得更多的训练 epoch。所有试验在进程池中并行运行, 共享同一份只读特征矩阵。
+#
+# 每个试验在 [0, holdout_start - embargo) 上训练 (内部时间顺序留出一段做早停, 用其损失排名),
+# 并在最后的 holdout 区间上报告样本外损失和回测收益。
+
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import shutil
+import multiprocessing as mp
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from shared_features import SharedFeatureMatrix
+from training_orchestrator import RestartingProcessPool
+from walk_forward import (DEFAULT_PARAMS, build_feature_matrix, effective_embargo_hours, init_worker,
+                          train_and_evaluate, worker_features)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SEARCH_SPACE = {
+    'hidden_dim': [64, 128, 256],
+    'num_layers': [1, 2, 3],
+    'num_heads': [4, 8],
+    'lr': [3e-5, 1e-4, 3e-4, 1e-3],
+    'batch_size': [16, 32, 64],
+    'lookback_hours': [48, 72, 96],
+    'stride': [6, 12, 24],
+}
+
+RESULT_COLUMNS = ['trial', 'rung', 'epochs', 'status', 'best_val_loss', 'eval_loss', 'eval_mae',
+                  'strategy_return', 'excess_return', 'final_nav', 'train_seconds'] + list(SEARCH_SPACE)
+
+
+def sample_configs(num_trials: int, seed: int = 0, search_space: Dict[str, List] = SEARCH_SPACE) -> List[Dict]:
+    """从搜索空间中无放回地随机抽取 num_trials 组配置"""
+    rng = random.Random(seed)
+    seen, configs = set(), []
+    total = int(np.prod([len(v) for v in search_space.values()]))
+    while len(configs) < min(num_trials, total):
+        config = {name: rng.choice(values) for name, values in search_space.items()}
+        key = tuple(config.values())
+        if key in seen or (2 * config['hidden_dim']) % config['num_heads'] != 0:
+            continue
+        seen.add(key)
+        configs.append(config)
+    return configs
+
+
+def rung_budgets(min_epochs: int, max_epochs: int, eta: int) -> List[int]:
+    """successive halving 每一轮的累计 epoch 预算, 如 (5, 45, 3) -> [5, 15, 45]"""
+    budgets = [min_epochs]
+    while budgets[-1] * eta < max_epochs:
+        budgets.append(budgets[-1] * eta)
+    if budgets[-1] < max_epochs:
+        budgets.append(max_epochs)
+    return budgets
+
+
+def _run_trial(trial: int, params: Dict, train_rows, eval_rows, checkpoint_path: str) -> Dict:
+    start_time = datetime.now()
+    result = {'trial': trial, 'epochs': params['epochs']}
+    try:
+        raw_features, timestamps = worker_features()
+        r = train_and_evaluate(raw_features, timestamps, train_rows, eval_rows, params, checkpoint_path=checkpoint_path)
+        result.update({
+            'status': 'diverged' if r['diverged'] else 'ok',
+            'best_val_loss': r['best_val_loss'],
+            'eval_loss': r['eval_loss'],
+            'eval_mae': r['eval_mae'],
+            **{k: r['backtest'][k] for k in ('strategy_return', 'excess_return', 'final_nav')},
+        })
+    except Exception as e:
+        logger.error(f"  Trial {trial} failed: {e}")
+        result.update({'status': 'failed', 'error': f"{type(e).__name__}: {e}"})
+    result['train_seconds'] = (datetime.now() - start_time).total_seconds()
+    return result
+
+
+def _rank_key(result: Dict):
+    """按验证损失升序排序, 损失相同时回测收益高者优先; 失败的试验排在最后"""
+    loss = result.get('best_val_loss')
+    if result['status'] != 'ok' or loss is None or not np.isfinite(loss):
+        return (1, float('inf'), 0.0)
+    return (0, loss, -result.get('strategy_return', 0.0))
+
+
+def run_sweep(raw_features: np.ndarray, timestamps: List[str], configs: List[Dict], checkpoint_dir: str,
+              holdout_fraction: float = 0.2, embargo_hours: int = 24, min_epochs: int = 5,
+              max_epochs: int = 45, eta: int = 3, max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    运行 successive halving, 返回每个试验最后一轮的结果 (已按排名排序)。
+    每一轮结束时保留 ceil(n / eta) 个最好的试验, 它们从各自的检查点继续训练到下一轮预算。
+    """
+    num_rows = len(raw_features)
+    max_lookback = max(c['lookback_hours'] for c in configs)
+    holdout_start = num_rows - max(int(num_rows * holdout_fraction), max_lookback + DEFAULT_PARAMS['prediction_hours'])
+    embargo_hours = effective_embargo_hours(embargo_hours, max_lookback)
+    train_rows, eval_rows = (0, holdout_start - embargo_hours), (holdout_start, num_rows)
+    budgets = rung_budgets(min_epochs, max_epochs, eta)
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers or cpu_count, len(configs)))
+    threads_per_worker = max(1, cpu_count // max_workers)
+    logger.info(f"[SWEEP] {len(configs)} trials, rungs {budgets} epochs, eta={eta}, "
+                f"{max_workers} workers x {threads_per_worker} threads")
+    logger.info(f"  Train rows {train_rows}, holdout rows {eval_rows} (embargo {embargo_hours}h)")
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    latest: Dict[int, Dict] = {}
+    survivors = list(range(len(configs)))
+    with SharedFeatureMatrix.create(raw_features) as shared:
+        # 工作进程崩溃 (如 OOM) 时重建进程池, 受影响的试验从各自的检查点单独重跑, 仍然崩溃的记为失败
+        with RestartingProcessPool(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                                   initializer=init_worker,
+                                   initargs=(shared.handle, timestamps, threads_per_worker)) as pool:
+            for rung, budget in enumerate(budgets):
+                jobs = {}
+                for trial in survivors:
+                    params = {**DEFAULT_PARAMS, **configs[trial], 'epochs': budget, 'embargo_hours': embargo_hours}
+                    checkpoint_path = os.path.join(checkpoint_dir, f'trial_{trial:03d}.ckpt')
+                    jobs[trial] = (trial, params, train_rows, eval_rows, checkpoint_path)
+                results, errors = pool.run(_run_trial, jobs)
+                for trial, error in errors.items():
+                    results[trial] = {'trial': trial, 'epochs': budget, 'status': 'failed', 'error': error}
+
+                for trial, r in results.items():
+                    latest[trial] = {**r, 'rung': rung, **configs[trial]}
+                ranked = sorted((latest[t] for t in survivors), key=_rank_key)
+                best = ranked[0]
+                logger.info(f"[SWEEP] Rung {rung} ({budget} epochs) done: best trial {best['trial']} "
+                            f"val loss {best.get('best_val_loss', float('inf')):.6f}")
+                keep = max(1, -(-len(ranked) // eta))
+                survivors = [r['trial'] for r in ranked[:keep] if r['status'] == 'ok']
+                if not survivors:
+                    logger.error(f"[SWEEP] No successful trials left after rung {rung}, stopping.")
+                    break
+
+    return sorted(latest.values(), key=lambda r: (-r['rung'], _rank_key(r)))
+
+
+def write_results(results: List[Dict], csv_path: str, json_path: str, metadata: Dict):
+    """写出结果表 (CSV) 以及包含搜索设置的完整 JSON"""
+    from ai_strategy_system import atomic_json_dump
+
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS + ['error'], extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    os.replace(tmp_path, csv_path)
+    atomic_json_dump({**metadata, 'results': results}, json_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WeeklyStrategyLSTM 超参数搜索 (successive halving)')
+    parser.add_argument('--pool', default='wBTC-USDC', help='池子符号')
+    parser.add_argument('--data-file', default=os.path.join('data', 'complete_defi_data.json'), help='数据文件')
+    parser.add_argument('--trials', type=int, default=32, help='随机采样的配置数')
+    parser.add_argument('--seed', type=int, default=0, help='配置采样的随机种子')
+    parser.add_argument('--min-epochs', type=int, default=5, help='第一轮每个试验的 epoch 数')
+    parser.add_argument('--max-epochs', type=int, default=45, help='最后一轮的累计 epoch 数')
+    parser.add_argument('--eta', type=int, default=3, help='每轮保留 1/eta 的试验')
+    parser.add_argument('--embargo-hours', type=int, default=24, help='训练区间与 holdout 之间的禁运间隔 (小时)')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数 (默认: CPU 核数)')
+    parser.add_argument('--keep-checkpoints', action='store_true', help='保留每个试验的检查点')
+    args = parser.parse_args()
+
+    with open(args.data_file, 'r') as f:
+        pool_data = json.load(f).get('pools', {}).get(args.pool)
+    if not pool_data:
+        raise ValueError(f"No data for pool {args.pool} in {args.data_file}")
+
+    sanitized_symbol = args.pool.replace('/', '-')
+    raw_features, timestamps = build_feature_matrix(pool_data)
+    configs = sample_configs(args.trials, seed=args.seed)
+    checkpoint_dir = os.path.join('models', 'sweeps', f"{sanitized_symbol}_{datetime.now():%Y%m%d_%H%M%S}")
+
+    start_time = datetime.now()
+    try:
+        results = run_sweep(raw_features, timestamps, configs, checkpoint_dir, embargo_hours=args.embargo_hours,
+                            min_epochs=args.min_epochs, max_epochs=args.max_epochs, eta=args.eta,
+                            max_workers=args.workers)
+    finally:
+        if not args.keep_checkpoints:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    csv_path = os.path.join('models', f'sweep_{sanitized_symbol}.csv')
+    json_path = os.path.join('models', f'sweep_{sanitized_symbol}.json')
+    write_results(results, csv_path, json_path, {
+        'pool_symbol': args.pool,
+        'generated_at': datetime.now().isoformat(),
+        'duration_seconds': (datetime.now() - start_time).total_seconds(),
+        'rungs': rung_budgets(args.min_epochs, args.max_epochs, args.eta),
+        'search_space': SEARCH_SPACE,
+    })
+
+    print("\n" + "="*100)
+    print(f"{'trial':>5} {'rung':>4} {'epochs':>6} {'val loss':>10} {'eval loss':>10} {'return':>9} {'excess':>9}  config")
+    for r in results[:20]:
+        config = ', '.join(f"{k}={r[k]}" for k in SEARCH_SPACE)
+        if r['status'] != 'ok':
+            print(f"{r['trial']:>5} {r['rung']:>4} {r['epochs']:>6} {r['status']:>10}  {config}")
+            continue
+        print(f"{r['trial']:>5} {r['rung']:>4} {r['epochs']:>6} {r['best_val_loss']:>10.6f} {r['eval_loss']:>10.6f} "
+              f"{r['strategy_return']:>+9.2%} {r['excess_return']:>+9.2%}  {config}")
+    print("="*100)
+    logger.info(f"Results saved to {csv_path} and {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块以扁平方式组织 (如 `from database import ...`), 测试从 packages/ai_agent 目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+"""async_database: 占位符转换, 以及线程适配在 SQLite 后端上的行为与同步接口一致"""
+
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from async_database import (MARKET_SNAPSHOT_HOURS, AsyncDatabaseManager, ThreadedAsyncStorage, _to_positional,
+                            create_async_storage)
+from database import _ROLLUP_REFRESH_SQL
+from sqlite_storage import SQLiteStorage
+from storage import SNAPSHOT_NUMERIC_COLUMNS
+
+POOL = 'wBTC-USDC'
+NUM_HOURS = 72
+
+
+@pytest.fixture
+def storage(tmp_path):
+    backend = SQLiteStorage(str(tmp_path / 'local.db'))
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=NUM_HOURS - 1)
+    rng = np.random.default_rng(0)
+    backend.insert_pool_snapshots([
+        {'pool_symbol': POOL, 'timestamp': (start + timedelta(hours=i)).isoformat(),
+         **{c: float(v) for c, v in zip(SNAPSHOT_NUMERIC_COLUMNS, rng.uniform(1, 100, len(SNAPSHOT_NUMERIC_COLUMNS)))}}
+        for i in range(NUM_HOURS)
+    ])
+    backend.insert_strategy_execution({'pool_symbol': POOL, 'timestamp': datetime.now().replace(microsecond=0),
+                                       'aave_wbtc_pool': 0.3, 'uniswap_v3_lp': 0.7})
+    return backend
+
+
+def test_to_positional_numbers_names_in_order_of_first_use():
+    sql, args = _to_positional("SELECT %(b)s, %(a)s, %(b)s WHERE x = %(c)s",
+                               {'a': 1, 'b': 2, 'c': 3, 'unused': 4})
+    assert sql == "SELECT $1, $2, $1 WHERE x = $3"
+    assert args == [2, 1, 3]
+
+
+def test_to_positional_rollup_refresh_sql():
+    params = {'pool_symbol': POOL, 'bucket': '1d', 'width': 86400, 'start': 's', 'end': 'e'}
+    sql, args = _to_positional(_ROLLUP_REFRESH_SQL, params)
+    assert '%(' not in sql
+    used = sorted({int(n) for n in re.findall(r"\$(\d+)", sql)})
+    assert used == list(range(1, len(args) + 1))
+    assert sorted(args, key=str) == sorted(params.values(), key=str)
+
+
+def test_threaded_storage_matches_sync_backend(storage):
+    async def run():
+        async_storage = ThreadedAsyncStorage(storage, max_workers=2)
+        try:
+            return (await async_storage.get_pool_snapshots(POOL, hours=NUM_HOURS + 1),
+                    await async_storage.get_database_stats(),
+                    async_storage.path)
+        finally:
+            await async_storage.close()
+
+    rows, stats, path = asyncio.run(run())
+    assert rows == storage.get_pool_snapshots(POOL, hours=NUM_HOURS + 1)
+    assert stats['snapshots_count'] == NUM_HOURS
+    assert path == storage.path
+
+
+def test_create_async_storage_uses_threads_for_sqlite(storage):
+    async def run():
+        async_storage = await create_async_storage(storage, pool_size=2)
+        await async_storage.close()
+        return async_storage
+
+    assert isinstance(asyncio.run(run()), ThreadedAsyncStorage)
+
+
+@pytest.mark.parametrize('bucket', ['1h', '1d'])
+def test_fetch_pool_data(storage, bucket):
+    async def run():
+        async with AsyncDatabaseManager(storage, pool_size=3) as db:
+            return await db.fetch_pool_data(POOL, hours=NUM_HOURS + 1, bucket=bucket)
+
+    data = asyncio.run(run())
+    raw = storage.get_pool_snapshots_columnar(POOL, hours=NUM_HOURS + 1)
+    if bucket == '1h':
+        np.testing.assert_array_equal(data['historical_data']['timestamp'], raw['timestamp'])
+    else:
+        expected = storage.get_pool_snapshots_bucketed(POOL, hours=NUM_HOURS + 1, bucket=bucket)
+        np.testing.assert_array_equal(data['historical_data']['timestamp'], expected['timestamp'])
+    np.testing.assert_array_equal(data['market_data']['timestamp'], raw['timestamp'][-MARKET_SNAPSHOT_HOURS:])
+    np.testing.assert_allclose(data['market_data']['wbtc_price'], raw['wbtc_price'][-MARKET_SNAPSHOT_HOURS:])
+    assert [e['uniswap_v3_lp'] for e in data['strategy_allocations']] == [0.7]
+
+
+def test_manager_requires_async_with(storage):
+    with pytest.raises(RuntimeError):
+        AsyncDatabaseManager(storage).get_pool_snapshots
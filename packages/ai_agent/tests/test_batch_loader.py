@@ -0,0 +1,57 @@
+"""WindowBatchLoader 产生的 batch 与逐个样本的 WeeklyStrategyDataset.__getitem__ 一致"""
+
+import numpy as np
+import pytest
+import torch
+
+from ai_strategy_system import WeeklyStrategyDataset
+from batch_loader import WindowBatchLoader
+
+
+def make_dataset():
+    rng = np.random.default_rng(0)
+    features = rng.uniform(1, 100, (400, 28)).astype(np.float32)
+    return WeeklyStrategyDataset(features, lookback_hours=24, prediction_hours=12, stride=6)
+
+
+@pytest.fixture
+def dataset():
+    return make_dataset()
+
+
+def expected_batches(dataset, indices, batch_size):
+    for start in range(0, len(indices), batch_size):
+        samples = [dataset[i] for i in indices[start:start + batch_size]]
+        yield torch.stack([x for x, _ in samples]), torch.stack([y for _, y in samples])
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+def test_batches_match_dataset(dataset, num_workers):
+    indices = list(range(3, len(dataset)))
+    with WindowBatchLoader(dataset, indices, batch_size=8, num_workers=num_workers) as loader:
+        assert len(loader) == -(-len(indices) // 8)
+        batches = [(x.clone(), y.clone()) for x, y in loader]
+
+    # 期望值来自一个从未调用过 precompute_labels 的独立数据集, 标签由 __getitem__ 逐个现算,
+    # 这样才能校验 precompute_labels 与 _calculate_optimal_allocation_from_future 的结果一致
+    reference = make_dataset()
+    expected = list(expected_batches(reference, indices, 8))
+    assert reference.labels is None
+    assert len(batches) == len(expected)
+    for (x, y), (ex, ey) in zip(batches, expected):
+        torch.testing.assert_close(x, ex, rtol=0, atol=0)
+        torch.testing.assert_close(y, ey, rtol=0, atol=0)
+
+
+def test_shuffle_covers_every_sample_once(dataset):
+    torch.manual_seed(0)
+    with WindowBatchLoader(dataset, batch_size=7, shuffle=True) as loader:
+        starts = torch.cat([x[:, 0, 0].clone() for x, _ in loader])
+    first_rows = torch.from_numpy(dataset.features[np.arange(len(dataset)) * dataset.stride, 0])
+    assert sorted(starts.tolist()) == sorted(first_rows.tolist())
+
+
+def test_drop_last(dataset):
+    with WindowBatchLoader(dataset, batch_size=8, drop_last=True) as loader:
+        sizes = [len(x) for x, _ in loader]
+    assert sizes == [8] * (len(dataset) // 8)
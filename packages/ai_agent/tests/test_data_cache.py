@@ -0,0 +1,179 @@
+"""TTLCache: 过期、LRU 淘汰、失效、single-flight 与 stale-while-revalidate"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from data_cache import TTLCache, estimate_size
+
+
+def test_get_put_and_expiry():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=0.05)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_by_size():
+    item = np.zeros(1000)
+    cache = TTLCache(max_bytes=int(estimate_size(item) * 2.5), ttl_seconds=60)
+    cache.put('a', item)
+    cache.put('b', item)
+    cache.get('a')
+    cache.put('c', item)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+    cache.put('huge', np.zeros(10000))
+    assert cache.get('huge') is None
+
+
+def test_invalidate_by_predicate():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+    for key in [('p1', 24), ('p1', 720), ('p2', 24)]:
+        cache.put(key, key)
+    assert cache.invalidate(lambda key: key[0] == 'p1') == 2
+    assert cache.get(('p1', 24)) is None
+    assert cache.get(('p2', 24)) == ('p2', 24)
+    assert cache.clear() == 1
+    assert cache.stats()['bytes'] == 0
+
+
+@pytest.mark.parametrize('drop', [
+    lambda cache: cache.invalidate(lambda key: key == 'k'),
+    lambda cache: cache.clear(),
+])
+def test_load_in_flight_during_invalidation_is_not_cached(drop):
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_old_load():
+        started.set()
+        release.wait(5)
+        return 'old'
+
+    results = []
+    loader = threading.Thread(target=lambda: results.append(cache.get_or_compute('k', slow_old_load)))
+    loader.start()
+    assert started.wait(5)
+    drop(cache)
+    release.set()
+    loader.join(5)
+
+    # 失效前开始的计算仍把结果交给它的调用方, 但不会写回缓存
+    assert results == ['old']
+    assert cache.get('k') is None
+    assert cache.get_or_compute('k', lambda: 'new') == 'new'
+    assert cache.stats()['inflight'] == 0
+
+
+def test_concurrent_misses_compute_once():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+    calls, gate = [], threading.Event()
+
+    def load():
+        calls.append(1)
+        gate.wait(5)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', load))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == ['value'] * 10
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 9
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+    gate = threading.Event()
+
+    def failing_load():
+        gate.wait(5)
+        raise RuntimeError('db down')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_compute('k', failing_load)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert errors == ['db down'] * 3
+    assert cache.get_or_compute('k', lambda: 'ok') == 'ok'
+
+
+def test_stale_entry_served_while_refreshing_in_background():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=0.05, stale_seconds=60)
+    cache.put('k', 'old')
+    time.sleep(0.06)
+    refreshed = threading.Event()
+
+    def load():
+        refreshed.set()
+        return 'new'
+
+    assert cache.get_or_compute('k', load) == 'old'
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if cache.get('k') == 'new':
+            break
+        time.sleep(0.01)
+    assert cache.get('k') == 'new'
+
+
+def test_force_does_not_join_an_older_computation():
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_old_load():
+        started.set()
+        release.wait(5)
+        return 'old'
+
+    older = threading.Thread(target=cache.get_or_compute, args=('k', slow_old_load))
+    older.start()
+    assert started.wait(5)
+
+    assert cache.get_or_compute('k', lambda: 'new', force=True) == 'new'
+    release.set()
+    older.join(5)
+    # 较早开始的计算完成得更晚, 也不能覆盖 force 写入的结果
+    assert cache.get('k') == 'new'
+
+
+def test_waiters_are_released_when_storing_fails(monkeypatch):
+    import data_cache
+
+    cache = TTLCache(max_bytes=1 << 20, ttl_seconds=60)
+
+    def broken_estimate(value):
+        raise MemoryError('cannot size value')
+
+    monkeypatch.setattr(data_cache, 'estimate_size', broken_estimate)
+    with pytest.raises(MemoryError):
+        cache.get_or_compute('k', lambda: 'value')
+    assert cache.stats()['inflight'] == 0
+
+    monkeypatch.undo()
+    assert cache.get_or_compute('k', lambda: 'value') == 'value'
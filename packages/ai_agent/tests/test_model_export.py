@@ -0,0 +1,120 @@
+"""导出格式 (TorchScript / int8 / ONNX / mmap) 与 eager torch fp32 模型的输出一致性"""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+
+import model_export
+from ai_strategy_system import WeeklyStrategyLSTM
+from feature_scaler import ArrayScaler
+
+LOOKBACK_HOURS = 12
+INPUT_DIM = 28
+
+# 各格式与 eager fp32 输出的最大允许绝对误差
+TORCHSCRIPT_TOLERANCE = 1e-6
+ONNX_TOLERANCE = 1e-4
+INT8_TOLERANCE = 0.02
+MMAP_TOLERANCE = 0.0
+
+
+@pytest.fixture
+def fp32_model():
+    torch.manual_seed(0)
+    model = WeeklyStrategyLSTM(input_dim=INPUT_DIM)
+    model.eval()
+    return model
+
+
+@pytest.fixture
+def windows():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((16, LOOKBACK_HOURS, INPUT_DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def package(fp32_model, monkeypatch, tmp_path):
+    """用随机初始化的模型代替训练得到的 fp32 模型包"""
+    scaler = ArrayScaler(np.zeros(INPUT_DIM), np.ones(INPUT_DIM))
+    config = {'lookback_hours': LOOKBACK_HOURS}
+    monkeypatch.setattr(model_export, 'load_fp32_package', lambda path: (fp32_model, scaler, config))
+    return str(tmp_path / 'model_package_test.pth')
+
+
+def eager(model, windows):
+    with torch.no_grad():
+        return model(torch.from_numpy(windows)).numpy()
+
+
+def test_torchscript_trace_matches_eager(fp32_model, windows):
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(fp32_model, torch.from_numpy(windows[:1])).eval())
+    np.testing.assert_allclose(eager(traced, windows), eager(fp32_model, windows), rtol=0, atol=TORCHSCRIPT_TOLERANCE)
+
+
+def test_int8_torchscript_matches_eager(package, fp32_model, windows, tmp_path):
+    output_path = str(tmp_path / 'model_package_test.int8.pt')
+    report = model_export.export_int8_torchscript(package, output_path, windows, tolerance=INT8_TOLERANCE)
+    assert report['passed']
+
+    extra_files = {'scaler.json': '', 'config.json': ''}
+    loaded = torch.jit.load(output_path, map_location='cpu', _extra_files=extra_files)
+    np.testing.assert_allclose(eager(loaded, windows), eager(fp32_model, windows), rtol=0, atol=INT8_TOLERANCE)
+    assert extra_files['scaler.json'] and extra_files['config.json']
+
+
+def test_onnx_matches_eager(package, fp32_model, windows, tmp_path):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx_predictor import OnnxStrategyPredictor
+
+    output_path = str(tmp_path / 'model_package_test.onnx')
+    report = model_export.export_onnx(package, output_path, windows, tolerance=ONNX_TOLERANCE)
+    assert report['passed']
+
+    predictor = OnnxStrategyPredictor(output_path)
+    np.testing.assert_allclose(predictor.run(windows), eager(fp32_model, windows), rtol=0, atol=ONNX_TOLERANCE)
+    # 导出时用 batch=1 的样例, 动态 batch 维必须保留
+    assert predictor.run(windows[:3]).shape == (3, 4)
+
+
+def test_mmap_package_matches_eager(package, fp32_model, windows, tmp_path):
+    from model_package import load_model_package
+
+    output_path = str(tmp_path / 'model_package_test.mmap')
+    model_export.export_mmap_package(package, output_path, windows, tolerance=MMAP_TOLERANCE)
+
+    mapped_model, _, config = load_model_package(output_path)
+    np.testing.assert_array_equal(eager(mapped_model, windows), eager(fp32_model, windows))
+    assert config['lookback_hours'] == LOOKBACK_HOURS
+
+
+def test_export_refuses_when_out_of_tolerance(package, windows, tmp_path):
+    output_path = tmp_path / 'model_package_test.int8.pt'
+    with pytest.raises(ValueError, match='Refusing to export'):
+        model_export.export_int8_torchscript(package, str(output_path), windows, tolerance=0.0)
+    assert not output_path.exists()
+
+
+def test_failed_onnx_check_keeps_previous_export(package, windows, tmp_path, monkeypatch):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx_predictor import ONNX_METADATA_SUFFIX
+
+    output_path = str(tmp_path / 'model_package_test.onnx')
+    model_export.export_onnx(package, output_path, windows, tolerance=ONNX_TOLERANCE)
+    with open(output_path, 'rb') as f:
+        previous = f.read()
+
+    real_check = model_export.check_accuracy
+    monkeypatch.setattr(model_export, 'check_accuracy',
+                        lambda *args, **kwargs: {**real_check(*args, **kwargs), 'passed': False})
+    with pytest.raises(ValueError, match='Refusing to export'):
+        model_export.export_onnx(package, output_path, windows, tolerance=ONNX_TOLERANCE)
+
+    with open(output_path, 'rb') as f:
+        assert f.read() == previous
+    assert os.path.exists(output_path + ONNX_METADATA_SUFFIX)
+    assert sorted(os.listdir(tmp_path)) == ['model_package_test.onnx', 'model_package_test.onnx.json']
@@ -0,0 +1,130 @@
+"""SQLiteStorage: 快照读写、降采样、策略记录和指标缓存"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from database import DatabaseManager, create_storage_backend
+from sqlite_storage import SQLiteStorage
+from storage import BUCKETED_COLUMNS, SNAPSHOT_NUMERIC_COLUMNS
+
+POOL = 'wBTC-USDC'
+NUM_HOURS = 96
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / 'local.db'))
+
+
+@pytest.fixture
+def snapshots():
+    """最近 NUM_HOURS 小时的逐小时快照, 时间戳与 PostgreSQL TIMESTAMP 列一样不带时区"""
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=NUM_HOURS - 1)
+    rng = np.random.default_rng(0)
+    return [
+        {'pool_symbol': POOL, 'timestamp': (start + timedelta(hours=i)).isoformat(),
+         **{c: float(v) for c, v in zip(SNAPSHOT_NUMERIC_COLUMNS, rng.uniform(1, 100, len(SNAPSHOT_NUMERIC_COLUMNS)))}}
+        for i in range(NUM_HOURS)
+    ]
+
+
+def test_create_storage_backend_from_sqlite_url(tmp_path):
+    path = str(tmp_path / 'from_url.db')
+    backend = create_storage_backend(f"sqlite:///{path}")
+    assert isinstance(backend, SQLiteStorage) and backend.path == path
+    assert DatabaseManager(backend).get_database_stats()['snapshots_count'] == 0
+
+
+def test_create_storage_backend_requires_explicit_local_path(tmp_path, monkeypatch):
+    import database
+
+    monkeypatch.setattr(database, 'LOCAL_DATABASE_PATH', None)
+    with pytest.raises(ValueError):
+        create_storage_backend('')
+
+    path = str(tmp_path / 'opt_in.db')
+    monkeypatch.setattr(database, 'LOCAL_DATABASE_PATH', path)
+    backend = create_storage_backend('')
+    assert isinstance(backend, SQLiteStorage) and backend.path == path
+
+
+def test_snapshot_round_trip(storage, snapshots):
+    assert storage.insert_pool_snapshots(snapshots) == NUM_HOURS
+
+    rows = storage.get_pool_snapshots(POOL, hours=NUM_HOURS + 1)
+    assert [r['timestamp'] for r in rows] == [s['timestamp'] for s in snapshots]
+    assert rows[0]['tvl_usd'] == pytest.approx(snapshots[0]['tvl_usd'])
+
+    columns = storage.get_pool_snapshots_columnar(POOL, hours=NUM_HOURS + 1, fetch_size=7)
+    assert columns['timestamp'].dtype == np.int64 and len(columns['timestamp']) == NUM_HOURS
+    assert np.all(np.diff(columns['timestamp']) == 3600)
+    np.testing.assert_allclose(columns['wbtc_price'], [s['wbtc_price'] for s in snapshots])
+
+    latest = storage.get_pool_snapshots_columnar(POOL, hours=NUM_HOURS + 1, limit=5, latest=True)
+    np.testing.assert_array_equal(latest['timestamp'], columns['timestamp'][-5:])
+
+
+def test_hours_window_and_unknown_pool(storage, snapshots):
+    storage.insert_pool_snapshots(snapshots)
+    assert len(storage.get_pool_snapshots(POOL, hours=10)) in (10, 11)
+    assert storage.get_pool_snapshots('unknown', hours=NUM_HOURS) == []
+    assert len(storage.get_pool_snapshots_columnar('unknown')['timestamp']) == 0
+
+
+def test_upsert_keeps_last_value(storage, snapshots):
+    storage.insert_pool_snapshots(snapshots)
+    updated = {**snapshots[0], 'wbtc_price': -1.0}
+    assert storage.bulk_load_pool_snapshots(iter([snapshots[1], updated, {**updated, 'wbtc_price': -2.0}])) == 2
+
+    rows = storage.get_pool_snapshots(POOL, hours=NUM_HOURS + 1)
+    assert len(rows) == NUM_HOURS
+    assert rows[0]['wbtc_price'] == -2.0
+    assert storage.get_database_stats()['snapshots_count'] == NUM_HOURS
+
+
+def test_bucketed_matches_numpy(storage, snapshots):
+    storage.insert_pool_snapshots(snapshots)
+    raw = storage.get_pool_snapshots_columnar(POOL, hours=NUM_HOURS + 1)
+    buckets = storage.get_pool_snapshots_bucketed(POOL, hours=NUM_HOURS + 1, bucket='1d')
+    assert set(buckets) == set(BUCKETED_COLUMNS)
+
+    starts = raw['timestamp'] // 86400 * 86400
+    np.testing.assert_array_equal(buckets['timestamp'], np.unique(starts))
+    for i, start in enumerate(buckets['timestamp']):
+        rows = starts == start
+        prices = raw['wbtc_price'][rows]
+        assert buckets['samples'][i] == rows.sum()
+        assert buckets['wbtc_price'][i] == pytest.approx(prices[-1])
+        assert buckets['wbtc_price_open'][i] == pytest.approx(prices[0])
+        assert buckets['wbtc_price_high'][i] == pytest.approx(prices.max())
+        assert buckets['wbtc_price_low'][i] == pytest.approx(prices.min())
+        assert buckets['volume_usd'][i] == pytest.approx(raw['volume_usd'][rows].sum())
+        assert buckets['liquidity'][i] == pytest.approx(raw['liquidity'][rows].mean())
+
+    with pytest.raises(ValueError):
+        storage.get_pool_snapshots_bucketed(POOL, bucket='5m')
+
+
+def test_strategy_executions(storage):
+    execution = {'pool_symbol': POOL, 'timestamp': datetime.now().replace(microsecond=0),
+                 'aave_wbtc_pool': 0.4, 'uniswap_v3_lp': 0.6, 'tx_hash': '0xabc',
+                 'safety_bounds': {'price_lower': 0.98}, 'additional_info': {'model': 'int8'}}
+    record_id = storage.insert_strategy_execution(execution)
+    assert record_id is not None
+
+    rows = storage.get_strategy_executions(POOL, hours=1)
+    assert len(rows) == 1
+    assert rows[0]['id'] == record_id
+    assert rows[0]['timestamp'] == execution['timestamp']
+    assert rows[0]['safety_bounds'] == {'price_lower': 0.98}
+    assert storage.get_database_stats()['strategies_count'] == 1
+
+
+def test_cached_metrics(storage):
+    assert storage.get_cached_metrics(POOL, '30D') is None
+    storage.cache_performance_metrics(POOL, '30D', {'sharpe': 1.5})
+    storage.cache_performance_metrics(POOL, '30D', {'sharpe': 2.0})
+    assert storage.get_cached_metrics(POOL, '30D')['metrics'] == {'sharpe': 2.0}
+    assert storage.get_cached_metrics(POOL, '7D') is None
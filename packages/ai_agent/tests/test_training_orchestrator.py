@@ -0,0 +1,28 @@
+"""RestartingProcessPool: 一个工作进程崩溃时其余任务照常完成"""
+
+import os
+
+from training_orchestrator import RestartingProcessPool
+
+
+def square_or_crash(n):
+    if n == 3:
+        os._exit(1)
+    if n == 5:
+        raise ValueError('bad input')
+    return n * n
+
+
+def test_crashed_worker_only_fails_its_own_task():
+    finished = []
+    with RestartingProcessPool(max_workers=2) as pool:
+        results, errors = pool.run(square_or_crash, {n: (n,) for n in range(8)},
+                                   on_result=lambda key, result: finished.append(key))
+        # 崩溃后进程池已重建, 可以继续使用
+        assert pool.run(square_or_crash, {'again': (4,)}) == ({'again': 16}, {})
+
+    assert results == {n: n * n for n in range(8) if n not in (3, 5)}
+    assert set(errors) == {3, 5}
+    assert errors[3].startswith('BrokenProcessPool')
+    assert errors[5] == 'ValueError: bad input'
+    assert sorted(finished) == sorted(results)
@@ -0,0 +1,150 @@
+# 多池子并行训练: 每个池子在独立的工作进程中训练, 进程间互不影响,
+# 单个池子失败 (如 loss 变为 NaN) 只记录为失败, 其余池子照常完成。
+# 工作进程异常退出 (如被 OOM killer 杀掉) 会让整个进程池失效, 由 RestartingProcessPool 重建进程池并重跑未完成的池子
+
+import logging
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing as mp
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RestartingProcessPool:
+    """
+    ProcessPoolExecutor 的包装, 一个任务的工作进程崩溃不会连累其他任务。
+
+    任何一个工作进程异常退出, 进程池中所有未完成的任务都会抛 BrokenProcessPool, 而且无法知道是哪个任务导致的。
+    run() 遇到这种情况时重建进程池, 再逐个重跑没有拿到结果的任务: 其他任务照常完成,
+    单独运行仍然崩溃的任务才记为失败。
+    """
+
+    def __init__(self, **executor_kwargs):
+        self._executor_kwargs = executor_kwargs
+        self._executor = ProcessPoolExecutor(**executor_kwargs)
+
+    def _restart(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = ProcessPoolExecutor(**self._executor_kwargs)
+
+    def _run_batch(self, fn: Callable, jobs: Dict[Hashable, tuple], on_result: Optional[Callable]):
+        futures, crashed = {}, []
+        for key, args in jobs.items():
+            try:
+                futures[self._executor.submit(fn, *args)] = key
+            except BrokenProcessPool:
+                crashed.append(key)
+        results, errors = {}, {}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except BrokenProcessPool:
+                crashed.append(key)
+                continue
+            except Exception as e:
+                errors[key] = f"{type(e).__name__}: {e}"
+                continue
+            if on_result:
+                on_result(key, results[key])
+        return results, errors, [key for key in jobs if key in crashed]
+
+    def run(self, fn: Callable, jobs: Dict[Hashable, tuple],
+            on_result: Optional[Callable[[Hashable, Any], None]] = None) -> Tuple[Dict[Hashable, Any], Dict[Hashable, str]]:
+        """
+        并行执行 {key: fn 的参数}, 返回 ({key: 结果}, {key: 错误信息})。
+        fn 的结果按完成顺序交给 on_result(key, result); fn 抛出的异常和崩溃都记在错误信息中, 不向上抛出。
+        """
+        results, errors, crashed = self._run_batch(fn, jobs, on_result)
+        if crashed:
+            logger.error(f"  Worker process crashed, retrying {len(crashed)} unfinished task(s) one at a time: {crashed}")
+            self._restart()
+            for key in crashed:
+                retry_results, retry_errors, still_crashed = self._run_batch(fn, {key: jobs[key]}, on_result)
+                results.update(retry_results)
+                errors.update(retry_errors)
+                if still_crashed:
+                    logger.error(f"  {key} crashed its worker process again, marking it failed")
+                    errors[key] = "BrokenProcessPool: worker process crashed"
+                    self._restart()
+        return results, errors
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def _init_worker(num_threads: int):
+    """工作进程初始化: 限制 torch 线程数, 避免多个进程争抢 CPU"""
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已经有并行任务运行过时不能再设置, 忽略即可
+        pass
+
+
+def _train_pool_worker(pool_symbol: str, pool_data: Dict, device: Optional[str], train_options: Dict) -> Dict:
+    """在工作进程中训练单个池子, 任何异常都转换为失败结果而不是向上抛出"""
+    from ai_strategy_system import train_pool
+
+    start_time = datetime.now()
+    try:
+        return train_pool(pool_symbol, pool_data, device=device, **train_options)
+    except Exception as e:
+        logger.error(f"  Training failed for {pool_symbol}: {e}")
+        return {
+            'pool_symbol': pool_symbol,
+            'status': 'failed',
+            'error': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+            'duration_seconds': (datetime.now() - start_time).total_seconds(),
+        }
+
+
+def train_pools(pools_data: Dict[str, Dict], max_workers: Optional[int] = None,
+                threads_per_worker: Optional[int] = None, device: Optional[str] = None,
+                **train_options) -> List[Dict]:
+    """
+    并行训练所有池子, 返回按输入顺序排列的每个池子的结果。
+
+    Args:
+        pools_data: {pool_symbol: pool_data}, 与 complete_defi_data.json 中的 pools 结构一致
+        max_workers: 工作进程数, 默认 min(池子数, CPU 核数)
+        threads_per_worker: 每个进程的 torch 线程数, 默认按 CPU 核数平分
+        device: 训练设备, 默认有 GPU 时用 cuda
+        train_options: 透传给 ai_strategy_system.train_pool 的参数 (如 resume / checkpoint_every)
+    """
+    if not pools_data:
+        return []
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers or cpu_count, len(pools_data)))
+    threads_per_worker = threads_per_worker or max(1, cpu_count // max_workers)
+    logger.info(f"[TRAIN] {len(pools_data)} pools, {max_workers} worker processes x {threads_per_worker} threads")
+
+    # torch 与 fork 不兼容 (线程池/CUDA 状态会被复制), 统一使用 spawn
+    def log_result(pool_symbol, result):
+        logger.info(f"[TRAIN] {pool_symbol} finished with status '{result['status']}'")
+
+    jobs = {pool_symbol: (pool_symbol, pool_data, device, train_options) for pool_symbol, pool_data in pools_data.items()}
+    with RestartingProcessPool(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                               initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        results, errors = pool.run(_train_pool_worker, jobs, on_result=log_result)
+    for pool_symbol, error in errors.items():
+        # 工作进程单独运行该池子时仍然异常退出 (如被 OOM killer 杀掉)
+        results[pool_symbol] = {'pool_symbol': pool_symbol, 'status': 'failed', 'error': error}
+        log_result(pool_symbol, results[pool_symbol])
+
+    return [results[pool_symbol] for pool_symbol in pools_data]
@@ -0,0 +1,91 @@
+# 训练吞吐量统计: 每个 epoch 的阶段耗时 (等数据 / 前向 / 反向 / 优化器)、样本吞吐量和峰值内存,
+# 以及可选的 torch.profiler 采样。报告写在模型包旁边 (models/training_profile_<pool>.json/.csv),
+# 便于对比不同版本的训练速度, 及时发现性能回退。
+
+import csv
+import logging
+import os
+import resource
+import sys
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TIMING_COLUMNS = ['epoch', 'samples', 'batches', 'epoch_seconds', 'data_wait_seconds', 'forward_seconds',
+                  'backward_seconds', 'optimizer_seconds', 'compute_seconds', 'validate_seconds',
+                  'samples_per_second', 'peak_rss_mb', 'train_loss', 'val_loss']
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存 (MB)。Linux 上 ru_maxrss 单位是 KB, macOS 上是字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StepProfiler:
+    """
+    用 torch.profiler 记录最开始的若干个训练 step, 结束后导出 chrome trace 并保留算子耗时汇总表。
+    每个 step 结束时调用 step(); 记录够 num_steps 个 step 后自动停止, 之后的调用为空操作。
+    """
+
+    def __init__(self, num_steps: int, trace_path: Optional[str] = None, use_cuda: bool = False):
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if use_cuda else [])
+        self.num_steps = num_steps
+        self.trace_path = trace_path
+        self.steps = 0
+        self.summary: Optional[str] = None
+        self._profile = profile(activities=activities, record_shapes=True)
+        self._profile.__enter__()
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def step(self):
+        if not self.active:
+            return
+        self.steps += 1
+        if self.steps >= self.num_steps:
+            self.stop()
+
+    def stop(self):
+        if not self.active:
+            return
+        profile, self._profile = self._profile, None
+        profile.__exit__(None, None, None)
+        self.summary = profile.key_averages().table(sort_by='self_cpu_time_total', row_limit=20)
+        if self.trace_path:
+            profile.export_chrome_trace(self.trace_path)
+            logger.info(f"  Profiler trace ({self.steps} steps) saved to {self.trace_path}")
+
+
+def write_timing_report(epoch_timings: List[Dict], json_path: str, csv_path: str, metadata: Dict):
+    """写出每个 epoch 的耗时明细 (CSV) 和带汇总统计的完整报告 (JSON)"""
+    from ai_strategy_system import atomic_json_dump
+
+    if epoch_timings:
+        # 训练中途失败时最后一个 epoch 可能只记录了部分字段 (如还没有 validate_seconds)
+        total_samples = sum(t.get('samples', 0) for t in epoch_timings)
+        total_seconds = sum(t.get('epoch_seconds', 0.0) for t in epoch_timings)
+        summary = {
+            'epochs': len(epoch_timings),
+            'samples_per_second': total_samples / total_seconds if total_seconds > 0 else 0.0,
+            'peak_rss_mb': max(t.get('peak_rss_mb', 0.0) for t in epoch_timings),
+            **{f'total_{key}': sum(t.get(key, 0.0) for t in epoch_timings)
+               for key in ('epoch_seconds', 'data_wait_seconds', 'forward_seconds', 'backward_seconds',
+                           'optimizer_seconds', 'validate_seconds')},
+        }
+    else:
+        summary = {'epochs': 0}
+
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TIMING_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(epoch_timings)
+    os.replace(tmp_path, csv_path)
+    atomic_json_dump({**metadata, 'summary': summary, 'epochs': epoch_timings}, json_path)
+    logger.info(f"  Training profile saved to {json_path} "
+                f"({summary.get('samples_per_second', 0):.1f} samples/s, peak RSS {summary.get('peak_rss_mb', 0):.0f} MB)")
@@ -0,0 +1,305 @@
+# Walk-forward 评估: 按时间顺序切分若干折 (扩展窗口训练集 + 禁运间隔 + 样本外评估区间),
+# 各折在独立进程中并行训练, 共享同一份预先计算好的原始特征矩阵。
+# 每折报告样本外损失以及用模型配置回测得到的净值 (NAV)。
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import multiprocessing as mp
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from feature_scaler import ArrayScaler
+from features import create_feature_sequences_from_snapshots
+from shared_features import SharedFeatureMatrix
+from training_orchestrator import RestartingProcessPool
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARAMS = {
+    'lookback_hours': 72,
+    'prediction_hours': 24,
+    'stride': 12,
+    'epochs': 100,
+    'patience': 15,
+    'batch_size': 32,
+    'hidden_dim': 128,
+    'num_layers': 2,
+    'num_heads': 8,
+    'lr': 0.0001,
+}
+
+# 工作进程内的全局状态, 由 init_worker 填充
+_WORKER: Dict = {}
+
+
+def build_feature_matrix(pool_data: Dict) -> Tuple[np.ndarray, List[str]]:
+    """把池子快照转换为 (T, 28) 的原始 (未标准化) 特征矩阵和对应的时间戳"""
+    feature_sequences = create_feature_sequences_from_snapshots(
+        pool_data['snapshots'],
+        pool_data['aave_current_reserves'],
+        pool_data['gas_current']
+    )
+    features = np.array([f['feature_vector'] for f in feature_sequences], dtype=np.float32)
+    timestamps = [f['timestamp'] for f in feature_sequences]
+    return features, timestamps
+
+
+def fit_scaler(features: np.ndarray) -> ArrayScaler:
+    """与 sklearn StandardScaler 相同的拟合规则 (总体标准差, 零方差列的 scale 取 1)"""
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    return ArrayScaler(mean, scale)
+
+
+def effective_embargo_hours(embargo_hours: int, lookback_hours: int) -> int:
+    """实际使用的禁运间隔: 至少一个输入序列长度, 评估行不会出现在任何训练序列中"""
+    return max(embargo_hours, lookback_hours)
+
+
+def make_walk_forward_folds(num_rows: int, n_folds: int, lookback_hours: int, prediction_hours: int,
+                            embargo_hours: int = 24, min_train_rows: Optional[int] = None) -> List[Dict]:
+    """
+    生成扩展窗口的时间序列折:
+        fold k: 训练行 [0, eval_start - gap), 评估行 [eval_start, eval_end)
+    gap = effective_embargo_hours(embargo_hours, lookback_hours), 评估行不会出现在任何训练序列中。
+    评估区间依次向后推进且互不重叠, 训练集总是只包含评估区间之前 gap 以外的数据。
+    """
+    window = lookback_hours + prediction_hours
+    embargo_hours = effective_embargo_hours(embargo_hours, lookback_hours)
+    min_train_rows = min_train_rows or max(num_rows // 2, 2 * window + embargo_hours)
+    eval_size = (num_rows - min_train_rows) // n_folds
+    if n_folds < 1 or eval_size < window:
+        raise ValueError(f"Not enough data for {n_folds} folds: {num_rows} rows, {min_train_rows} reserved for "
+                         f"the first training window, each evaluation block needs at least {window} rows.")
+
+    folds = []
+    for k in range(n_folds):
+        eval_start = min_train_rows + k * eval_size
+        eval_end = num_rows if k == n_folds - 1 else eval_start + eval_size
+        folds.append({
+            'fold': k,
+            'train_rows': (0, eval_start - embargo_hours),
+            'eval_rows': (eval_start, eval_end),
+        })
+    return folds
+
+
+def backtest_predictions(raw_features: np.ndarray, timestamps: List[str], decision_rows: List[int],
+                         predictions: np.ndarray, end_row: int) -> Dict:
+    """
+    用模型给出的配置在 [decision_rows[0], end_row) 区间内回测净值。
+    每个决策点的配置一直持有到下一个决策点; 收益参数与 migrate_to_database 的换算方式一致。
+    """
+    from analytics_engine import StrategyAnalytics, to_epoch_seconds
+
+    rows = slice(decision_rows[0], end_row)
+    price, volume, tvl = raw_features[rows, 0], raw_features[rows, 4], raw_features[rows, 7]
+    historical_data = {
+        'timestamp': to_epoch_seconds(timestamps[rows]),
+        'wbtc_price': price.astype(np.float64),
+        'aave_wbtc_apy': raw_features[rows, 9].astype(np.float64) / 100 / (24 * 365),
+        'univ3_lp_apy': np.where(tvl > 0, np.clip(volume / np.where(tvl > 0, tvl, 1) * 0.003, 0, 0.01),
+                                 0.0).astype(np.float64),
+        'gas_cost_usd': raw_features[rows, 10].astype(np.float64) * 0.01,
+    }
+    allocations = [
+        {'timestamp': timestamps[row], 'aave_wbtc_pool': float(p[0]), 'uniswap_v3_lp': float(p[1])}
+        for row, p in zip(decision_rows, predictions)
+    ]
+    curve = StrategyAnalytics().calculate_net_value_curve(historical_data, allocations)
+    return {
+        'final_nav': float(curve['strategy_curve'][-1]),
+        'strategy_return': float(curve['strategy_final_return']),
+        'baseline_return': float(curve['baseline_final_return']),
+        'excess_return': float(curve['excess_return']),
+    }
+
+
+def train_and_evaluate(raw_features: np.ndarray, timestamps: List[str], train_rows: Tuple[int, int],
+                       eval_rows: Tuple[int, int], params: Dict, device: str = 'cpu',
+                       checkpoint_path: Optional[str] = None) -> Dict:
+    """
+    在 train_rows 上训练 (内部再按时间顺序留出一段做早停), 在 eval_rows 上做样本外评估和回测。
+    scaler 只用训练区间拟合, 评估区间的数据不会影响任何训练过程。
+
+    给定 checkpoint_path 时从该检查点继续训练到 params['epochs'] (sweep 的逐轮加预算即依赖于此),
+    否则在临时目录中从头训练。
+    """
+    import torch
+    from ai_strategy_system import (WeeklyStrategyDataset, WeeklyStrategyLSTM, WeeklyStrategyTrainer,
+                                    time_ordered_split)
+    from batch_loader import WindowBatchLoader
+
+    params = {**DEFAULT_PARAMS, **params}
+    lookback, prediction, stride = params['lookback_hours'], params['prediction_hours'], params['stride']
+    (train_start, train_end), (eval_start, eval_end) = train_rows, eval_rows
+
+    scaler = fit_scaler(raw_features[train_start:train_end])
+    train_dataset = WeeklyStrategyDataset(scaler.transform(raw_features[train_start:train_end]), lookback, prediction, stride)
+    eval_dataset = WeeklyStrategyDataset(scaler.transform(raw_features[eval_start:eval_end]), lookback, prediction, stride)
+    inner_train, inner_val = time_ordered_split(len(train_dataset), stride, lookback, prediction,
+                                                embargo_hours=params.get('embargo_hours', 24))
+    if not inner_train or not inner_val or len(eval_dataset) == 0:
+        raise ValueError(f"Segment too short: {len(inner_train)} train / {len(inner_val)} early-stopping / "
+                         f"{len(eval_dataset)} evaluation samples.")
+
+    work_dir = tempfile.mkdtemp(prefix='walk_forward_')
+    try:
+        model = WeeklyStrategyLSTM(input_dim=raw_features.shape[1], hidden_dim=params['hidden_dim'],
+                                   num_layers=params['num_layers'], num_heads=params['num_heads'])
+        trainer = WeeklyStrategyTrainer(model, device, os.path.join(work_dir, 'best_model.pth'),
+                                        checkpoint_path=checkpoint_path, lr=params['lr'])
+        best_val_loss = trainer.train(
+            WindowBatchLoader(train_dataset, inner_train, batch_size=params['batch_size'], shuffle=True),
+            WindowBatchLoader(train_dataset, inner_val, batch_size=params['batch_size'], shuffle=False),
+            epochs=params['epochs'], patience=params['patience'], resume=checkpoint_path is not None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    eval_loss, eval_metrics = trainer.validate(WindowBatchLoader(eval_dataset, batch_size=params['batch_size']))
+
+    model.eval()
+    windows = np.stack([eval_dataset.features[i * stride:i * stride + lookback] for i in range(len(eval_dataset))])
+    with torch.no_grad():
+        predictions = model(torch.from_numpy(windows).to(device)).cpu().numpy()
+    # 第 i 个窗口的决策时点是其最后一个输入小时
+    decision_rows = [eval_start + i * stride + lookback - 1 for i in range(len(eval_dataset))]
+    backtest = backtest_predictions(raw_features, timestamps, decision_rows, predictions, eval_end)
+
+    return {
+        'train_samples': len(inner_train),
+        'early_stopping_samples': len(inner_val),
+        'eval_samples': len(eval_dataset),
+        'best_val_loss': float(best_val_loss),
+        'eval_loss': float(eval_loss),
+        'eval_mae': float(eval_metrics.get('mae', float('nan'))),
+        'diverged': trainer.diverged,
+        'backtest': backtest,
+    }
+
+
+def init_worker(handle, timestamps: List[str], num_threads: int):
+    """进程池 initializer: 限制 torch 线程数, 并挂载主进程创建的共享特征矩阵 (见 worker_features)"""
+    import torch
+    torch.set_num_threads(num_threads)
+    _WORKER['matrix'] = SharedFeatureMatrix.attach(handle)
+    _WORKER['timestamps'] = timestamps
+
+
+def worker_features() -> Tuple[np.ndarray, List[str]]:
+    """在由 init_worker 初始化的工作进程中返回共享的 (原始特征矩阵, 时间戳)"""
+    if 'matrix' not in _WORKER:
+        raise RuntimeError("worker_features() called outside a process initialised with init_worker")
+    return _WORKER['matrix'].array, _WORKER['timestamps']
+
+
+def _run_fold(fold: Dict, params: Dict) -> Dict:
+    start_time = datetime.now()
+    result = {'fold': fold['fold'], 'train_rows': list(fold['train_rows']), 'eval_rows': list(fold['eval_rows'])}
+    try:
+        raw_features, timestamps = worker_features()
+        result.update(train_and_evaluate(raw_features, timestamps, fold['train_rows'], fold['eval_rows'], params))
+        result['status'] = 'ok'
+    except Exception as e:
+        logger.error(f"  Fold {fold['fold']} failed: {e}", exc_info=True)
+        result.update({'status': 'failed', 'error': f"{type(e).__name__}: {e}"})
+    result['duration_seconds'] = (datetime.now() - start_time).total_seconds()
+    return result
+
+
+def run_walk_forward(raw_features: np.ndarray, timestamps: List[str], n_folds: int = 4, embargo_hours: int = 24,
+                     params: Optional[Dict] = None, max_workers: Optional[int] = None) -> Dict:
+    """并行运行所有折, 返回包含每折结果和汇总统计的报告; 报告中的 embargo_hours 为实际使用的间隔"""
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    embargo_hours = effective_embargo_hours(embargo_hours, params['lookback_hours'])
+    params['embargo_hours'] = embargo_hours
+    folds = make_walk_forward_folds(len(raw_features), n_folds, params['lookback_hours'],
+                                    params['prediction_hours'], embargo_hours)
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers or cpu_count, len(folds)))
+    threads_per_worker = max(1, cpu_count // max_workers)
+    logger.info(f"[WALK-FORWARD] {len(folds)} folds, {max_workers} workers x {threads_per_worker} threads, "
+                f"embargo {embargo_hours}h")
+
+    def log_fold(k, r):
+        if r['status'] == 'ok':
+            logger.info(f"  Fold {k}: eval loss {r['eval_loss']:.6f}, "
+                        f"NAV {r['backtest']['final_nav']:.2f} "
+                        f"(excess {r['backtest']['excess_return']:+.2%})")
+
+    with SharedFeatureMatrix.create(raw_features) as shared:
+        # 工作进程崩溃 (如 OOM) 时重建进程池并单独重跑未完成的折, 仍然崩溃的折记为失败, 其余折照常完成
+        with RestartingProcessPool(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                                   initializer=init_worker,
+                                   initargs=(shared.handle, timestamps, threads_per_worker)) as pool:
+            by_fold, errors = pool.run(_run_fold, {fold['fold']: (fold, params) for fold in folds}, on_result=log_fold)
+    for fold in folds:
+        if fold['fold'] in errors:
+            logger.error(f"  Fold {fold['fold']} failed: {errors[fold['fold']]}")
+            by_fold[fold['fold']] = {'fold': fold['fold'], 'train_rows': list(fold['train_rows']),
+                                     'eval_rows': list(fold['eval_rows']), 'status': 'failed',
+                                     'error': errors[fold['fold']]}
+
+    results = [by_fold[fold['fold']] for fold in folds]
+    ok = [r for r in results if r['status'] == 'ok']
+    summary = {
+        'folds_ok': len(ok),
+        'folds_failed': len(results) - len(ok),
+        'mean_eval_loss': float(np.mean([r['eval_loss'] for r in ok])) if ok else None,
+        'mean_strategy_return': float(np.mean([r['backtest']['strategy_return'] for r in ok])) if ok else None,
+        'mean_excess_return': float(np.mean([r['backtest']['excess_return'] for r in ok])) if ok else None,
+    }
+    return {'generated_at': datetime.now().isoformat(), 'params': params, 'summary': summary, 'folds': results}
+
+
+def main():
+    from ai_strategy_system import atomic_json_dump
+
+    parser = argparse.ArgumentParser(description='Walk-forward 评估 WeeklyStrategyLSTM')
+    parser.add_argument('--pool', default='wBTC-USDC', help='池子符号')
+    parser.add_argument('--data-file', default=os.path.join('data', 'complete_defi_data.json'), help='数据文件')
+    parser.add_argument('--folds', type=int, default=4, help='折数')
+    parser.add_argument('--embargo-hours', type=int, default=24, help='训练集与评估区间之间的禁运间隔 (小时)')
+    parser.add_argument('--epochs', type=int, default=DEFAULT_PARAMS['epochs'], help='每折最多训练的 epoch 数')
+    parser.add_argument('--lookback-hours', type=int, default=DEFAULT_PARAMS['lookback_hours'], help='输入窗口长度')
+    parser.add_argument('--stride', type=int, default=DEFAULT_PARAMS['stride'], help='样本步长 (小时)')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数 (默认: min(折数, CPU 核数))')
+    args = parser.parse_args()
+
+    with open(args.data_file, 'r') as f:
+        pool_data = json.load(f).get('pools', {}).get(args.pool)
+    if not pool_data:
+        raise ValueError(f"No data for pool {args.pool} in {args.data_file}")
+
+    raw_features, timestamps = build_feature_matrix(pool_data)
+    report = run_walk_forward(raw_features, timestamps, n_folds=args.folds, embargo_hours=args.embargo_hours,
+                              params={'epochs': args.epochs, 'lookback_hours': args.lookback_hours,
+                                      'stride': args.stride}, max_workers=args.workers)
+
+    os.makedirs('models', exist_ok=True)
+    output_path = os.path.join('models', f"walk_forward_{args.pool.replace('/', '-')}.json")
+    atomic_json_dump(report, output_path)
+
+    print("\n" + "="*70)
+    print(f"{'fold':>4} {'train rows':>14} {'eval rows':>14} {'eval loss':>12} {'NAV':>12} {'excess':>9}")
+    for r in report['folds']:
+        if r['status'] != 'ok':
+            print(f"{r['fold']:>4} {str(tuple(r['train_rows'])):>14} {str(tuple(r['eval_rows'])):>14}  FAILED: {r['error']}")
+            continue
+        print(f"{r['fold']:>4} {str(tuple(r['train_rows'])):>14} {str(tuple(r['eval_rows'])):>14} "
+              f"{r['eval_loss']:>12.6f} {r['backtest']['final_nav']:>12.2f} {r['backtest']['excess_return']:>+9.2%}")
+    print("="*70)
+    logger.info(f"Report saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+增量推理用的标准化输入窗口环形缓冲
+
+每小时的预测只比上一次多一行新数据。ScaledWindowBuffer 保存最近 lookback_hours 行
+已经标准化的特征, 每次只对新增的行做标准化; 取窗口时返回连续内存上的视图, 不做拷贝。
+
+环形缓冲长度为 2 * lookback_hours, 每行同时写在 pos 和 pos + lookback_hours 两处,
+于是任意时刻 [pos + 1, pos + 1 + lookback_hours) 都是按时间顺序排列的完整窗口。
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from feature_scaler import ArrayScaler
+
+
+class ScaledWindowBuffer:
+    def __init__(self, scaler: ArrayScaler, lookback_hours: int, input_dim: int):
+        self.scaler = scaler
+        self.lookback_hours = lookback_hours
+        self._scaled = np.zeros((2 * lookback_hours, input_dim), dtype=np.float32)
+        self._raw = np.zeros((2 * lookback_hours, input_dim), dtype=np.float32)
+        self._pos = lookback_hours - 1
+        self._count = 0
+        self.last_timestamp: Optional[str] = None
+        self.rows_scaled = 0  # 累计标准化的行数, 用于观察缓存是否生效
+
+    def __len__(self):
+        return self._count
+
+    def reset(self):
+        self._count = 0
+        self.last_timestamp = None
+
+    def _push_rows(self, raw_rows: np.ndarray):
+        scaled_rows = self.scaler.transform(raw_rows)
+        for raw, scaled in zip(raw_rows, scaled_rows):
+            self._pos = (self._pos + 1) % self.lookback_hours
+            for offset in (self._pos, self._pos + self.lookback_hours):
+                self._raw[offset] = raw
+                self._scaled[offset] = scaled
+        self._count = min(self.lookback_hours, self._count + len(raw_rows))
+        self.rows_scaled += len(raw_rows)
+
+    def _last_raw_row(self) -> np.ndarray:
+        return self._raw[self._pos]
+
+    def sync(self, feature_sequences: List[dict]) -> int:
+        """
+        让缓冲与 feature_sequences 的最后 lookback_hours 行保持一致, 返回本次标准化的行数。
+
+        只有当缓冲中的最后一行 (按时间戳和原始特征值) 仍出现在 feature_sequences 中、
+        且其后的新行不超过一个窗口时才做增量追加; 否则 (首次调用、数据有缺口或被修订) 整窗重建。
+        历史小时快照被视为不可变, 这是增量追加与整窗重算结果一致的前提。
+        """
+        if len(feature_sequences) < self.lookback_hours:
+            raise ValueError(f"Not enough recent data. Need {self.lookback_hours} hours, but only have {len(feature_sequences)}.")
+
+        new_rows = 0
+        if self._count == self.lookback_hours and self.last_timestamp is not None:
+            while new_rows < self.lookback_hours and feature_sequences[-1 - new_rows]['timestamp'] != self.last_timestamp:
+                new_rows += 1
+            anchor = feature_sequences[-1 - new_rows] if new_rows < self.lookback_hours else None
+            if anchor is None or anchor['timestamp'] != self.last_timestamp or \
+                    not np.array_equal(np.asarray(anchor['feature_vector'], dtype=np.float32), self._last_raw_row()):
+                new_rows = self.lookback_hours
+        else:
+            new_rows = self.lookback_hours
+
+        if new_rows:
+            recent = feature_sequences[-new_rows:]
+            self._push_rows(np.array([seq['feature_vector'] for seq in recent], dtype=np.float32))
+            self.last_timestamp = recent[-1]['timestamp']
+        return new_rows
+
+    def window(self) -> np.ndarray:
+        """当前窗口 (lookback_hours, input_dim), 指向缓冲内存, 下次 sync 后内容会变化"""
+        start = self._pos + 1
+        return self._scaled[start:start + self.lookback_hours]